@@ -34,6 +34,20 @@ def create_app():
     # === DISPONIBILIZA SUPABASE ===
     app.config["supabase"] = supabase
 
+    # === CATÁLOGO EM MEMÓRIA (busca do consumidor) ===
+    app.config["CATALOGO_EM_MEMORIA"] = os.getenv("CATALOGO_EM_MEMORIA", "true").lower() == "true"
+    app.config["CATALOGO_MAX_IDADE"] = int(os.getenv("CATALOGO_MAX_IDADE", "60"))  # segundos
+
+    # === DISTÂNCIA POR ESTRADA (utils/rotas.py) ===
+    app.config["ROTAS_BACKEND"] = os.getenv("ROTAS_BACKEND", "osrm")  # osrm | haversine
+    app.config["ROTAS_OSRM_URL"] = os.getenv("ROTAS_OSRM_URL", "https://router.project-osrm.org")
+    app.config["ROTAS_TIMEOUT"] = float(os.getenv("ROTAS_TIMEOUT", "5"))  # segundos, por chamada
+    app.config["ROTAS_PRAZO"] = float(os.getenv("ROTAS_PRAZO", "2"))  # segundos, total por busca
+    app.config["ROTAS_PAUSA"] = float(os.getenv("ROTAS_PAUSA", "60"))  # segundos sem roteador após falhas
+
+    # === TELEMETRIA DE PESQUISAS (utils/telemetria.py) ===
+    app.config["TELEMETRIA_INTERVALO"] = float(os.getenv("TELEMETRIA_INTERVALO", "5"))  # segundos
+
     # === FLASK MAIL ===
     app.config["MAIL_SERVER"] = "smtp.seuservidoremail.com"
     app.config["MAIL_PORT"] = 587
@@ -0,0 +1,72 @@
+# Preenche nome_norm/marca_norm (produtos) e cidade_norm/estado_norm
+# (comerciantes) nas linhas gravadas antes de sql/campos_normalizados.sql.
+#
+# Grava só as colunas *_norm das linhas que precisam, e só se os campos de
+# origem não mudaram desde a leitura: uma edição feita durante o backfill
+# não é desfeita e o catálogo em memória só relê as linhas tocadas.
+#
+#   python backfill_normalizados.py
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from app import app
+from utils.normalizacao import (
+    CAMPOS_NORM_PRODUTO,
+    CAMPOS_NORM_COMERCIANTE,
+    campos_normalizados,
+)
+
+TAMANHO_PAGINA = 1000
+ATUALIZACOES_PARALELAS = 8
+
+
+def _atualizar(supabase, tabela, linha, norm, campos):
+    consulta = supabase.table(tabela).update(norm).eq("id", linha["id"])
+    for campo in campos:
+        # mesmo texto de origem da leitura; se mudou, quem editou já gravou o *_norm
+        if linha.get(campo) is None:
+            consulta = consulta.is_(campo, "null")
+        else:
+            consulta = consulta.eq(campo, linha[campo])
+    return len(consulta.execute().data or [])
+
+
+def backfill(supabase, tabela, campos):
+    colunas = ["id", *campos, *(f"{campo}_norm" for campo in campos)]
+    pendentes = []
+    inicio = 0
+    while True:
+        pagina = (
+            supabase.table(tabela)
+            .select(", ".join(colunas))
+            .order("id", desc=False)
+            .range(inicio, inicio + TAMANHO_PAGINA - 1)
+            .execute()
+            .data
+            or []
+        )
+        for linha in pagina:
+            norm = campos_normalizados(linha, campos)
+            if any(linha.get(k) != v for k, v in norm.items()):
+                pendentes.append((linha, norm))
+        if len(pagina) < TAMANHO_PAGINA:
+            break
+        inicio += TAMANHO_PAGINA
+
+    # update só dos *_norm, linha a linha (em paralelo): upsert exigiria a linha completa
+    with ThreadPoolExecutor(max_workers=ATUALIZACOES_PARALELAS) as executor:
+        atualizadas = sum(executor.map(lambda par: _atualizar(supabase, tabela, *par, campos), pendentes))
+
+    print(f"{tabela}: {atualizadas} linha(s) atualizada(s), {len(pendentes) - atualizadas} alterada(s) durante o backfill")
+    return atualizadas
+
+
+if __name__ == "__main__":
+    with app.app_context():
+        supabase = app.config["supabase"]
+        try:
+            backfill(supabase, "comerciantes", CAMPOS_NORM_COMERCIANTE)
+            backfill(supabase, "produtos", CAMPOS_NORM_PRODUTO)
+        except Exception as e:
+            print("❌ ERRO NO BACKFILL:", e)
+            sys.exit(1)
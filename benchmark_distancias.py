@@ -0,0 +1,200 @@
+# Duas medidas:
+#
+# - o cálculo de distância/custo por comerciante com reparo de coordenada
+#   (laço escalar, como era feito antes da versão em lote, contra
+#   melhor_distancia_lote), o que usam calcular_distancias e a cesta;
+# - a janela da ordem "custo" que a busca no snapshot de fato percorre
+#   (ColunasCatalogo.janela, com o vetor de distâncias por célula de origem
+#   e o refino pela distância exata), contra ordenar todos os produtos por
+#   chave_ordenacao, com a célula ainda fria e já guardada.
+#
+#   python benchmark_distancias.py [qtd_comerciantes] [repeticoes]
+import random
+import sys
+import time
+
+import numpy as np
+
+from utils.distancias import (
+    try_float,
+    distancia_haversine,
+    custo_deslocamento,
+    coordenadas_em_array,
+    melhor_distancia_lote,
+    custo_deslocamento_lote,
+    LIMITE_ABSURDO_KM,
+)
+from utils.busca_produtos import chave_ordenacao
+from utils.colunas_catalogo import ColunasCatalogo
+from utils.indice_espacial import coordenadas_validas
+
+PRODUTOS_POR_COMERCIANTE = 10
+JANELA = 50  # itens de uma página da busca
+
+
+def gerar_comerciantes(qtd, semente=42):
+    """Coordenadas em torno de SP, com uma parte trocada/invertida/ausente como na base real."""
+    rnd = random.Random(semente)
+    comerciantes = []
+    for i in range(qtd):
+        lat = -23.55 + rnd.uniform(-0.5, 0.5)
+        lon = -46.63 + rnd.uniform(-0.5, 0.5)
+        sorteio = rnd.random()
+        if sorteio < 0.05:
+            lat, lon = lon, lat
+        elif sorteio < 0.08:
+            lat = -lat
+        elif sorteio < 0.10:
+            lat, lon = None, None
+        elif sorteio < 0.12:
+            lat, lon = str(lat).replace(".", ","), str(lon).replace(".", ",")
+        comerciantes.append({"id": i, "latitude": lat, "longitude": lon})
+    return comerciantes
+
+
+def melhor_distancia_user_comerciante(lat_user, lon_user, raw_lat, raw_lon):
+    """
+    Referência escalar de melhor_distancia_lote: (lat, lon, motivo) da
+    interpretação mais plausível entre (orig, swap, sinais invertidos), ou
+    (None, None, motivo) se nenhuma servir.
+    """
+    lat_c = try_float(raw_lat)
+    lon_c = try_float(raw_lon)
+
+    if lat_c is None and lon_c is None:
+        return None, None, "missing"
+
+    combos = [
+        (lat_c, lon_c, "orig"),
+        (lon_c, lat_c, "swap"),
+        (-lat_c if lat_c is not None else None, lon_c, "neg_lat"),
+        (lat_c, -lon_c if lon_c is not None else None, "neg_lon"),
+        (-lat_c if lat_c is not None else None, -lon_c if lon_c is not None else None, "neg_both"),
+    ]
+
+    combos_validos = [
+        (lat_try, lon_try, tag)
+        for lat_try, lon_try, tag in combos
+        if lat_try is not None and lon_try is not None and -90 <= lat_try <= 90 and -180 <= lon_try <= 180
+    ]
+    if not combos_validos:
+        return None, None, "invalid_range"
+
+    melhor = None
+    melhor_tag = None
+    menor_dist = None
+    for lat_try, lon_try, tag in combos_validos:
+        d = distancia_haversine(lat_user, lon_user, lat_try, lon_try)
+        if menor_dist is None or d < menor_dist:
+            menor_dist = d
+            melhor = (lat_try, lon_try)
+            melhor_tag = tag
+
+    if menor_dist > LIMITE_ABSURDO_KM:
+        return None, None, "absurdo"
+    return melhor[0], melhor[1], melhor_tag
+
+
+def laco_escalar(lat_user, lon_user, comerciantes):
+    resultado = []
+    for c in comerciantes:
+        dist = None
+        custo = 0.0
+        if c.get("latitude") or c.get("longitude"):
+            lat_corr, lon_corr, _ = melhor_distancia_user_comerciante(
+                lat_user, lon_user, c.get("latitude"), c.get("longitude")
+            )
+            if lat_corr is not None and lon_corr is not None:
+                dist = distancia_haversine(lat_user, lon_user, lat_corr, lon_corr)
+                custo = custo_deslocamento(dist)
+        resultado.append((dist, custo))
+    return resultado
+
+
+def lote(lat_user, lon_user, comerciantes):
+    lats = coordenadas_em_array(c.get("latitude") for c in comerciantes)
+    lons = coordenadas_em_array(c.get("longitude") for c in comerciantes)
+    r = melhor_distancia_lote(lat_user, lon_user, lats, lons)
+    return r["distancia"], custo_deslocamento_lote(r["distancia"])
+
+
+def gerar_produtos(comerciantes, semente=42):
+    rnd = random.Random(semente)
+    return [
+        {"id": f"p{c['id']}-{j}", "preco": round(rnd.uniform(1, 90), 2), "comerciante_id": c["id"]}
+        for c in comerciantes
+        for j in range(PRODUTOS_POR_COMERCIANTE)
+    ]
+
+
+def montar_colunas(comerciantes, produtos):
+    colunas = ColunasCatalogo()
+    for c in comerciantes:
+        colunas.adicionar_comerciante(c["id"], dict(c, status="ativo"))
+    for p in produtos:
+        colunas.adicionar(p["id"], p)
+    return colunas
+
+
+def janela_escalar(lat_user, lon_user, comerciantes, produtos):
+    """Referência: chave_ordenacao de cada produto, ordenada, como a busca sem colunas."""
+    por_id = {c["id"]: coordenadas_validas(c) for c in comerciantes}
+    chaves = []
+    for p in produtos:
+        coords = por_id[p["comerciante_id"]]
+        distancia = distancia_haversine(lat_user, lon_user, *coords) if coords else None
+        chaves.append((chave_ordenacao("custo", p, distancia), p["id"]))
+    chaves.sort()
+    return [pid for _, pid in chaves[:JANELA]]
+
+
+def janela_colunas(colunas, lat_user, lon_user, fria):
+    if fria:
+        colunas._distancias_origem.clear()
+    return [pid for _, pid in colunas.janela("custo", JANELA, lat=lat_user, lon=lon_user)]
+
+
+def cronometrar(func, repeticoes):
+    melhor = float("inf")
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        func()
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor
+
+
+if __name__ == "__main__":
+    qtd = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    repeticoes = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    lat_user, lon_user = -23.5505, -46.6333
+    comerciantes = gerar_comerciantes(qtd)
+
+    esperado = laco_escalar(lat_user, lon_user, comerciantes)
+    t_escalar = cronometrar(lambda: laco_escalar(lat_user, lon_user, comerciantes), repeticoes)
+
+    dist, custo = lote(lat_user, lon_user, comerciantes)
+    t_lote = cronometrar(lambda: lote(lat_user, lon_user, comerciantes), repeticoes)
+
+    dist_esperada = np.array([np.nan if d is None else d for d, _ in esperado])
+    custo_esperado = np.array([c for _, c in esperado])
+    assert np.allclose(dist, dist_esperada, equal_nan=True), "distâncias divergentes"
+    assert np.allclose(custo, custo_esperado), "custos divergentes"
+
+    print(f"comerciantes: {qtd}  (melhor de {repeticoes})")
+    print(f"laço escalar: {t_escalar * 1000:8.2f} ms")
+    print(f"lote NumPy:   {t_lote * 1000:8.2f} ms")
+    print(f"ganho:        {t_escalar / t_lote:8.1f}x")
+
+    produtos = gerar_produtos(comerciantes)
+    colunas = montar_colunas(comerciantes, produtos)
+    esperado = janela_escalar(lat_user, lon_user, comerciantes, produtos)
+    assert janela_colunas(colunas, lat_user, lon_user, fria=True) == esperado, "janelas divergentes"
+    t_escalar = cronometrar(lambda: janela_escalar(lat_user, lon_user, comerciantes, produtos), repeticoes)
+    t_fria = cronometrar(lambda: janela_colunas(colunas, lat_user, lon_user, fria=True), repeticoes)
+    t_guardada = cronometrar(lambda: janela_colunas(colunas, lat_user, lon_user, fria=False), repeticoes)
+
+    print()
+    print(f"janela custo: {len(produtos)} produtos, {JANELA} itens  (melhor de {repeticoes})")
+    print(f"chave_ordenacao + sort: {t_escalar * 1000:8.2f} ms")
+    print(f"colunas, célula fria:   {t_fria * 1000:8.2f} ms  ({t_escalar / t_fria:.1f}x)")
+    print(f"colunas, célula salva:  {t_guardada * 1000:8.2f} ms  ({t_escalar / t_guardada:.1f}x)")
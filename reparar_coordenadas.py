@@ -0,0 +1,115 @@
+# Reparo único das coordenadas dos comerciantes: escolhe, para cada um, a
+# interpretação (original, trocada, sinais invertidos) mais próxima do próprio
+# município (ou da capital da UF) e grava o resultado com as originais.
+# Rode depois de sql/coordenadas_reparadas.sql.
+#
+#   python reparar_coordenadas.py            # só gera o relatório
+#   python reparar_coordenadas.py --aplicar  # grava no banco
+import os
+import sys
+from datetime import datetime, timezone
+
+from openpyxl import Workbook
+from openpyxl.styles import Font
+
+from app import app
+from utils.coordenadas import reparar_coordenadas, acao_do_reparo, campos_do_reparo
+from utils.localidades import obter_municipios, CAMINHO_MUNICIPIOS
+
+TAMANHO_PAGINA = 1000
+PASTA_RELATORIO = "static/uploads/temp"
+
+COLUNAS_RELATORIO = [
+    "id", "nome", "cidade", "estado",
+    "latitude_original", "longitude_original",
+    "latitude", "longitude",
+    "motivo", "referencia", "distancia_referencia_km", "acao",
+]
+
+
+def buscar_comerciantes(supabase):
+    linhas = []
+    inicio = 0
+    while True:
+        pagina = (
+            supabase.table("comerciantes")
+            .select("id, nome, cidade, estado, cidade_norm, estado_norm, latitude, longitude")
+            .order("id", desc=False)
+            .range(inicio, inicio + TAMANHO_PAGINA - 1)
+            .execute()
+            .data
+            or []
+        )
+        linhas.extend(pagina)
+        if len(pagina) < TAMANHO_PAGINA:
+            return linhas
+        inicio += TAMANHO_PAGINA
+
+
+def gerar_relatorio(linhas):
+    os.makedirs(PASTA_RELATORIO, exist_ok=True)
+    nome = f"relatorio_coordenadas_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+    caminho = os.path.join(PASTA_RELATORIO, nome)
+
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Coordenadas"
+    ws.append(COLUNAS_RELATORIO)
+    for cell in ws[1]:
+        cell.font = Font(bold=True)
+    for linha in linhas:
+        ws.append([linha.get(col) for col in COLUNAS_RELATORIO])
+    wb.save(caminho)
+    return caminho
+
+
+def reparar(supabase, aplicar=False):
+    comerciantes = buscar_comerciantes(supabase)
+    municipios = obter_municipios()
+    if not municipios:
+        print(f"⚠️ {CAMINHO_MUNICIPIOS} não encontrado: usando as capitais das UFs como referência")
+
+    reparos = reparar_coordenadas(comerciantes, municipios)
+    agora = datetime.now(timezone.utc).isoformat()
+
+    linhas = []
+    contagem = {}
+    for c, r in zip(comerciantes, reparos):
+        acao = acao_do_reparo(c, r)
+        contagem[acao] = contagem.get(acao, 0) + 1
+        linhas.append({
+            "id": c.get("id"),
+            "nome": c.get("nome"),
+            "cidade": c.get("cidade"),
+            "estado": c.get("estado"),
+            "latitude_original": c.get("latitude"),
+            "longitude_original": c.get("longitude"),
+            "latitude": r["latitude"],
+            "longitude": r["longitude"],
+            "motivo": r["motivo"],
+            "referencia": r["referencia"],
+            "distancia_referencia_km": r["distancia_referencia_km"],
+            "acao": acao,
+        })
+
+        dados = campos_do_reparo(c, r, agora)
+        if not aplicar or not dados:
+            # mantida: não regrava (nem apaga o motivo de um reparo anterior)
+            continue
+        supabase.table("comerciantes").update(dados).eq("id", c["id"]).execute()
+
+    caminho = gerar_relatorio(linhas)
+    print(f"{len(comerciantes)} comerciante(s): " + ", ".join(f"{k}={v}" for k, v in sorted(contagem.items())))
+    print(f"Relatório: {caminho}")
+    if not aplicar:
+        print("Nada foi gravado (use --aplicar).")
+
+
+if __name__ == "__main__":
+    with app.app_context():
+        supabase = app.config["supabase"]
+        try:
+            reparar(supabase, aplicar="--aplicar" in sys.argv[1:])
+        except Exception as e:
+            print("❌ ERRO NO REPARO DE COORDENADAS:", e)
+            sys.exit(1)
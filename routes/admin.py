@@ -9,12 +9,32 @@ from flask import (
     current_app,
     jsonify,
 )
-from datetime import datetime
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
 import traceback
 import os
 from dotenv import load_dotenv
 from extensions import db
 from models import Comerciante
+from utils.normalizacao import (
+    campos_normalizados_produto,
+    campos_normalizados_comerciante,
+)
+from utils.catalogo import (
+    obter_catalogo,
+    notificar_produtos_alterados,
+    notificar_produtos_removidos,
+    notificar_comerciantes_alterados,
+    notificar_comerciantes_removidos,
+)
+from utils.rotas import obter_servico_rotas
+from utils.coordenadas import reparar_coordenada, campos_do_reparo
+from utils.horarios import campos_horario_comerciante
+from utils.localidades import obter_municipios
+from utils.telemetria import obter_telemetria
+from utils.detalhe_produto import obter_cache_detalhes
+from utils.estatisticas_painel import obter_estatisticas_painel, invalidar_estatisticas_painel
+from utils.diretorio_comerciantes import obter_diretorio_comerciantes
 
 # -----------------------------
 # Blueprint Admin
@@ -89,51 +109,15 @@ def login_required(func):
 def admin_dashboard():
     supabase = current_app.config["supabase"]
     try:
-        total_comerciantes = len(
-            supabase.table("comerciantes").select("id").execute().data or []
-        )
-        aprovados = len(
-            supabase.table("comerciantes")
-            .select("id")
-            .eq("status", "ativo")
-            .execute()
-            .data
-            or []
-        )
-        bloqueados = len(
-            supabase.table("comerciantes")
-            .select("id")
-            .eq("status", "bloqueado")
-            .execute()
-            .data
-            or []
-        )
-        pendentes = len(
-            supabase.table("comerciantes_pendentes").select("id").execute().data or []
-        )
-        total_produtos = len(
-            supabase.table("produtos").select("id").execute().data or []
-        )
-        total_pesquisas = len(
-            supabase.table("pesquisas").select("id").execute().data or []
-        )
-        total_acessos = len(
-            supabase.table("historico_comerciantes").select("id").execute().data or []
-        )
-
-        pendentes_list = (
-            supabase.table("comerciantes_pendentes").select("*").execute().data or []
-        )
-
-        stats = {
-            "total_comerciantes": total_comerciantes,
-            "aprovados": aprovados,
-            "bloqueados": bloqueados,
-            "pendentes": pendentes,
-            "total_produtos": total_produtos,
-            "total_pesquisas": total_pesquisas,
-            "total_acessos": total_acessos,
-        }
+        # contadores (guardados por alguns segundos) e lista de pendentes em paralelo
+        estatisticas = obter_estatisticas_painel()
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            futuro_stats = executor.submit(estatisticas.obter, supabase)
+            futuro_pendentes = executor.submit(
+                lambda: supabase.table("comerciantes_pendentes").select("*").execute().data or []
+            )
+            stats = futuro_stats.result()
+            pendentes_list = futuro_pendentes.result()
 
         return render_template(
             "admin_dashboard.html", stats=stats, pendentes=pendentes_list
@@ -144,62 +128,152 @@ def admin_dashboard():
         return redirect(url_for("admin.admin_login"))
 
 
+# ---------------- STATUS DO CATÁLOGO EM MEMÓRIA ----------------
+@admin_bp.route("/admin/catalogo/status")
+@login_required
+def admin_catalogo_status():
+    catalogo = obter_catalogo()
+    if catalogo is None:
+        return jsonify({"ativo": False}), 503
+    return jsonify({
+        "ativo": True,
+        **catalogo.status(),
+        "rotas": obter_servico_rotas().status(),
+        "telemetria": obter_telemetria().status(),
+        "detalhes_produto": obter_cache_detalhes().status(),
+        "estatisticas_painel": obter_estatisticas_painel().status(),
+        "diretorio_comerciantes": obter_diretorio_comerciantes().status(),
+    })
+
+
 # ---------------- LISTAR COMERCIANTES ----------------
+POR_PAGINA_COMERCIANTES = 50
+MAX_PRODUTOS_DETALHE = 500
+HISTORICO_POR_COMERCIANTE = 20
+TAMANHO_LOTE = 1000  # limite padrão de linhas por requisição do PostgREST
+
+
+def _todas_as_linhas(montar_query):
+    """Percorre um select em páginas de TAMANHO_LOTE (a query precisa de order)."""
+    linhas = []
+    inicio = 0
+    while True:
+        pagina = montar_query().range(inicio, inicio + TAMANHO_LOTE - 1).execute().data or []
+        linhas.extend(pagina)
+        if len(pagina) < TAMANHO_LOTE:
+            return linhas
+        inicio += TAMANHO_LOTE
+
+
+def _formatar_data_hora(h):
+    if h.get("data_hora"):
+        try:
+            dt = datetime.fromisoformat(h["data_hora"].replace("Z", "+00:00"))
+            h["data_hora"] = dt.strftime("%d/%m/%Y %H:%M")
+        except:
+            pass
+    return h
+
+
 @admin_bp.route("/admin/comerciantes")
 @login_required
 def admin_comerciantes():
+    """
+    Uma página de comerciantes (filtro por nome/cidade e status no banco) e
+    a quantidade de produtos de todos eles numa consulta só. Produtos e
+    histórico de cada um vêm de admin_comerciante_itens quando o card abre.
+    """
     supabase = current_app.config["supabase"]
     try:
-        comerciantes = (
-            supabase.table("comerciantes")
-            .select("*")
-            .order("nome", desc=False)
+        pagina = max(request.args.get("pagina", 1, type=int), 1)
+        busca = (request.args.get("busca") or "").strip()
+        status = request.args.get("status") or ""
+
+        consulta = supabase.table("comerciantes").select("*", count="exact")
+        if status:
+            consulta = consulta.eq("status", status)
+        if busca:
+            # vírgula e parênteses separam condições no or_ do PostgREST
+            termo = "".join(ch for ch in busca if ch not in ",()%*")
+            consulta = consulta.or_(f"nome.ilike.%{termo}%,cidade.ilike.%{termo}%")
+        inicio = (pagina - 1) * POR_PAGINA_COMERCIANTES
+        resp = (
+            consulta.order("nome", desc=False)
+            .range(inicio, inicio + POR_PAGINA_COMERCIANTES - 1)
             .execute()
-            .data
-            or []
         )
+        comerciantes = resp.data or []
+        total = resp.count or 0
+
+        ids = [c.get("id") for c in comerciantes]
+        quantidades = {}
+        if ids:
+            linhas = _todas_as_linhas(
+                lambda: supabase.table("produtos")
+                .select("comerciante_id")
+                .in_("comerciante_id", ids)
+                .order("id")
+            )
+            for linha in linhas:
+                cid = linha.get("comerciante_id")
+                quantidades[cid] = quantidades.get(cid, 0) + 1
         for c in comerciantes:
-            cid = c.get("id")
-            produtos = (
-                supabase.table("produtos")
-                .select("*")
-                .eq("comerciante_id", cid)
+            c["quantidade_produtos"] = quantidades.get(c.get("id"), 0)
+
+        return render_template(
+            "admin_comerciantes.html",
+            comerciantes=comerciantes,
+            pagina=pagina,
+            total=total,
+            total_paginas=max((total + POR_PAGINA_COMERCIANTES - 1) // POR_PAGINA_COMERCIANTES, 1),
+            busca=busca,
+            status=status,
+        )
+    except Exception as e:
+        print("❌ ERRO AO LISTAR COMERCIANTES:", traceback.format_exc())
+        flash(f"Erro ao carregar comerciantes: {e}", "danger")
+        return redirect(url_for("admin.admin_dashboard"))
+
+
+# ---------------- PRODUTOS E HISTÓRICO DE UM COMERCIANTE (JSON) ----------------
+@admin_bp.route("/admin/comerciantes/<id>/itens")
+@login_required
+def admin_comerciante_itens(id):
+    """Carregado pelo card de admin_comerciantes só quando o admin o expande."""
+    supabase = current_app.config["supabase"]
+    try:
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            futuro_produtos = executor.submit(
+                lambda: supabase.table("produtos")
+                .select("id, nome, categoria, preco, imagem", count="exact")
+                .eq("comerciante_id", id)
                 .order("nome", desc=False)
+                .limit(MAX_PRODUTOS_DETALHE)
                 .execute()
-                .data
-                or []
             )
-            for p in produtos:
-                if not p.get("imagem"):
-                    p["imagem"] = "/static/img/sem-produto.jpg"
-            c["produtos"] = produtos
-            c["quantidade_produtos"] = len(produtos)
-
-            historico = (
-                supabase.table("historico_comerciantes")
+            futuro_historico = executor.submit(
+                lambda: supabase.table("historico_comerciantes")
                 .select("*")
-                .eq("comerciante_id", cid)
+                .eq("comerciante_id", id)
                 .order("data_hora", desc=True)
-                .limit(20)
+                .limit(HISTORICO_POR_COMERCIANTE)
                 .execute()
-                .data
-                or []
             )
-            for h in historico:
-                if h.get("data_hora"):
-                    try:
-                        dt = datetime.fromisoformat(
-                            h["data_hora"].replace("Z", "+00:00")
-                        )
-                        h["data_hora"] = dt.strftime("%d/%m/%Y %H:%M")
-                    except:
-                        pass
-            c["historico"] = historico
-        return render_template("admin_comerciantes.html", comerciantes=comerciantes)
+            resp_produtos = futuro_produtos.result()
+            historico = futuro_historico.result().data or []
+
+        produtos = resp_produtos.data or []
+        for p in produtos:
+            if not p.get("imagem"):
+                p["imagem"] = "/static/img/sem-produto.jpg"
+        return jsonify({
+            "produtos": produtos,
+            "total_produtos": resp_produtos.count if resp_produtos.count is not None else len(produtos),
+            "historico": [_formatar_data_hora(h) for h in historico],
+        })
     except Exception as e:
-        print("❌ ERRO AO LISTAR COMERCIANTES:", traceback.format_exc())
-        flash(f"Erro ao carregar comerciantes: {e}", "danger")
-        return redirect(url_for("admin.admin_dashboard"))
+        print("❌ ERRO AO CARREGAR ITENS DO COMERCIANTE:", traceback.format_exc())
+        return jsonify({"erro": str(e)}), 500
 
 
 @admin_bp.route("/bloquear/<id>")
@@ -216,9 +290,13 @@ def admin_bloquear_comerciante(id):
             return redirect(url_for("admin.admin_comerciantes"))
 
         # Atualiza o status para bloqueado
-        supabase.table("comerciantes").update({"status": "bloqueado"}).eq(
-            "id", id
-        ).execute()
+        resp = (
+            supabase.table("comerciantes")
+            .update({"status": "bloqueado"})
+            .eq("id", id)
+            .execute()
+        )
+        notificar_comerciantes_alterados(resp.data or [])
         flash("🚫 Comerciante bloqueado com sucesso!", "success")
 
     except Exception as e:
@@ -242,9 +320,13 @@ def admin_desbloquear_comerciante(id):
             return redirect(url_for("admin.admin_comerciantes"))
 
         # Atualiza o status para ativo
-        supabase.table("comerciantes").update({"status": "ativo"}).eq(
-            "id", id
-        ).execute()
+        resp = (
+            supabase.table("comerciantes")
+            .update({"status": "ativo"})
+            .eq("id", id)
+            .execute()
+        )
+        notificar_comerciantes_alterados(resp.data or [])
         flash("✅ Comerciante desbloqueado com sucesso!", "success")
 
     except Exception as e:
@@ -265,6 +347,7 @@ def admin_apagar_comerciante(id):
             "comerciante_id", id
         ).execute()
         supabase.table("comerciantes").delete().eq("id", id).execute()
+        notificar_comerciantes_removidos([id])
         flash("🗑️ Comerciante e todos os dados relacionados foram apagados!", "danger")
     except Exception as e:
         print("❌ ERRO AO APAGAR:", traceback.format_exc())
@@ -286,18 +369,14 @@ def admin_acessos():
             .data
             or []
         )
+        # nome/cidade/estado do diretório em memória, sem consulta por linha
+        diretorio = obter_diretorio_comerciantes().todos(supabase)
         for a in acessos:
-            comerciante = (
-                supabase.table("comerciantes")
-                .select("*")
-                .eq("id", a["comerciante_id"])
-                .execute()
-                .data
-            )
+            comerciante = diretorio.get(str(a.get("comerciante_id")))
             if comerciante:
-                a["nome"] = comerciante[0]["nome"]
-                a["cidade"] = comerciante[0].get("cidade", "")
-                a["estado"] = comerciante[0].get("estado", "")
+                a["nome"] = comerciante["nome"]
+                a["cidade"] = comerciante.get("cidade") or ""
+                a["estado"] = comerciante.get("estado") or ""
         return render_template("admin_acessos.html", acessos=acessos)
     except Exception as e:
         print("❌ ERRO AO CARREGAR ACESSOS:", traceback.format_exc())
@@ -319,20 +398,15 @@ def admin_produtos():
             .data
             or []
         )
+        diretorio = obter_diretorio_comerciantes().todos(supabase)
         produtos_data = []
         for p in produtos:
             comerciante_nome = "Desconhecido"
             comerciante_id = p.get("comerciante_id")
             if comerciante_id:
-                comerciante = (
-                    supabase.table("comerciantes")
-                    .select("nome")
-                    .eq("id", comerciante_id)
-                    .execute()
-                    .data
-                )
+                comerciante = diretorio.get(str(comerciante_id))
                 if comerciante:
-                    comerciante_nome = comerciante[0].get("nome", "Desconhecido")
+                    comerciante_nome = comerciante.get("nome") or "Desconhecido"
             produtos_data.append(
                 {
                     "id": p.get("id"),
@@ -360,16 +434,8 @@ def admin_produto_detalhes(id):
             flash("❌ Produto não encontrado.", "warning")
             return redirect(url_for("admin.admin_produtos"))
         p = produto[0]
-        comerciante = (
-            supabase.table("comerciantes")
-            .select("*")
-            .eq("id", p["comerciante_id"])
-            .execute()
-            .data
-        )
-        p["comerciante_nome"] = (
-            comerciante[0]["nome"] if comerciante else "Desconhecido"
-        )
+        comerciante = obter_diretorio_comerciantes().obter(supabase, p["comerciante_id"])
+        p["comerciante_nome"] = comerciante["nome"] if comerciante else "Desconhecido"
         return render_template("admin_produto_detalhes.html", produto=p)
     except Exception as e:
         print("❌ ERRO AO CARREGAR DETALHES:", traceback.format_exc())
@@ -391,9 +457,15 @@ def admin_produto_editar(id):
             nome = request.form.get("nome")
             preco = float(request.form.get("preco", 0))
             imagem = request.form.get("imagem")
-            supabase.table("produtos").update(
-                {"nome": nome, "preco": preco, "imagem": imagem}
-            ).eq("id", id).execute()
+            dados = {"nome": nome, "preco": preco, "imagem": imagem}
+            dados.update(campos_normalizados_produto(dados))
+            resp = (
+                supabase.table("produtos")
+                .update(dados)
+                .eq("id", id)
+                .execute()
+            )
+            notificar_produtos_alterados(resp.data or [])
             flash("✅ Produto atualizado com sucesso!", "success")
             return redirect(url_for("admin.admin_produtos"))
         p = produto[0]
@@ -411,6 +483,7 @@ def admin_produto_excluir(id):
     supabase = current_app.config["supabase"]
     try:
         supabase.table("produtos").delete().eq("id", id).execute()
+        notificar_produtos_removidos([id])
         flash("🗑️ Produto excluído com sucesso!", "danger")
     except Exception as e:
         print("❌ ERRO AO EXCLUIR PRODUTO:", traceback.format_exc())
@@ -565,32 +638,41 @@ def aprovar_comerciante(id):
         c = pendente[0]
 
         if aprovado:
+            novo = {
+                **campos_normalizados_comerciante(c),
+                "nome": c["nome"],
+                "email": c["email"],
+                "auth_user_id": c.get("auth_user_id"),
+                "cidade": c.get("cidade"),
+                "estado": c.get("estado"),
+                "whatsapp": c.get("whatsapp"),
+                "foto_perfil": c.get("foto_perfil"),
+                "faz_entrega": c.get("faz_entrega", False),
+                "endereco_logradouro": c.get("endereco_logradouro"),
+                "endereco_numero": c.get("endereco_numero"),
+                "endereco_complemento": c.get("endereco_complemento"),
+                "latitude": c.get("latitude"),
+                "longitude": c.get("longitude"),
+                "aprovado": True,
+                "status": "ativo",
+                "data_cadastro": c.get("data_cadastro"),
+                "criado_em": datetime.utcnow().isoformat(),
+                "atualizado_em": datetime.utcnow().isoformat(),
+            }
+            # mesmo tratamento de editar_comerciante: horário compilado e
+            # coordenadas trocadas/invertidas corrigidas (ou limpas) na gravação
+            novo.update(campos_horario_comerciante(c))
+            if novo["latitude"] is not None or novo["longitude"] is not None:
+                reparo = reparar_coordenada(novo, obter_municipios())
+                novo.update(campos_do_reparo(novo, reparo, datetime.now(timezone.utc).isoformat()))
+
             # Insere na tabela comerciantes
-            supabase.table("comerciantes").insert(
-                {
-                    "nome": c["nome"],
-                    "email": c["email"],
-                    "auth_user_id": c.get("auth_user_id"),
-                    "cidade": c.get("cidade"),
-                    "estado": c.get("estado"),
-                    "whatsapp": c.get("whatsapp"),
-                    "foto_perfil": c.get("foto_perfil"),
-                    "faz_entrega": c.get("faz_entrega", False),
-                    "endereco_logradouro": c.get("endereco_logradouro"),
-                    "endereco_numero": c.get("endereco_numero"),
-                    "endereco_complemento": c.get("endereco_complemento"),
-                    "latitude": c.get("latitude"),
-                    "longitude": c.get("longitude"),
-                    "aprovado": True,
-                    "status": "ativo",
-                    "data_cadastro": c.get("data_cadastro"),
-                    "criado_em": datetime.utcnow().isoformat(),
-                    "atualizado_em": datetime.utcnow().isoformat(),
-                }
-            ).execute()
+            resp = supabase.table("comerciantes").insert(novo).execute()
+            notificar_comerciantes_alterados(resp.data or [])
 
         # Remove da tabela de pendentes
         supabase.table("comerciantes_pendentes").delete().eq("id", id).execute()
+        invalidar_estatisticas_painel()
 
         return jsonify({"sucesso": True})
 
@@ -5,7 +5,7 @@ import time
 import traceback
 import uuid
 import unicodedata
-from datetime import datetime
+from datetime import datetime, timezone
 from functools import wraps
 from decimal import Decimal, InvalidOperation
 import requests
@@ -38,6 +38,21 @@ from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
 # Importa db da extensions
 from extensions import db
 
+# Campos *_norm e snapshot do catálogo usados na busca do consumidor
+from utils.normalizacao import (
+    campos_normalizados_produto,
+    campos_normalizados_comerciante,
+)
+from utils.catalogo import (
+    notificar_produtos_alterados,
+    notificar_produtos_removidos,
+    notificar_comerciantes_alterados,
+)
+from utils.coordenadas import reparar_coordenada, campos_do_reparo
+from utils.horarios import campos_horario_comerciante
+from utils.localidades import obter_municipios
+from utils.estatisticas_painel import invalidar_estatisticas_painel
+
 # === BLUEPRINT ===
 comerciante_bp = Blueprint("comerciante", __name__, template_folder="../templates")
 
@@ -335,6 +350,7 @@ def comerciante_cadastro():
             return render_template("comerciante_cadastro.html")
 
         print("\n→ Insert realizado com sucesso!")
+        invalidar_estatisticas_painel()
 
         # Foto
         if "foto_perfil" in request.files:
@@ -561,6 +577,20 @@ def editar_comerciante():
     if foto_perfil:
         dados_atualizacao["foto_perfil"] = foto_perfil
 
+    dados_atualizacao.update(campos_normalizados_comerciante(dados_atualizacao))
+    # horário em intervalos de minuto da semana + fuso do estado (utils/horarios.py)
+    dados_atualizacao.update(campos_horario_comerciante(dados_atualizacao))
+
+    # coordenadas trocadas/com sinal invertido são corrigidas aqui, uma vez,
+    # em vez de adivinhadas a cada busca do consumidor; sem interpretação
+    # plausível, são limpas. Como em reparar_coordenadas.py, as recebidas
+    # ficam em latitude_original/longitude_original
+    if dados_atualizacao["latitude"] is not None or dados_atualizacao["longitude"] is not None:
+        reparo = reparar_coordenada(dados_atualizacao, obter_municipios())
+        dados_atualizacao.update(
+            campos_do_reparo(dados_atualizacao, reparo, datetime.now(timezone.utc).isoformat())
+        )
+
     # ------------------------------
     # 💾 ATUALIZA NO SUPABASE
     # ------------------------------
@@ -577,6 +607,8 @@ def editar_comerciante():
         if not resp.data:
             return jsonify({"sucesso": False, "erro": "Erro ao atualizar perfil"}), 400
 
+        notificar_comerciantes_alterados(resp.data)
+
         return jsonify({"sucesso": True})
 
     except Exception as e:
@@ -905,6 +937,7 @@ def api_criar_produto():
             "criado_em": datetime.utcnow().isoformat(),
             "atualizado_em": datetime.utcnow().isoformat(),
         }
+        produto.update(campos_normalizados_produto(produto))
 
         resp = supabase.table("produtos").insert(produto).execute()
 
@@ -914,6 +947,8 @@ def api_criar_produto():
         if not resp.data:
             return jsonify({"sucesso": False, "erro": "Erro ao salvar no banco."}), 500
 
+        notificar_produtos_alterados(resp.data)
+
         return jsonify({"sucesso": True, "produto": resp.data[0]}), 201
 
     except Exception as e:
@@ -957,6 +992,7 @@ def api_editar_produto(id):
             updates["imagem"] = "/static/img/sem-imagem.png"  # fallback
 
         updates["atualizado_em"] = datetime.utcnow().isoformat()
+        updates.update(campos_normalizados_produto(updates))
 
         resp = (
             supabase.table("produtos")
@@ -977,6 +1013,8 @@ def api_editar_produto(id):
                 404,
             )
 
+        notificar_produtos_alterados(resp.data)
+
         return jsonify({"sucesso": True, "produto": resp.data[0]}), 200
 
     except Exception as e:
@@ -1018,6 +1056,8 @@ def api_deletar_produto(id):
         .execute()
     )
 
+    notificar_produtos_removidos([id])
+
     return jsonify({"sucesso": True})
 
 
@@ -1430,6 +1470,7 @@ def importar_produtos():
                         "imagem": processar_imagem(row.get("imagem")),
                         "criado_em": datetime.utcnow().isoformat(),
                         "atualizado_em": datetime.utcnow().isoformat(),
+                        **campos_normalizados_produto({"nome": nome, "marca": marca}),
                     }
                 )
                 nomes_existentes.add(nome.lower())
@@ -1478,7 +1519,10 @@ def importar_produtos():
 
         # ===================== Inserção no banco =====================
         if produtos_importados:
-            supabase.table("produtos").insert(produtos_importados).execute()
+            resp_insercao = (
+                supabase.table("produtos").insert(produtos_importados).execute()
+            )
+            notificar_produtos_alterados(resp_insercao.data or [])
 
         # ===================== Relatório (Excel) =====================
         wb = Workbook()
@@ -2019,6 +2063,7 @@ def deletar_selecionados():
                     supabase.table("produtos").delete().in_(
                         "id", [p["id"] for p in lote]
                     ).eq("comerciante_id", comerciante_id).execute()
+                    notificar_produtos_removidos([p["id"] for p in lote])
                     total_excluidos += len(lote)
                     print(f"Lote {i//BLOCO + 1} excluído com sucesso.")
                     break
@@ -2270,10 +2315,17 @@ def atualizar_produtos():
                     ),
                     "atualizado_em": datetime.utcnow().isoformat(),
                 }
+                dados_atualizados.update(
+                    campos_normalizados_produto(dados_atualizados)
+                )
 
-                supabase.table("produtos").update(dados_atualizados).eq(
-                    "id", produto["id"]
-                ).execute()
+                resp_update = (
+                    supabase.table("produtos")
+                    .update(dados_atualizados)
+                    .eq("id", produto["id"])
+                    .execute()
+                )
+                notificar_produtos_alterados(resp_update.data or [])
 
                 produtos_atualizados.append(
                     {
@@ -1,7 +1,40 @@
-from flask import Blueprint, render_template, request, jsonify, current_app
-from datetime import datetime
-import math
-import unicodedata
+from flask import Blueprint, render_template, request, jsonify, current_app, Response, stream_with_context, session, make_response
+from datetime import datetime, timedelta, timezone
+import json
+
+from utils.normalizacao import normaliza
+from utils.distancias import perfil_da_request
+from utils.busca_produtos import etag_da_busca
+from utils.catalogo import obter_catalogo
+from utils.motor_busca import (
+    Cronometro,
+    consulta_da_request,
+    executar_busca,
+    id_comerciante,
+    fonte_distancia_da_busca,
+    fonte_distancia_da_pagina,
+)
+from utils.telemetria import obter_telemetria
+from utils.detalhe_produto import buscar_detalhe_produto
+from utils.horarios import situacao_do_comerciante, FECHA_EM_BREVE_MIN
+from utils.sugestoes import (
+    sugestoes_do_banco,
+    LIMITE_PADRAO as LIMITE_SUGESTOES,
+    LIMITE_MAXIMO as LIMITE_MAXIMO_SUGESTOES,
+)
+from utils.cesta import (
+    otimizar_cesta,
+    itens_da_lista,
+    posicao_da_lista,
+    texto_da_lista,
+    ListaInvalida,
+    LOJAS_PADRAO as LOJAS_CESTA,
+)
+
+# o navegador guarda a resposta, mas sempre revalida pelo ETag
+CACHE_CONTROL_BUSCA = "private, no-cache"
+# sugestões e facetas mudam devagar: o navegador reaproveita por um minuto sem perguntar
+CACHE_CONTROL_SUGESTOES = "private, max-age=60"
 
 # -----------------------------
 # Blueprint Consumidor
@@ -12,247 +45,54 @@ consumidor_bp = Blueprint(
     template_folder='../templates/consumidor'
 )
 
-# ---------------- Normalização de strings ----------------
-def normaliza(texto):
-    return unicodedata.normalize('NFKD', texto or '').encode('ASCII', 'ignore').decode('utf-8').lower().strip()
-
-# ---------------- Tratamento seguro de latitude/longitude ----------------
-def try_float(v):
-    if v is None:
-        return None
-    if isinstance(v, (float, int)):
-        return float(v)
-    s = str(v).strip().replace(",", ".")
-    try:
-        return float(s)
-    except:
-        return None
-
-# ---------------- Haversine (linha reta precisa, km) ----------------
-def distancia_haversine(lat1, lon1, lat2, lon2):
-    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    R = 6372.795477598  # km
-    return R * c
-
-# ---------------- Estimativa de custo de deslocamento ----------------
-def custo_deslocamento(distancia_km, consumo_km_l=10, preco_litro=6.0):
-    if distancia_km is None:
-        return 0.0
-    litros_necessarios = distancia_km / consumo_km_l
-    return litros_necessarios * preco_litro
-
-# ---------------- Correção automática conservadora de coordenadas ----------------
-def melhor_distancia_user_comerciante(lat_user, lon_user, raw_lat, raw_lon):
-    """
-    Retorna (lat, lon, motivo) escolhendo a interpretação mais plausível
-    entre (orig, swap, sinais invertidos). Se tudo inválido -> (None, None, motivo).
-    """
-    lat_c = try_float(raw_lat)
-    lon_c = try_float(raw_lon)
-
-    if lat_c is None and lon_c is None:
-        return None, None, "missing"
-
-    combos = [
-        (lat_c, lon_c, "orig"),
-        (lon_c, lat_c, "swap"),
-        (-lat_c if lat_c is not None else None, lon_c, "neg_lat"),
-        (lat_c, -lon_c if lon_c is not None else None, "neg_lon"),
-        (-lat_c if lat_c is not None else None, -lon_c if lon_c is not None else None, "neg_both"),
-    ]
-
-    combos_validos = []
-    for lat_try, lon_try, tag in combos:
-        if lat_try is None or lon_try is None:
-            continue
-        if -90 <= lat_try <= 90 and -180 <= lon_try <= 180:
-            combos_validos.append((lat_try, lon_try, tag))
-
-    if not combos_validos:
-        return None, None, "invalid_range"
-
-    melhor = None
-    melhor_tag = None
-    menor_dist = None
-
-    for lat_try, lon_try, tag in combos_validos:
-        try:
-            d = distancia_haversine(lat_user, lon_user, lat_try, lon_try)
-        except Exception:
-            continue
-        if menor_dist is None or d < menor_dist:
-            menor_dist = d
-            melhor = (lat_try, lon_try)
-            melhor_tag = tag
-
-    if menor_dist is None:
-        return None, None, "calc_error"
-
-    # sanity check: se estiver absurdamente longe, considera inválido
-    if menor_dist > 2000:
-        return None, None, "absurdo"
-
-    # se a melhor interpretação não for a original, logue (print) para auditoria
-    if melhor_tag != "orig":
-        print(f"[WARN] Coordenada do comerciante ajustada ({melhor_tag}). raw=({raw_lat},{raw_lon}) -> used=({melhor[0]},{melhor[1]}) dist_km={menor_dist:.3f}")
-
-    return melhor[0], melhor[1], melhor_tag
+# ---------------- Sessão (telemetria) ----------------
+def sessao_do_consumidor():
+    """Identifica quem repete a busca, para a telemetria não contar duas vezes."""
+    return session.get("user_id") or request.headers.get("X-Forwarded-For", request.remote_addr)
 
 # ---------------- ROTA DO CONSUMIDOR (com tudo integrado) ----------------
 @consumidor_bp.route('/')
 def consumidor_home():
     supabase = current_app.config["supabase"]
+    cronometro = Cronometro()
 
     # ---------------- parâmetros ----------------
-    busca = normaliza(request.args.get('busca', ''))
-    estado = normaliza(request.args.get('estado', ''))
-    cidade = normaliza(request.args.get('cidade', ''))
-    filtro_entrega = request.args.get('entrega', '').lower() == 'true'
-    filtro_proximos = request.args.get('proximos', '').lower() == 'true'
-    filtro_custo = request.args.get('custo', '').lower() == 'true'
-    ordenar_novos = request.args.get('novos', '').lower() == 'true'
-    lat_user = request.args.get('lat', type=float)
-    lon_user = request.args.get('lon', type=float)
-
-    # ---------------- busca produtos ----------------
-    produtos_resp = supabase.table("produtos").select("*, comerciante:comerciante_id(*)").execute()
-    produtos = produtos_resp.data or []
-
-    filtrados = []
-    distancias_por_comerciante = {}
-
-    for p in produtos:
-        c = p.get("comerciante", {})
-        comerci_id = c.get("id")
-
-        # filtros básicos
-        if c.get("status") != "ativo":
-            continue
-        if estado and normaliza(c.get("estado")) != estado:
-            continue
-        if cidade and normaliza(c.get("cidade")) != cidade:
-            continue
-        if filtro_entrega and not c.get("faz_entrega", False):
-            continue
-        if busca and busca not in normaliza(p.get("nome")):
-            continue
-
-        # calcular distância uma vez só por comerciante
-        if comerci_id not in distancias_por_comerciante:
-            dist = None
-            custo_viagem = 0.0
-
-            if lat_user is not None and lon_user is not None and (c.get("latitude") or c.get("longitude")):
-                # tenta escolher a melhor interpretação das coordenadas do comerciante
-                lat_corr, lon_corr, motivo = melhor_distancia_user_comerciante(
-                    lat_user, lon_user,
-                    c.get("latitude"),
-                    c.get("longitude")
-                )
-
-                if lat_corr is not None and lon_corr is not None:
-                    try:
-                        dist = distancia_haversine(lat_user, lon_user, lat_corr, lon_corr)
-                        custo_viagem = custo_deslocamento(dist)
-                    except Exception as e:
-                        print(f"[ERROR] erro ao calcular distancia para comerciante {comerci_id}: {e}")
-                        dist = None
-                        custo_viagem = 0.0
-                else:
-                    # sem coordenada válida interpretada
-                    dist = None
-                    custo_viagem = 0.0
-                    print(f"[INFO] comerciante {comerci_id} sem coordenada válida (motivo: {motivo}). raw=({c.get('latitude')},{c.get('longitude')})")
-
-            distancias_por_comerciante[comerci_id] = {
-                "distancia": dist,
-                "custo_viagem": custo_viagem
-            }
-
-        info_com = distancias_por_comerciante[comerci_id]
-
-        # mantém o valor numérico em km para uso interno
-        p["distancia"] = info_com["distancia"]
+    with cronometro.etapa("consulta"):
+        # a página pagina por offset; cursor é só da API
+        consulta = consulta_da_request(request.args, com_cursor=False)
+
+    # ---------------- busca (utils/motor_busca.py), distâncias em linha reta ----------------
+    resultado = executar_busca(supabase, obter_catalogo(), consulta, cronometro=cronometro)
+    filtrados = resultado["produtos"]
 
+    for p in filtrados:
         # adiciona versão arredondada (float) com 2 casas decimais
-        if info_com["distancia"] is not None:
-            p["distancia_km"] = round(float(info_com["distancia"]), 2)
+        if p["distancia"] is not None:
+            p["distancia_km"] = round(float(p["distancia"]), 2)
             # string pronta pra exibir no card no formato brasileiro "12,34 km"
             p["distancia_display"] = f"{p['distancia_km']:.2f}".replace('.', ',') + " km"
         else:
             p["distancia_km"] = None
             p["distancia_display"] = None
 
-        # custo_total do produto = preco produto + custo_viagem do comerciante (único)
-        p["custo_total"] = float(p.get("preco") or 0) + (info_com["custo_viagem"] or 0.0)
-
-        filtrados.append(p)
-
-        # ---------------- REGISTRA PESQUISA ----------------
-        if busca:
-            try:
-                existente = (
-                    supabase.table("pesquisas")
-                    .select("*")
-                    .eq("termo", busca)
-                    .eq("produto_id", p["id"])
-                    .execute()
-                    .data
-                )
-
-                if existente:
-                    supabase.table("pesquisas").update({
-                        "qtd_pesquisas": existente[0]["qtd_pesquisas"] + 1,
-                        "ultima_pesquisa": datetime.utcnow().isoformat()
-                    }).eq("id", existente[0]["id"]).execute()
-                else:
-                    supabase.table("pesquisas").insert({
-                        "termo": busca,
-                        "produto_id": p["id"],
-                        "produto_nome": p.get("nome"),
-                        "comerciante_id": p.get("comerciante_id"),
-                        "comerciante_nome": c.get("nome", "Desconhecido"),
-                        "cidade": c.get("cidade"),
-                        "estado": c.get("estado"),
-                        "tipo": "pesquisa",
-                        "qtd_pesquisas": 1,
-                        "qtd_cliques": 0,
-                        "criado_em": datetime.utcnow().isoformat()
-                    }).execute()
-            except Exception as e:
-                print("❌ ERRO AO REGISTRAR PESQUISA:", e)
-
-    # ---------------- ordenação ----------------
-    if ordenar_novos:
-        filtrados.sort(
-            key=lambda x: x.get("criado_em") or datetime.utcnow().isoformat(),
-            reverse=True
-        )
-    elif filtro_custo:
-        filtrados.sort(key=lambda x: x.get("custo_total", float('inf')))
-    elif filtro_proximos and lat_user is not None and lon_user is not None:
-        # ordena pela distância numérica (em km)
-        filtrados.sort(
-            key=lambda x: x.get("distancia") if x.get("distancia") is not None else 9999
-        )
-    else:
-        filtrados.sort(key=lambda x: float(x.get("preco") or 0))
+    # ---------------- REGISTRA PESQUISA ----------------
+    # acumulado em memória e gravado em lote (utils/telemetria.py)
+    if consulta["busca"]:
+        obter_telemetria().registrar_pesquisa(consulta["busca"], filtrados, sessao=sessao_do_consumidor())
 
-    return render_template("consumidor.html", produtos=filtrados, filtros={
-        "proximos": filtro_proximos,
-        "custo": filtro_custo,
-        "entrega": filtro_entrega,
-        "novos": ordenar_novos,
-        "busca": busca,
-        "estado": estado,
-        "cidade": cidade,
-        "lat": lat_user,
-        "lon": lon_user
-    })
+    resp = make_response(render_template("consumidor.html", produtos=filtrados, filtros={
+        "proximos": consulta["proximos"],
+        "custo": consulta["custo"],
+        "entrega": consulta["entrega"],
+        "novos": consulta["novos"],
+        "busca": consulta["busca"],
+        "estado": consulta["estado"],
+        "cidade": consulta["cidade"],
+        "lat": consulta["lat"],
+        "lon": consulta["lon"]
+    }))
+    resp.headers["Server-Timing"] = cronometro.server_timing()
+    return resp
 
 
 
@@ -262,8 +102,8 @@ def consumidor_home():
 def produto(id):
     supabase = current_app.config["supabase"]
 
-    resp = supabase.table("produtos").select("*, comerciante:comerciante_id(*)").eq("id", id).execute()
-    produto = resp.data[0] if resp.data else None
+    # snapshot / cache local; no máximo uma consulta ao banco
+    produto = buscar_detalhe_produto(supabase, id)
     if not produto:
         return "Produto não encontrado", 404
 
@@ -277,76 +117,13 @@ def produto(id):
         except ValueError:
             c['data_cadastro'] = None
 
-    # Registra clique
-    try:
-        existente = supabase.table("pesquisas").select("*").eq("produto_id", produto["id"]).execute().data
-        if existente:
-            supabase.table("pesquisas").update({
-                "qtd_cliques": existente[0]["qtd_cliques"] + 1,
-                "ultima_pesquisa": datetime.utcnow().isoformat()
-            }).eq("id", existente[0]["id"]).execute()
-        else:
-            supabase.table("pesquisas").insert({
-                "termo": produto['nome'],
-                "produto_id": produto['id'],
-                "produto_nome": produto['nome'],
-                "comerciante_id": produto.get("comerciante_id"),
-                "comerciante_nome": c.get("nome", "Desconhecido"),
-                "cidade": c.get("cidade"),
-                "estado": c.get("estado"),
-                "tipo": "clique",
-                "qtd_pesquisas": 0,
-                "qtd_cliques": 1,
-                "criado_em": datetime.utcnow().isoformat()
-            }).execute()
-    except Exception as e:
-        print("❌ ERRO AO REGISTRAR CLIQUE NO PRODUTO:", e)
-
-    # Calcula status da loja
-    agora = datetime.now()
-    dias = ['Segunda','Terça','Quarta','Quinta','Sexta','Sábado','Domingo']
-    hoje = dias[agora.weekday()]
-
-    horario = c.get('horario_funcionamento') or {}
-    info = horario.get(hoje) or {}
-
-    fechado = info.get('fechado', False)
-    inicio_str = info.get('inicio', '')
-    fim_str = info.get('fim', '')
-
-    loja_status = 'sem_horario'
-    alerta_fechamento = False
-    tempo_restante = None
-
-    if not fechado and inicio_str and fim_str:
-        try:
-            inicio = datetime.strptime(inicio_str, "%H:%M").time()
-            fim = datetime.strptime(fim_str, "%H:%M").time()
-            hora_atual = agora.time()
-
-            if inicio <= fim:
-                if inicio <= hora_atual <= fim:
-                    loja_status = 'aberto'
-                    fim_datetime = datetime.combine(agora.date(), fim)
-                    tempo_restante = fim_datetime - agora
-                else:
-                    loja_status = 'fechado'
-            else:
-                if hora_atual >= inicio or hora_atual <= fim:
-                    loja_status = 'aberto'
-                    fim_datetime = datetime.combine(agora.date(), fim)
-                    if hora_atual >= inicio:
-                        fim_datetime += timedelta(days=1)
-                    tempo_restante = fim_datetime - agora
-                else:
-                    loja_status = 'fechado'
-
-            alerta_fechamento = loja_status == 'aberto' and tempo_restante and tempo_restante <= timedelta(hours=1, minutes=30)
-        except Exception as e:
-            print("❌ ERRO AO CALCULAR HORÁRIO:", e)
-            loja_status = 'sem_horario'
-            alerta_fechamento = False
-            tempo_restante = None
+    # Registra clique (fila em memória, gravada em lote por utils/telemetria.py)
+    obter_telemetria().registrar_clique(produto, c, sessao=sessao_do_consumidor())
+
+    # Calcula status da loja (horário compilado, no fuso do estado da loja)
+    loja_status, minutos_para_fechar = situacao_do_comerciante(c)
+    tempo_restante = timedelta(minutes=minutos_para_fechar) if minutos_para_fechar is not None else None
+    alerta_fechamento = loja_status == 'aberto' and minutos_para_fechar <= FECHA_EM_BREVE_MIN
 
     return render_template(
         'produto.html',
@@ -358,134 +135,226 @@ def produto(id):
     )
 
 # ---------------- API PRODUTOS ----------------
+def produto_json(p, situacao):
+    """Item de /api/produtos: produto com o bloco resumido do comerciante."""
+    c = p.get("comerciante") or {}
+    loja_status, minutos_para_fechar = situacao
+    return {
+        "id": p.get("id"),
+        "nome": p.get("nome"),
+        "marca": p.get("marca", ""),
+        "preco": float(p.get("preco") or 0),
+        "categoria": p.get("categoria", ""),
+        "descricao": p.get("descricao", ""),
+        "imagem": p.get("imagem") or "/static/img/sem-imagem.png",
+        "criado_em": p.get("criado_em"),
+        "atualizado_em": p.get("atualizado_em"),
+        "distancia": p.get("distancia"),
+        "distancia_fonte": p.get("distancia_fonte"),
+        "custo_total": p.get("custo_total"),
+        "comerciante": {
+            "id": c.get("id"),
+            "nome": c.get("nome"),
+            "cidade": c.get("cidade"),
+            "estado": c.get("estado"),
+            "faz_entrega": c.get("faz_entrega", False),
+            "loja_status": loja_status,
+            "minutos_para_fechar": minutos_para_fechar,
+            "fecha_em_breve": loja_status == "aberto" and minutos_para_fechar <= FECHA_EM_BREVE_MIN,
+            "horario_funcionamento": c.get("horario_funcionamento"),
+            "latitude": c.get("latitude"),
+            "longitude": c.get("longitude")
+        }
+    }
+
+
+def grupo_json(g, situacoes):
+    """Item de /api/produtos?agrupar=true: o item e as ofertas mais baratas."""
+    primeira = g["ofertas"][0]
+    return {
+        "nome": primeira.get("nome"),
+        "marca": primeira.get("marca", ""),
+        "unidade_medida": primeira.get("unidade_medida") or "unidade",
+        "menor_preco": float(primeira.get("preco") or 0),
+        "total_ofertas": g["total_ofertas"],
+        "ofertas": [produto_json(o, situacoes[id_comerciante(o)]) for o in g["ofertas"]],
+    }
+
+
 @consumidor_bp.route('/api/produtos')
 def api_produtos():
+    """
+    Página de produtos em JSON (array) ou, com formato=ndjson, um produto
+    por linha enviado à medida que é montado. Se houver mais resultados, o
+    header X-Proximo-Cursor traz o valor a passar em ?cursor= na próxima
+    chamada; o cursor vale para o mesmo modo de ordenação. Se a busca exata
+    não achou nada, vêm resultados aproximados e o header X-Busca-Aproximada.
+    Com fechando=true a página vem ordenada por quem fecha primeiro e não
+    tem continuação (sem X-Proximo-Cursor).
+
+    Com agrupar=true, cada item é um produto (nome + marca + unidade) com as
+    ?ofertas= ofertas mais baratas entre as lojas; a paginação continua
+    contando os produtos da busca.
+    """
     supabase = current_app.config["supabase"]
+    cronometro = Cronometro()
 
     # ---------------- parâmetros ----------------
-    busca = normaliza(request.args.get('busca', ''))
+    with cronometro.etapa("consulta"):
+        try:
+            consulta = consulta_da_request(request.args)
+        except ValueError as e:
+            return jsonify({"erro": str(e)}), 400
+
+    # ---------------- GET condicional ----------------
+    # mesma versão do catálogo + mesma busca (canônica) + mesmo minuto + mesma
+    # fonte de distância (estrada ou linha reta com o roteador fora) = mesma resposta
+    catalogo = obter_catalogo()
+    agora = datetime.now(timezone.utc)
+    fonte_distancia = fonte_distancia_da_busca(consulta)
+    etag = etag_da_busca(catalogo, request.args, agora, fonte_distancia)
+    if etag and etag in request.if_none_match:
+        resp = Response(status=304)
+        resp.set_etag(etag)
+        resp.headers["Cache-Control"] = CACHE_CONTROL_BUSCA
+        return resp
+
+    # ---------------- busca (utils/motor_busca.py), distâncias por estrada ----------------
+    resultado = executar_busca(supabase, catalogo, consulta, por_rota=True, agora=agora, cronometro=cronometro)
+    produtos = resultado["produtos"]
+    situacoes = resultado["situacoes"]
+    proximo_cursor = resultado["proximo_cursor"]
+    fonte_da_pagina = fonte_distancia_da_pagina(produtos, fonte_distancia)
+    if fonte_da_pagina != fonte_distancia:
+        # o roteador não respondeu para parte da página: não vale a ETag de uma resposta por estrada
+        etag = etag_da_busca(catalogo, request.args, agora, fonte_da_pagina)
+
+    agrupado = resultado["grupos"] is not None
+    itens = resultado["grupos"] if agrupado else produtos
+
+    def montar(item):
+        if agrupado:
+            return grupo_json(item, situacoes)
+        return produto_json(item, situacoes[id_comerciante(item)])
+
+    # ---------------- resposta ----------------
+    if request.args.get('formato') == 'ndjson':
+        def linhas():
+            for item in itens:
+                yield json.dumps(montar(item), ensure_ascii=False, default=str) + "\n"
+
+        resp = Response(stream_with_context(linhas()), mimetype="application/x-ndjson")
+    else:
+        resp = jsonify([montar(item) for item in itens])
+
+    if proximo_cursor:
+        resp.headers["X-Proximo-Cursor"] = proximo_cursor
+    if resultado["aproximada"]:
+        # nada com o texto exato: a página traz resultados parecidos
+        resp.headers["X-Busca-Aproximada"] = "true"
+    if etag:
+        resp.set_etag(etag)
+        resp.headers["Cache-Control"] = CACHE_CONTROL_BUSCA
+    resp.headers["Server-Timing"] = cronometro.server_timing()
+    return resp
+
+
+# ---------------- API SUGESTÕES (autocomplete) ----------------
+@consumidor_bp.route('/api/sugestoes')
+def api_sugestoes():
+    """
+    Sugestões para a caixa de busca a partir do que já foi digitado (?q=),
+    restritas ao estado/cidade escolhidos e ordenadas por popularidade.
+    """
+    supabase = current_app.config["supabase"]
+    q = request.args.get('q', '')
     estado = normaliza(request.args.get('estado', ''))
     cidade = normaliza(request.args.get('cidade', ''))
-    filtro_entrega = request.args.get('entrega', '').lower() == 'true'
-    filtro_proximos = request.args.get('proximos', '').lower() == 'true'
-    filtro_custo = request.args.get('custo', '').lower() == 'true'
-    ordenar_novos = request.args.get('novos', '').lower() == 'true'
-    lat_user = request.args.get('lat', type=float)
-    lon_user = request.args.get('lon', type=float)
-
-    # ---------------- busca produtos ----------------
-    produtos_resp = supabase.table("produtos").select("*, comerciante:comerciante_id(*)").execute()
-    produtos = produtos_resp.data or []
-
-    filtrados = []
-    # MAP para comerciantes (calcular apenas 1 vez)
-    distancias_por_comerciante = {}
-
-    agora = datetime.now()
-    dias = ['Segunda','Terça','Quarta','Quinta','Sexta','Sábado','Domingo']
-    hoje = dias[agora.weekday()]
-
-    for p in produtos:
-        c = p.get("comerciante", {})
-        comerci_id = c.get("id")
-        if c.get("status") != "ativo":
-            continue
-        if estado and normaliza(c.get("estado")) != estado:
-            continue
-        if cidade and normaliza(c.get("cidade")) != cidade:
-            continue
-        if filtro_entrega and not c.get("faz_entrega", False):
-            continue
-        if busca and busca not in normaliza(p.get("nome")):
-            continue
-
-        # ---------------- calcula distância por comerciante (uma vez)
-        if comerci_id not in distancias_por_comerciante:
-            dist = None
-            custo_viagem = 0.0
-            if lat_user is not None and lon_user is not None and c.get("latitude") and c.get("longitude"):
-                try:
-                    dist = distancia(lat_user, lon_user, float(c["latitude"]), float(c["longitude"]))
-                    custo_viagem = custo_deslocamento(dist)
-                except Exception:
-                    dist = None
-                    custo_viagem = 0.0
-            distancias_por_comerciante[comerci_id] = {"distancia": dist, "custo_viagem": custo_viagem}
-
-        info_com = distancias_por_comerciante[comerci_id]
-        p["distancia"] = info_com["distancia"]
-        p["custo_total"] = float(p.get("preco") or 0) + (info_com["custo_viagem"] or 0.0)
-
-        # ---------------- status da loja (independente da entrega) ----------------
-        horario = c.get('horario_funcionamento') or {}
-        info = horario.get(hoje) or {}
-
-        loja_status = 'sem_horario'  # padrão se não houver dados
-        try:
-            fechado = bool(info.get('fechado', False))
-            inicio_str = info.get('inicio', '').strip()
-            fim_str = info.get('fim', '').strip()
-
-            if fechado:
-                loja_status = 'fechado'
-            elif inicio_str and fim_str:
-                inicio = datetime.strptime(inicio_str, "%H:%M").time()
-                fim = datetime.strptime(fim_str, "%H:%M").time()
-                hora_atual = agora.time()
-
-                # Verifica se o horário passa da meia-noite
-                if inicio <= fim:
-                    loja_status = 'aberto' if inicio <= hora_atual <= fim else 'fechado'
-                else:
-                    loja_status = 'aberto' if hora_atual >= inicio or hora_atual <= fim else 'fechado'
-            elif not fechado and (inicio_str or fim_str):
-                loja_status = 'sem_horario'
-            else:
-                loja_status = 'sem_horario'
-        except Exception:
-            loja_status = 'sem_horario'
-
-        c["loja_status"] = loja_status
-        p["comerciante"] = c
-        filtrados.append(p)
-
-    # ---------------- ordenação ----------------
-    if ordenar_novos:
-        filtrados.sort(key=lambda x: x.get("criado_em") or datetime.utcnow().isoformat(), reverse=True)
-    elif filtro_custo:
-        filtrados.sort(key=lambda x: x.get("custo_total", float('inf')))
-    elif filtro_proximos and lat_user is not None and lon_user is not None:
-        filtrados.sort(key=lambda x: x.get("distancia") if x.get("distancia") is not None else 9999)
+    limite = min(max(request.args.get('limite', LIMITE_SUGESTOES, type=int), 1), LIMITE_MAXIMO_SUGESTOES)
+
+    catalogo = obter_catalogo()
+    if catalogo is None:
+        sugestoes = sugestoes_do_banco(supabase, q, estado, cidade, limite)
     else:
-        filtrados.sort(key=lambda x: float(x.get("preco") or 0))
+        catalogo.indice_sugestoes.garantir_popularidade(supabase)
+        with catalogo.lock:
+            sugestoes = catalogo.indice_sugestoes.sugerir(q, estado, cidade, limite)
 
-    # ---------------- JSON final ----------------
-    produtos_json = []
-    for p in filtrados:
-        c = p.get("comerciante", {})
-        produtos_json.append({
-            "id": p.get("id"),
-            "nome": p.get("nome"),
-            "marca": p.get("marca", ""),
-            "preco": float(p.get("preco") or 0),
-            "categoria": p.get("categoria", ""),
-            "descricao": p.get("descricao", ""),
-            "imagem": p.get("imagem") or "/static/img/sem-imagem.png",
-            "criado_em": p.get("criado_em"),
-            "atualizado_em": p.get("atualizado_em"),
-            "distancia": p.get("distancia"),
-            "custo_total": p.get("custo_total"),
-            "comerciante": {
-                "id": c.get("id"),
-                "nome": c.get("nome"),
-                "cidade": c.get("cidade"),
-                "estado": c.get("estado"),
-                "faz_entrega": c.get("faz_entrega", False),
-                "loja_status": c.get("loja_status", "sem_horario"),
-                "horario_funcionamento": c.get("horario_funcionamento"),
-                "latitude": c.get("latitude"),
-                "longitude": c.get("longitude")
-            }
-        })
-
-    return jsonify(produtos_json)
\ No newline at end of file
+    resp = jsonify(sugestoes)
+    resp.headers["Cache-Control"] = CACHE_CONTROL_SUGESTOES
+    return resp
+
+
+# ---------------- API FACETAS ----------------
+@consumidor_bp.route('/api/facetas')
+def api_facetas():
+    """
+    Quantos produtos ativos há por estado, cidade, categoria e entrega,
+    combinando os filtros recebidos (estado, cidade, categoria, entrega).
+    Cada faceta ignora o próprio filtro: ?estado=SP lista as cidades de SP
+    e também os outros estados.
+    """
+    catalogo = obter_catalogo()
+    if catalogo is None:
+        # sem snapshot a contagem exigiria varrer as tabelas a cada chamada
+        return jsonify({"erro": "Facetas indisponíveis sem o catálogo em memória"}), 503
+
+    with catalogo.lock:
+        facetas = catalogo.colunas.facetas(
+            estado=normaliza(request.args.get('estado', '')),
+            cidade=normaliza(request.args.get('cidade', '')),
+            categoria=normaliza(request.args.get('categoria', '')),
+            entrega=request.args.get('entrega', '').lower() == 'true',
+        )
+
+    resp = jsonify(facetas)
+    resp.headers["Cache-Control"] = CACHE_CONTROL_SUGESTOES
+    return resp
+
+
+# ---------------- API CESTA (lista de compras) ----------------
+@consumidor_bp.route('/api/cesta', methods=['POST'])
+def api_cesta():
+    """
+    Plano mais barato para uma lista de compras, somando preço e custo de
+    deslocamento, em até `max_lojas` lojas. Corpo JSON:
+    {"itens": [{"busca": "arroz 5kg", "quantidade": 2} | {"produto_id": ...}],
+     "lat", "lon", "max_lojas", "raio", "estado", "cidade", "entrega",
+     "modo", "consumo", "preco_litro", "ida_volta"}
+    """
+    catalogo = obter_catalogo()
+    if catalogo is None:
+        # sem snapshot seriam N buscas no banco por lista
+        return jsonify({"erro": "Lista de compras indisponível sem o catálogo em memória"}), 503
+
+    dados = request.get_json(silent=True) or {}
+    if not isinstance(dados, dict):
+        return jsonify({"erro": "Parâmetros inválidos"}), 400
+    try:
+        itens = itens_da_lista(dados)
+        lat, lon, raio = posicao_da_lista(dados)
+        # int(Infinity) levanta OverflowError (o JSON do Flask aceita Infinity)
+        max_lojas = int(dados.get("max_lojas", LOJAS_CESTA))
+        estado = texto_da_lista(dados, "estado")
+        cidade = texto_da_lista(dados, "cidade")
+        if dados.get("modo") is not None and not isinstance(dados["modo"], str):
+            raise ListaInvalida("Valor inválido em modo")
+        perfil = perfil_da_request(dados)
+    except ListaInvalida as e:
+        return jsonify({"erro": str(e)}), 400
+    except (TypeError, ValueError, OverflowError):
+        return jsonify({"erro": "Parâmetros inválidos"}), 400
+
+    plano = otimizar_cesta(
+        catalogo,
+        itens,
+        lat=lat,
+        lon=lon,
+        max_lojas=max_lojas,
+        raio_km=raio,
+        estado=estado,
+        cidade=cidade,
+        entrega=bool(dados.get("entrega")),
+        perfil=perfil,
+    )
+    return jsonify(plano)
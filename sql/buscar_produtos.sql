@@ -0,0 +1,105 @@
+-- =====================================================================
+-- Busca de produtos do consumidor (filtros executados no Postgres)
+-- Rodar no SQL Editor do Supabase, depois de sql/campos_normalizados.sql.
+-- =====================================================================
+
+create index if not exists idx_produtos_comerciante_preco
+    on public.produtos (comerciante_id, preco);
+
+-- versões anteriores tinham outra assinatura; evita sobrecarga ambígua no PostgREST
+drop function if exists public.buscar_produtos(text, text, text, boolean, text, double precision, double precision, integer, integer);
+drop function if exists public.buscar_produtos(text, text, text, boolean, text, double precision, double precision, integer, integer, double precision, integer);
+drop function if exists public.buscar_produtos(text, text, text, boolean, text, double precision, double precision, integer, integer, double precision, integer, jsonb);
+
+-- Retorna cada produto com o comerciante embutido em "comerciante",
+-- no mesmo formato de select("*, comerciante:comerciante_id(*)"), e a
+-- chave de ordenação em "chave_ordem" ([k1, preco, id]). Passar a chave do
+-- último item em p_apos devolve a página seguinte (paginação por cursor).
+-- k1 é o critério do modo: preco, distância, custo ou -epoch(criado_em).
+-- No modo custo, p_custo_km é o custo por km do perfil de deslocamento do
+-- consumidor (PerfilDeslocamento em utils/distancias.py; padrão 6.0 / 10).
+create or replace function public.buscar_produtos(
+    p_busca   text    default null,
+    p_estado  text    default null,
+    p_cidade  text    default null,
+    p_entrega boolean default false,
+    p_ordem   text    default 'preco',
+    p_lat     double precision default null,
+    p_lon     double precision default null,
+    p_limite  integer default 200,
+    p_offset  integer default 0,
+    p_raio_km double precision default null,
+    p_k_comerciantes integer default null,
+    p_apos    jsonb   default null,
+    p_custo_km double precision default 0.6
+)
+returns setof jsonb
+language sql
+stable
+as $$
+    with distancias as (
+        select
+            c.id as comerciante_id,
+            6372.795477598 * 2 * asin(sqrt(
+                power(sin(radians(c.latitude - p_lat) / 2), 2)
+                + cos(radians(p_lat)) * cos(radians(c.latitude))
+                * power(sin(radians(c.longitude - p_lon) / 2), 2)
+            )) as km
+        from public.comerciantes c
+        where p_lat is not null and p_lon is not null
+          and c.status = 'ativo'
+          and c.latitude is not null and c.longitude is not null
+    ),
+    proximos as (
+        -- raio e/ou k comerciantes mais próximos (só quando pedidos)
+        select d.comerciante_id, d.km
+        from distancias d
+        where p_raio_km is null or d.km <= p_raio_km
+        order by d.km
+        limit coalesce(p_k_comerciantes, 2147483647)
+    ),
+    candidatos as (
+        select
+            p.*,
+            c as c_row,
+            d.km as dist_km,
+            case p_ordem
+                when 'novos' then coalesce(-extract(epoch from p.criado_em)::double precision, 1e18)
+                when 'distancia' then coalesce(d.km, 9999)
+                when 'custo' then coalesce(p.preco, 0) + coalesce(d.km, 0) * coalesce(p_custo_km, 0.6)
+                else coalesce(p.preco, 0)
+            end as ordem_k
+        from public.produtos p
+        join public.comerciantes c on c.id = p.comerciante_id
+        left join distancias d on d.comerciante_id = c.id
+        -- p_estado/p_cidade/p_busca chegam normalizados pela aplicação e
+        -- comparam com as colunas *_norm (sql/campos_normalizados.sql)
+        where c.status = 'ativo'
+          and (coalesce(p_estado, '') = '' or c.estado_norm = p_estado)
+          and (coalesce(p_cidade, '') = '' or c.cidade_norm = p_cidade)
+          and (not coalesce(p_entrega, false) or c.faz_entrega)
+          -- substring literal, como no snapshot: \ % _ da busca não são curingas
+          -- (like escapado em vez de strpos para continuar usando o índice trigram)
+          and (
+              coalesce(p_busca, '') = ''
+              or p.nome_norm like '%' || replace(replace(replace(p_busca, '\', '\\'), '%', '\%'), '_', '\_') || '%' escape '\'
+          )
+          and (
+              (p_raio_km is null and p_k_comerciantes is null)
+              or p_lat is null or p_lon is null
+              or c.id in (select comerciante_id from proximos)
+          )
+    )
+    select to_jsonb(cand) - 'c_row' - 'dist_km' - 'ordem_k'
+        || jsonb_build_object(
+            'comerciante', to_jsonb(cand.c_row),
+            'chave_ordem', jsonb_build_array(cand.ordem_k, coalesce(cand.preco, 0), cand.id)
+        )
+    from candidatos cand
+    where p_apos is null
+       or (cand.ordem_k, coalesce(cand.preco, 0), cand.id)
+          > ((p_apos->>0)::double precision, (p_apos->>1)::numeric, (p_apos->>2)::bigint)
+    order by cand.ordem_k, coalesce(cand.preco, 0), cand.id
+    limit greatest(least(p_limite, 500), 1)
+    offset greatest(p_offset, 0);
+$$;
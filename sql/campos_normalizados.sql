@@ -0,0 +1,24 @@
+-- =====================================================================
+-- Campos normalizados (minúsculo, sem acento) gravados pela aplicação
+-- Rodar no SQL Editor do Supabase e depois: python backfill_normalizados.py
+-- =====================================================================
+
+create extension if not exists pg_trgm;
+
+alter table public.produtos add column if not exists nome_norm text;
+alter table public.produtos add column if not exists marca_norm text;
+alter table public.comerciantes add column if not exists cidade_norm text;
+alter table public.comerciantes add column if not exists estado_norm text;
+
+create index if not exists idx_comerciantes_local_norm
+    on public.comerciantes (estado_norm, cidade_norm)
+    where status = 'ativo';
+
+create index if not exists idx_produtos_nome_norm_trgm
+    on public.produtos using gin (nome_norm gin_trgm_ops);
+
+create index if not exists idx_produtos_marca_norm
+    on public.produtos (marca_norm);
+
+-- substitui o índice por unaccent() da primeira versão de buscar_produtos
+drop index if exists public.idx_comerciantes_busca_local;
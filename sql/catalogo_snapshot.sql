@@ -0,0 +1,69 @@
+-- =====================================================================
+-- Suporte ao snapshot do catálogo em memória (utils/catalogo.py)
+-- Rodar no SQL Editor do Supabase.
+-- =====================================================================
+
+-- atualizado_em sempre definido pelo banco, em toda alteração
+alter table public.comerciantes add column if not exists atualizado_em timestamptz default now();
+
+-- clock_timestamp() e não now(): now() é o início da transação, e uma
+-- transação longa ficaria com atualizado_em bem antes do commit (o snapshot
+-- ainda relê SOBREPOSICAO_MARCA segundos antes da marca, utils/catalogo.py)
+create or replace function public.tocar_atualizado_em()
+returns trigger
+language plpgsql
+as $$
+begin
+    new.atualizado_em := clock_timestamp();
+    return new;
+end;
+$$;
+
+drop trigger if exists trg_produtos_atualizado_em on public.produtos;
+create trigger trg_produtos_atualizado_em
+    before insert or update on public.produtos
+    for each row execute function public.tocar_atualizado_em();
+
+drop trigger if exists trg_comerciantes_atualizado_em on public.comerciantes;
+create trigger trg_comerciantes_atualizado_em
+    before insert or update on public.comerciantes
+    for each row execute function public.tocar_atualizado_em();
+
+create index if not exists idx_produtos_atualizado_em on public.produtos (atualizado_em);
+create index if not exists idx_comerciantes_atualizado_em on public.comerciantes (atualizado_em);
+
+-- Lápides: o snapshot só enxerga exclusões por esta tabela
+create table if not exists public.catalogo_exclusoes (
+    id bigserial primary key,
+    tabela text not null,
+    registro_id text not null,
+    excluido_em timestamptz not null default clock_timestamp()
+);
+
+alter table public.catalogo_exclusoes alter column excluido_em set default clock_timestamp();
+
+create index if not exists idx_catalogo_exclusoes_excluido_em on public.catalogo_exclusoes (excluido_em);
+
+create or replace function public.registrar_exclusao()
+returns trigger
+language plpgsql
+as $$
+begin
+    insert into public.catalogo_exclusoes (tabela, registro_id)
+    values (tg_table_name, old.id::text);
+    return old;
+end;
+$$;
+
+drop trigger if exists trg_produtos_exclusao on public.produtos;
+create trigger trg_produtos_exclusao
+    after delete on public.produtos
+    for each row execute function public.registrar_exclusao();
+
+drop trigger if exists trg_comerciantes_exclusao on public.comerciantes;
+create trigger trg_comerciantes_exclusao
+    after delete on public.comerciantes
+    for each row execute function public.registrar_exclusao();
+
+-- Lápides antigas podem ser apagadas depois que todos os workers passaram por elas
+-- delete from public.catalogo_exclusoes where excluido_em < now() - interval '7 days';
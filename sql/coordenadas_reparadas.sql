@@ -0,0 +1,11 @@
+-- Colunas de auditoria do reparo de coordenadas dos comerciantes
+-- (reparar_coordenadas.py e gravação do perfil em /comerciante/editar).
+--
+-- coordenadas_motivo: interpretação escolhida (orig, swap, neg_lat, neg_lon,
+-- neg_both) ou por que não há coordenada (missing, invalid_range, absurdo,
+-- sem_referencia). As originais ficam guardadas para desfazer o reparo.
+
+alter table comerciantes add column if not exists coordenadas_motivo text;
+alter table comerciantes add column if not exists latitude_original double precision;
+alter table comerciantes add column if not exists longitude_original double precision;
+alter table comerciantes add column if not exists coordenadas_reparadas_em timestamptz;
@@ -0,0 +1,20 @@
+-- Cache persistente de distâncias por estrada (utils/rotas.py).
+--
+-- Uma linha por (célula da origem, comerciante). A célula é floor(lat/0.01),
+-- floor(lon/0.01) da posição do consumidor; a rota é calculada a partir do
+-- centro da célula. As coordenadas do comerciante usadas no cálculo ficam
+-- gravadas: se ele mudar de endereço, a linha é ignorada e recalculada.
+
+create table if not exists distancias_rota (
+    celula_lat integer not null,
+    celula_lon integer not null,
+    comerciante_id text not null,  -- mesmo formato de catalogo_exclusoes.registro_id
+    distancia_km double precision not null,
+    comerciante_lat double precision not null,
+    comerciante_lon double precision not null,
+    calculado_em timestamptz not null default now(),
+    primary key (celula_lat, celula_lon, comerciante_id)
+);
+
+-- limpeza de linhas antigas, se quiser rodar de tempos em tempos:
+-- delete from distancias_rota where calculado_em < now() - interval '90 days';
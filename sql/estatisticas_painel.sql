@@ -0,0 +1,29 @@
+-- =====================================================================
+-- Contadores do painel do admin (utils/estatisticas_painel.py)
+-- Rodar no SQL Editor do Supabase.
+-- =====================================================================
+
+-- Um jsonb com todos os contadores do /admin/dashboard numa chamada só;
+-- comerciantes é lido uma vez e os três contadores saem de count(*) filter.
+create or replace function public.estatisticas_painel()
+returns jsonb
+language sql
+stable
+as $$
+    select jsonb_build_object(
+        'total_comerciantes', c.total,
+        'aprovados', c.aprovados,
+        'bloqueados', c.bloqueados,
+        'pendentes', (select count(*) from public.comerciantes_pendentes),
+        'total_produtos', (select count(*) from public.produtos),
+        'total_pesquisas', (select count(*) from public.pesquisas),
+        'total_acessos', (select count(*) from public.historico_comerciantes)
+    )
+    from (
+        select
+            count(*) as total,
+            count(*) filter (where status = 'ativo') as aprovados,
+            count(*) filter (where status = 'bloqueado') as bloqueados
+        from public.comerciantes
+    ) c;
+$$;
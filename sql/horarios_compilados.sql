@@ -0,0 +1,12 @@
+-- =====================================================================
+-- Horário de funcionamento compilado (utils/horarios.py)
+-- Rodar no SQL Editor do Supabase.
+-- =====================================================================
+
+-- {"intervalos": [[inicio, fim], ...], "sem_horario": [dias]} em minutos
+-- da semana (0 = segunda 00:00), gravado junto com horario_funcionamento
+-- em /comerciante/editar. Linhas antigas sem ele são compiladas em memória.
+alter table public.comerciantes add column if not exists horario_compilado jsonb;
+
+-- fuso IANA derivado do estado (ex.: America/Manaus)
+alter table public.comerciantes add column if not exists fuso_horario text;
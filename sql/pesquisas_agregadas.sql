@@ -0,0 +1,66 @@
+-- =====================================================================
+-- Telemetria de pesquisas/cliques gravada em lote (utils/telemetria.py)
+-- Rodar no SQL Editor do Supabase.
+-- =====================================================================
+
+-- junta as linhas repetidas de (termo, produto_id) antes do índice único
+with somas as (
+    select
+        min(id) as manter,
+        termo,
+        produto_id,
+        sum(coalesce(qtd_pesquisas, 0)) as qtd_pesquisas,
+        sum(coalesce(qtd_cliques, 0)) as qtd_cliques,
+        max(ultima_pesquisa) as ultima_pesquisa
+    from public.pesquisas
+    group by termo, produto_id
+    having count(*) > 1
+)
+update public.pesquisas p
+set qtd_pesquisas = s.qtd_pesquisas,
+    qtd_cliques = s.qtd_cliques,
+    ultima_pesquisa = s.ultima_pesquisa
+from somas s
+where p.id = s.manter;
+
+delete from public.pesquisas p
+using public.pesquisas q
+where p.termo = q.termo
+  and p.produto_id = q.produto_id
+  and p.id > q.id;
+
+create unique index if not exists idx_pesquisas_termo_produto
+    on public.pesquisas (termo, produto_id);
+
+-- Recebe um array de eventos já agregados:
+-- [{"termo", "produto_id", "produto_nome", "comerciante_id", "comerciante_nome",
+--   "cidade", "estado", "tipo", "qtd_pesquisas", "qtd_cliques"}, ...]
+-- e soma os contadores na mesma instrução (sem ler antes de gravar).
+create or replace function public.registrar_pesquisas(p_eventos jsonb)
+returns void
+language sql
+as $$
+    insert into public.pesquisas as p (
+        termo, produto_id, produto_nome, comerciante_id, comerciante_nome,
+        cidade, estado, tipo, qtd_pesquisas, qtd_cliques, criado_em, ultima_pesquisa
+    )
+    -- jsonb_populate_recordset devolve as colunas já com os tipos da tabela
+    select
+        e.termo,
+        e.produto_id,
+        e.produto_nome,
+        e.comerciante_id,
+        e.comerciante_nome,
+        e.cidade,
+        e.estado,
+        e.tipo,
+        coalesce(e.qtd_pesquisas, 0),
+        coalesce(e.qtd_cliques, 0),
+        now(),
+        now()
+    from jsonb_populate_recordset(null::public.pesquisas, p_eventos) e
+    on conflict (termo, produto_id) do update
+    set qtd_pesquisas = coalesce(p.qtd_pesquisas, 0) + excluded.qtd_pesquisas,
+        qtd_cliques = coalesce(p.qtd_cliques, 0) + excluded.qtd_cliques,
+        ultima_pesquisa = now();
+$$;
@@ -0,0 +1,103 @@
+# utils/agrupamento.py
+# Agrupa o mesmo item vendido por comerciantes diferentes (nome + marca +
+# unidade de medida normalizados) para comparar ofertas: "preço mais barato"
+# de cada produto em vez de uma linha por loja.
+#
+# IndiceGrupos acompanha o snapshot (utils/catalogo.py) pelo protocolo
+# adicionar/remover/limpar; cada grupo guarda as ofertas já ordenadas por
+# preço, então as N mais baratas saem sem ordenar nada na request. Edições,
+# importações e atualizações de preço chegam pelas notificações de escrita
+# (notificar_produtos_alterados), como nos outros índices.
+import bisect
+
+from utils.normalizacao import normaliza, campo_normalizado
+
+OFERTAS_PADRAO = 3
+OFERTAS_MAXIMO = 20
+
+
+def chave_grupo(produto):
+    return (
+        campo_normalizado(produto, "nome"),
+        campo_normalizado(produto, "marca"),
+        normaliza(produto.get("unidade_medida") or "unidade"),
+    )
+
+
+def ofertas_da_request(args):
+    """Lê ?ofertas= (N mais baratas por grupo) da querystring."""
+    ofertas = args.get("ofertas", OFERTAS_PADRAO, type=int)
+    return min(max(ofertas, 1), OFERTAS_MAXIMO)
+
+
+class IndiceGrupos:
+    def __init__(self):
+        self.grupos = {}  # chave -> [(preco, produto_id)] ordenada
+        self._do_produto = {}  # produto_id -> (chave, preco)
+
+    def __len__(self):
+        return len(self.grupos)
+
+    # ---------------- manutenção ----------------
+    def adicionar(self, pid, produto):
+        pid = str(pid)
+        self.remover(pid)
+        chave = chave_grupo(produto)
+        if not chave[0]:
+            return
+        preco = float(produto.get("preco") or 0)
+        bisect.insort(self.grupos.setdefault(chave, []), (preco, pid))
+        self._do_produto[pid] = (chave, preco)
+
+    def remover(self, pid, produto=None):
+        anterior = self._do_produto.pop(str(pid), None)
+        if anterior is None:
+            return
+        chave, preco = anterior
+        ofertas = self.grupos[chave]
+        i = bisect.bisect_left(ofertas, (preco, str(pid)))
+        if i < len(ofertas) and ofertas[i] == (preco, str(pid)):
+            del ofertas[i]
+        if not ofertas:
+            del self.grupos[chave]
+
+    def limpar(self):
+        self.__init__()
+
+    # ---------------- consulta ----------------
+    def chave_do_produto(self, pid):
+        anterior = self._do_produto.get(str(pid))
+        return anterior[0] if anterior else None
+
+    def ofertas(self, chave, n, aceita=None):
+        """
+        (ids das n ofertas mais baratas que passam em `aceita(pid)`, total
+        de ofertas que passam). Chamar com o lock do catálogo.
+        """
+        escolhidas = []
+        total = 0
+        for _, pid in self.grupos.get(chave, ()):
+            if aceita is not None and not aceita(pid):
+                continue
+            total += 1
+            if len(escolhidas) < n:
+                escolhidas.append(pid)
+        return escolhidas, total
+
+
+def agrupar_pagina(produtos, n, aceita=None):
+    """
+    Sem snapshot: agrupa só os produtos da página (a RPC não devolve as
+    ofertas de fora dela). Mesmo formato de ofertas_agrupadas; com
+    `aceita(produto)`, só os que passam entram nas ofertas e no total.
+    """
+    grupos = {}
+    for p in produtos:
+        if aceita is not None and not aceita(p):
+            continue
+        grupos.setdefault(chave_grupo(p), []).append(p)
+    resultado = []
+    for chave, ofertas in grupos.items():
+        ofertas.sort(key=lambda o: (float(o.get("preco") or 0), str(o.get("id"))))
+        resultado.append({"chave": chave, "ofertas": ofertas[:n], "total_ofertas": len(ofertas)})
+    return resultado
@@ -0,0 +1,128 @@
+# utils/busca_aproximada.py
+# Busca tolerante a erros de digitação ("refrigernte"), abreviações
+# ("refri") e acentos, usada quando a busca exata não acha nada.
+#
+# Vocabulário = palavras dos nomes normalizados do snapshot. Cada palavra
+# é indexada pelos trigramas dela com bordas ("  refri " -> "  r", " re",
+# "ref", ...); uma palavra da consulta é comparada só com as palavras que
+# dividem algum trigrama com ela (similaridade de Jaccard) ou que começam
+# com ela. O produto precisa ter, para cada palavra da consulta, alguma
+# palavra parecida. Tudo com prazo: estourou, desiste e fica a busca exata.
+import time
+
+from utils.normalizacao import campo_normalizado, normaliza
+
+PRAZO_PADRAO_MS = 25
+SIMILARIDADE_MINIMA = 0.4
+MIN_PREFIXO = 3  # "refri" -> "refrigerante"; prefixos menores casam demais
+MAX_VARIANTES = 8  # palavras do vocabulário aceitas por palavra da consulta
+SIMILARIDADE_PREFIXO = 0.9
+
+
+def trigramas_palavra(palavra):
+    texto = f"  {palavra} "
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+class PrazoEsgotado(Exception):
+    pass
+
+
+class IndiceVocabulario:
+    def __init__(self):
+        self.produtos_por_palavra = {}  # palavra -> {produto_ids}
+        self.palavras_por_trigrama = {}  # trigrama -> {palavras}
+        self._palavras_do_produto = {}  # produto_id -> palavras
+
+    def __len__(self):
+        return len(self.produtos_por_palavra)
+
+    # ---------------- manutenção ----------------
+    def adicionar(self, pid, produto):
+        pid = str(pid)
+        if pid in self._palavras_do_produto:
+            self.remover(pid)
+        palavras = frozenset(campo_normalizado(produto, "nome").split())
+        self._palavras_do_produto[pid] = palavras
+        for palavra in palavras:
+            produtos = self.produtos_por_palavra.get(palavra)
+            if produtos is None:
+                produtos = self.produtos_por_palavra[palavra] = set()
+                for tri in trigramas_palavra(palavra):
+                    self.palavras_por_trigrama.setdefault(tri, set()).add(palavra)
+            produtos.add(pid)
+
+    def remover(self, pid, produto=None):
+        palavras = self._palavras_do_produto.pop(str(pid), None)
+        if palavras is None:
+            return
+        for palavra in palavras:
+            produtos = self.produtos_por_palavra.get(palavra)
+            if produtos is None:
+                continue
+            produtos.discard(str(pid))
+            if not produtos:
+                del self.produtos_por_palavra[palavra]
+                for tri in trigramas_palavra(palavra):
+                    membros = self.palavras_por_trigrama.get(tri)
+                    if membros is not None:
+                        membros.discard(palavra)
+                        if not membros:
+                            del self.palavras_por_trigrama[tri]
+
+    def limpar(self):
+        self.__init__()
+
+    # ---------------- consulta ----------------
+    def variantes(self, palavra, limite_tempo=None):
+        """[(similaridade, palavra do vocabulário)] mais parecidas, melhores primeiro."""
+        if palavra in self.produtos_por_palavra:
+            return [(1.0, palavra)]
+        if len(palavra) < MIN_PREFIXO:
+            return []  # "de", "kg": só valem exatas
+
+        tris = trigramas_palavra(palavra)
+        comuns = {}  # palavra do vocabulário -> trigramas em comum
+        for tri in tris:
+            for outra in self.palavras_por_trigrama.get(tri, ()):
+                comuns[outra] = comuns.get(outra, 0) + 1
+            if limite_tempo is not None and time.perf_counter() > limite_tempo:
+                raise PrazoEsgotado()
+
+        encontradas = []
+        for outra, n in comuns.items():
+            if outra.startswith(palavra):
+                encontradas.append((SIMILARIDADE_PREFIXO, outra))
+                continue
+            # número de trigramas de "outra" com bordas = len + 1
+            similaridade = n / (len(tris) + len(outra) + 1 - n)
+            if similaridade >= SIMILARIDADE_MINIMA:
+                encontradas.append((similaridade, outra))
+        encontradas.sort(key=lambda item: (-item[0], item[1]))
+        return encontradas[:MAX_VARIANTES]
+
+    def buscar(self, consulta, prazo_ms=PRAZO_PADRAO_MS):
+        """
+        Conjunto de ids de produto parecidos com `consulta`, ou None se o
+        prazo acabar (quem chama fica com o resultado exato).
+        """
+        limite_tempo = time.perf_counter() + prazo_ms / 1000
+        palavras = normaliza(consulta).split()
+        if not palavras:
+            return None
+
+        ids = None
+        try:
+            # palavras mais longas primeiro: costumam ser as mais seletivas
+            for palavra in sorted(set(palavras), key=len, reverse=True):
+                achados = set()
+                for _, outra in self.variantes(palavra, limite_tempo):
+                    achados |= self.produtos_por_palavra[outra]
+                ids = achados if ids is None else ids & achados
+                if not ids:
+                    return set()
+                if time.perf_counter() > limite_tempo:
+                    raise PrazoEsgotado()
+        except PrazoEsgotado:
+            return None
+        return ids
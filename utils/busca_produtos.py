@@ -0,0 +1,413 @@
+# utils/busca_produtos.py
+# Busca de produtos do consumidor com os filtros executados no Postgres
+# (função RPC "buscar_produtos", definida em sql/buscar_produtos.sql)
+# ou, quando o snapshot do catálogo está carregado, direto da memória.
+#
+# Os dois caminhos ordenam pela mesma chave [k1, preco, id] (ver
+# chave_ordenacao) e devolvem essa chave em "chave_ordem": o cursor da
+# próxima página é a chave do último item (paginação por keyset).
+import base64
+import hashlib
+import heapq
+import json
+from datetime import datetime, timezone
+
+from utils.normalizacao import normaliza, campo_normalizado
+from utils.distancias import PERFIL_PADRAO
+from utils.agrupamento import chave_grupo
+
+LIMITE_PADRAO = 200
+LIMITE_MAXIMO = 500
+DISTANCIA_DESCONHECIDA = 9999
+SEM_DATA = 1e18  # "novos": produtos sem criado_em vão para o fim
+
+
+def ordem_da_busca(ordenar_novos=False, filtro_custo=False, filtro_proximos=False, tem_localizacao=False):
+    """Traduz as flags da tela do consumidor para o parâmetro p_ordem da RPC."""
+    if ordenar_novos:
+        return "novos"
+    if filtro_custo and tem_localizacao:
+        return "custo"
+    if filtro_proximos and tem_localizacao:
+        return "distancia"
+    return "preco"
+
+
+def proximidade_da_request(args):
+    """Lê raio (km) e k (comerciantes mais próximos) da querystring."""
+    raio_km = args.get("raio", type=float)
+    k_comerciantes = args.get("k", type=int)
+    if raio_km is not None and raio_km <= 0:
+        raio_km = None
+    if k_comerciantes is not None and k_comerciantes <= 0:
+        k_comerciantes = None
+    return raio_km, k_comerciantes
+
+
+def paginacao_da_request(args):
+    """Lê offset/limite da querystring no mesmo padrão da API do comerciante."""
+    try:
+        offset = max(int(args.get("offset", 0)), 0)
+    except (TypeError, ValueError):
+        offset = 0
+    try:
+        limite = min(max(int(args.get("limite", LIMITE_PADRAO)), 1), LIMITE_MAXIMO)
+    except (TypeError, ValueError):
+        limite = LIMITE_PADRAO
+    return offset, limite
+
+
+def instante(valor):
+    """criado_em (ISO do PostgREST) em segundos desde a época, ou None."""
+    if not valor:
+        return None
+    try:
+        dt = datetime.fromisoformat(str(valor).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def chave_ordenacao(ordem, produto, distancia=None, perfil=PERFIL_PADRAO):
+    """
+    Chave crescente (k1, preco, id) de cada modo, igual à ordem_k da RPC:
+    preco, distância (9999 sem coordenada), preço + custo de deslocamento
+    no `perfil` do consumidor, ou -epoch(criado_em) para "novos".
+    """
+    preco = float(produto.get("preco") or 0)
+    if ordem == "novos":
+        criado = instante(produto.get("criado_em"))
+        k1 = -criado if criado is not None else SEM_DATA
+    elif ordem == "distancia":
+        k1 = distancia if distancia is not None else DISTANCIA_DESCONHECIDA
+    elif ordem == "custo":
+        k1 = preco + perfil.custo(distancia)
+    else:
+        k1 = preco
+    return (k1, preco, produto.get("id"))
+
+
+def codificar_cursor(ordem, chave, aproximada=False):
+    dados = {"o": ordem, "k": list(chave)}
+    if aproximada:
+        dados["a"] = 1  # a página veio da busca aproximada: as próximas também
+    texto = json.dumps(dados, separators=(",", ":"))
+    return base64.urlsafe_b64encode(texto.encode()).decode().rstrip("=")
+
+
+def _ler_cursor(cursor):
+    try:
+        texto = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        return json.loads(texto)
+    except Exception:
+        raise ValueError("cursor inválido")
+
+
+def decodificar_cursor(cursor, ordem):
+    """
+    Chave (k1, preco, id) guardada no cursor, ou None sem cursor.
+    ValueError se o cursor for inválido ou de outro modo de ordenação.
+    """
+    if not cursor:
+        return None
+    dados = _ler_cursor(cursor)
+    try:
+        k1, preco, pid = dados["k"]
+        chave = (float(k1), float(preco), pid)
+    except Exception:
+        raise ValueError("cursor inválido")
+    if dados.get("o") != ordem:
+        raise ValueError("cursor de outra ordenação")
+    return chave
+
+
+def cursor_aproximado(cursor):
+    """True se o cursor continua uma busca aproximada (ver codificar_cursor)."""
+    if not cursor:
+        return False
+    return bool(_ler_cursor(cursor).get("a"))
+
+
+# parâmetros que mudam a resposta de /consumidor/api/produtos
+PARAMETROS_TEXTO = ("busca", "estado", "cidade", "modo")
+PARAMETROS_FLAG = ("entrega", "proximos", "custo", "novos", "aberta", "fechando", "agrupar", "ida_volta")
+PARAMETROS_NUMERO = ("lat", "lon", "raio", "k", "offset", "limite", "ofertas", "consumo", "preco_litro")
+
+
+def busca_canonica(args):
+    """
+    Forma canônica da querystring da busca: textos normalizados (caixa,
+    acentos), flags como bool, números como float, sem parâmetros
+    estranhos e em ordem fixa. Buscas equivalentes dão o mesmo resultado.
+    """
+    canonica = {}
+    for nome in PARAMETROS_TEXTO:
+        canonica[nome] = normaliza(args.get(nome, ""))
+    for nome in PARAMETROS_FLAG:
+        canonica[nome] = args.get(nome, "").lower() == "true"
+    for nome in PARAMETROS_NUMERO:
+        canonica[nome] = args.get(nome, type=float)
+    canonica["cursor"] = args.get("cursor") or None
+    canonica["formato"] = (args.get("formato") or "json").lower()
+    return canonica
+
+
+def etag_da_busca(catalogo, args, agora, fonte_distancia=None):
+    """
+    ETag da resposta: versão do snapshot + busca canônica + minuto atual
+    (o status aberto/fechado das lojas depende da hora) + fonte das
+    distâncias (por estrada ou linha reta, quando o roteador falha). Sem
+    snapshot não há versão a comparar e a resposta sai sem ETag.
+    """
+    if catalogo is None:
+        return None
+    base = json.dumps(
+        [catalogo.instancia, catalogo.versao, agora.strftime("%Y%m%d%H%M"), busca_canonica(args), fonte_distancia],
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha1(base.encode()).hexdigest()
+
+
+def buscar_produtos_db(
+    supabase,
+    busca="",
+    estado="",
+    cidade="",
+    entrega=False,
+    ordem="preco",
+    lat=None,
+    lon=None,
+    limite=LIMITE_PADRAO,
+    offset=0,
+    raio_km=None,
+    k_comerciantes=None,
+    apos=None,
+    perfil=PERFIL_PADRAO,
+):
+    """
+    Retorna somente os produtos que passam nos filtros, já paginados.
+    Cada item vem com o comerciante embutido em "comerciante", no mesmo
+    formato de select("*, comerciante:comerciante_id(*)"), e com "chave_ordem".
+    `apos` é a chave_ordem do último item da página anterior; `perfil`
+    (utils/distancias.py) dá o custo por km da ordem "custo".
+    """
+    params = {
+        "p_busca": busca or None,
+        "p_estado": estado or None,
+        "p_cidade": cidade or None,
+        "p_entrega": bool(entrega),
+        "p_ordem": ordem,
+        "p_lat": lat,
+        "p_lon": lon,
+        "p_limite": limite,
+        "p_offset": offset,
+        "p_raio_km": raio_km,
+        "p_k_comerciantes": k_comerciantes,
+        "p_apos": list(apos) if apos else None,
+        "p_custo_km": perfil.custo_por_km,
+    }
+    resp = supabase.rpc("buscar_produtos", params).execute()
+    return resp.data or []
+
+
+def _comerciante_passa(c, estado, cidade, entrega, permitidos=None):
+    if c is None or c.get("status") != "ativo":
+        return False
+    if permitidos is not None and str(c.get("id")) not in permitidos:
+        return False
+    if estado and campo_normalizado(c, "estado") != estado:
+        return False
+    if cidade and campo_normalizado(c, "cidade") != cidade:
+        return False
+    if entrega and not c.get("faz_entrega", False):
+        return False
+    return True
+
+
+def _produtos_do_comerciante(catalogo, cid, ids):
+    pids = catalogo.produtos_por_comerciante.get(cid, ())
+    if ids is not None:
+        pids = [pid for pid in pids if pid in ids]
+    return [catalogo.produtos[pid] for pid in pids if pid in catalogo.produtos]
+
+
+def _chave(item):
+    return item[0]
+
+
+def _pagina(encontrados, offset, limite):
+    """
+    encontrados: lista de (chave, produto, comerciante), fora de ordem.
+    Seleciona só os offset + limite menores com um heap limitado em vez de
+    ordenar tudo; as chaves são únicas (terminam no id), então a janela é
+    a mesma de uma ordenação completa.
+    """
+    janela = heapq.nsmallest(offset + limite, encontrados, key=_chave)
+    pagina = []
+    for chave, p, c in janela[offset:]:
+        item = dict(p)
+        item["comerciante"] = dict(c)
+        item["chave_ordem"] = list(chave)
+        pagina.append(item)
+    return pagina
+
+
+def _buscar_por_proximidade(catalogo, ids, estado, cidade, entrega, lat, lon, limite, offset, apos=None, permitidos=None):
+    """
+    Ordem "distancia" sem raio/k: percorre os comerciantes do mais próximo
+    para o mais distante pelo índice espacial e para assim que a janela
+    pedida não pode mais mudar.
+    """
+    necessarios = offset + limite
+    encontrados = []
+
+    with catalogo.lock:
+        for d, cid in catalogo.indice_espacial.por_proximidade(lat, lon):
+            if len(encontrados) >= necessarios and d > encontrados[necessarios - 1][0][0]:
+                break
+            if apos and d < apos[0]:
+                continue
+            c = catalogo.comerciantes.get(cid)
+            if not _comerciante_passa(c, estado, cidade, entrega, permitidos):
+                continue
+            for p in _produtos_do_comerciante(catalogo, cid, ids):
+                chave = chave_ordenacao("distancia", p, d)
+                if apos is None or chave > apos:
+                    encontrados.append((chave, p, c))
+
+        if len(encontrados) < necessarios:
+            # comerciantes sem coordenada válida vão para o fim (distância 9999)
+            geolocalizados = catalogo.indice_espacial.posicoes
+            for cid, c in catalogo.comerciantes.items():
+                if cid in geolocalizados or not _comerciante_passa(c, estado, cidade, entrega, permitidos):
+                    continue
+                for p in _produtos_do_comerciante(catalogo, cid, ids):
+                    chave = chave_ordenacao("distancia", p, None)
+                    if apos is None or chave > apos:
+                        encontrados.append((chave, p, c))
+
+    return _pagina(encontrados, offset, limite)
+
+
+def buscar_produtos_catalogo(
+    catalogo,
+    busca="",
+    estado="",
+    cidade="",
+    entrega=False,
+    ordem="preco",
+    lat=None,
+    lon=None,
+    limite=LIMITE_PADRAO,
+    offset=0,
+    raio_km=None,
+    k_comerciantes=None,
+    apos=None,
+    permitidos=None,
+    aproximada=False,
+    perfil=PERFIL_PADRAO,
+):
+    """
+    Mesma semântica de buscar_produtos_db, mas servida do snapshot em memória
+    (utils/catalogo.py). Os itens devolvidos são cópias: podem ser alterados.
+
+    Com aproximada=True, `busca` casa também com erros de digitação e
+    abreviações (utils/busca_aproximada.py); se o prazo da busca aproximada
+    acabar, vale a busca exata.
+
+    `permitidos` (conjunto de ids de comerciante) restringe a busca, por
+    exemplo às lojas abertas agora (catalogo.indice_horarios.abertos).
+
+    Com localização, raio_km e/ou k_comerciantes restringem a busca aos
+    comerciantes devolvidos pelo índice espacial.
+    """
+    tem_localizacao = lat is not None and lon is not None
+
+    with catalogo.lock:
+        # candidatos pelo índice de trigramas; dispensa o filtro de nome
+        ids = None
+        if busca and aproximada:
+            ids = catalogo.indice_vocabulario.buscar(busca)
+        if busca and ids is None:
+            ids = catalogo.indice_nomes.buscar(busca)
+
+        distancias = None  # comerciante_id -> km, vindas do índice espacial
+        if tem_localizacao and k_comerciantes:
+            distancias = catalogo.indice_espacial.mais_proximos(lat, lon, k_comerciantes, raio_max_km=raio_km)
+        elif tem_localizacao and raio_km:
+            distancias = catalogo.indice_espacial.dentro_do_raio(lat, lon, raio_km)
+        elif tem_localizacao and ordem == "distancia":
+            return _buscar_por_proximidade(catalogo, ids, estado, cidade, entrega, lat, lon, limite, offset, apos, permitidos)
+
+        # filtros e chave calculados nas colunas NumPy (utils/colunas_catalogo.py);
+        # só a janela pedida volta como dicts
+        janela = catalogo.colunas.janela(
+            ordem,
+            offset + limite,
+            ids=ids,
+            estado=estado,
+            cidade=cidade,
+            entrega=entrega,
+            permitidos=permitidos,
+            lat=lat if tem_localizacao else None,
+            lon=lon if tem_localizacao else None,
+            distancias=distancias,
+            apos=apos,
+            perfil=perfil,
+        )
+        encontrados = []
+        for chave, pid in janela:
+            p = catalogo.produtos[pid]
+            encontrados.append((chave, p, catalogo.comerciantes[str(p.get("comerciante_id"))]))
+
+    return _pagina(encontrados, offset, limite)
+
+
+def ofertas_agrupadas(catalogo, produtos, n, estado="", cidade="", entrega=False, permitidos=None):
+    """
+    Grupos (utils/agrupamento.py) dos produtos da página, na ordem em que
+    aparecem, cada um com as n ofertas mais baratas do snapshot que passam
+    nos mesmos filtros de comerciante:
+    [{"chave", "ofertas": [produto com "comerciante"], "total_ofertas"}].
+    As ofertas são cópias, como os itens de _pagina.
+    """
+    def aceita(pid):
+        p = catalogo.produtos.get(pid)
+        if p is None:
+            return False
+        c = catalogo.comerciantes.get(str(p.get("comerciante_id")))
+        return _comerciante_passa(c, estado, cidade, entrega, permitidos)
+
+    grupos = []
+    vistos = set()
+    with catalogo.lock:
+        for item in produtos:
+            chave = catalogo.indice_grupos.chave_do_produto(item.get("id")) or chave_grupo(item)
+            if chave in vistos:
+                continue
+            vistos.add(chave)
+            ids, total = catalogo.indice_grupos.ofertas(chave, n, aceita)
+            ofertas = []
+            for pid in ids:
+                p = catalogo.produtos[pid]
+                oferta = dict(p)
+                oferta["comerciante"] = dict(catalogo.comerciantes[str(p.get("comerciante_id"))])
+                ofertas.append(oferta)
+            grupos.append({"chave": chave, "ofertas": ofertas, "total_ofertas": total})
+    return grupos
+
+
+def buscar_produtos(supabase, catalogo, **filtros):
+    """
+    Usa o snapshot em memória quando disponível; senão, a RPC no banco.
+    A RPC não conhece `permitidos` (quem chama filtra a página depois) nem
+    a busca aproximada (fica a exata).
+    """
+    if catalogo is not None:
+        return buscar_produtos_catalogo(catalogo, **filtros)
+    filtros.pop("permitidos", None)
+    filtros.pop("aproximada", None)
+    return buscar_produtos_db(supabase, **filtros)
@@ -0,0 +1,426 @@
+# utils/catalogo.py
+# Snapshot em memória do catálogo (produtos + comerciantes), um por worker.
+#
+# Carrega tudo uma vez e depois busca só as linhas com atualizado_em maior
+# que a última marca d'água, mais as exclusões registradas em
+# catalogo_exclusoes (ver sql/catalogo_snapshot.sql).
+#
+# A releitura começa SOBREPOSICAO_MARCA segundos antes da marca: uma
+# transação que demora grava atualizado_em antes de ficar visível, e a marca
+# pode já ter passado dela quando o commit sai. Reaplicar linhas iguais não
+# muda nada (nem a versão).
+#
+# Passada a idade máxima, a releitura roda numa thread e as buscas seguem
+# na versão atual; só a primeira carga do worker é feita na própria request.
+#
+# Se a leitura falhar, a próxima tentativa espera ESPERA_MIN_APOS_ERRO
+# segundos, dobrando a cada falha seguida até ESPERA_MAX_APOS_ERRO; enquanto
+# isso as buscas usam o snapshot atual (ou a RPC, se ele nunca carregou).
+import threading
+import time
+import traceback
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app
+
+from utils.indice_trigramas import IndiceTrigramas
+from utils.indice_espacial import IndiceEspacial
+from utils.horarios import IndiceHorarios
+from utils.colunas_catalogo import ColunasCatalogo
+from utils.sugestoes import IndiceSugestoes
+from utils.busca_aproximada import IndiceVocabulario
+from utils.agrupamento import IndiceGrupos
+from utils.estatisticas_painel import invalidar_estatisticas_painel
+
+TAMANHO_PAGINA = 1000  # limite padrão de linhas por requisição do PostgREST
+MAX_IDADE_PADRAO = 60  # segundos
+SOBREPOSICAO_MARCA = 15  # segundos relidos antes da marca d'água
+ESPERA_MIN_APOS_ERRO = 1  # segundos
+ESPERA_MAX_APOS_ERRO = 60  # segundos
+
+
+class CatalogoSnapshot:
+    def __init__(self, supabase, max_idade=MAX_IDADE_PADRAO):
+        self.supabase = supabase
+        self.max_idade = max_idade
+        self.lock = threading.RLock()
+
+        self.produtos = {}  # id -> linha de produtos
+        self.comerciantes = {}  # id -> linha de comerciantes
+        self.produtos_por_comerciante = {}  # comerciante_id -> {ids}
+
+        # índices derivados dos produtos: recebem adicionar(pid, produto)
+        # e remover(pid, produto) a cada alteração aplicada
+        self.indice_nomes = IndiceTrigramas()
+        # palavras dos nomes, para a busca tolerante a erros de digitação
+        self.indice_vocabulario = IndiceVocabulario()
+        # colunas NumPy para filtro/ordenação; também acompanham os comerciantes
+        self.colunas = ColunasCatalogo()
+        # nomes ordenados para o autocomplete; também acompanha os comerciantes
+        self.indice_sugestoes = IndiceSugestoes()
+        # mesmo item em lojas diferentes, ofertas ordenadas por preço
+        self.indice_grupos = IndiceGrupos()
+        self.indices = [
+            self.indice_nomes, self.indice_vocabulario, self.colunas, self.indice_sugestoes, self.indice_grupos,
+        ]
+
+        # índices derivados dos comerciantes, mesmo protocolo com (cid, comerciante)
+        self.indice_espacial = IndiceEspacial()
+        self.indice_horarios = IndiceHorarios()
+        self.indices_comerciantes = [
+            self.indice_espacial, self.indice_horarios, self.colunas.comerciantes,
+            self.indice_sugestoes.comerciantes,
+        ]
+
+        self.marca_produtos = None
+        self.marca_comerciantes = None
+        self.marca_exclusoes = None
+
+        # versao sobe a cada alteração aplicada; instancia distingue snapshots
+        # de workers diferentes, que contam versões independentemente
+        self.instancia = uuid.uuid4().hex[:12]
+        self.versao = 0
+        self.carregado_em = None
+        self.atualizado_em = None
+        self.ultima_duracao = None
+        self.ultimo_erro = None
+        self.falhas_seguidas = 0
+        self.proxima_tentativa = 0.0  # time.time() a partir do qual pode tentar de novo
+        self._atualizando = False
+
+    # ---------------- leitura paginada ----------------
+    def _buscar_tudo(self, montar_query):
+        linhas = []
+        inicio = 0
+        while True:
+            resp = montar_query().range(inicio, inicio + TAMANHO_PAGINA - 1).execute()
+            pagina = resp.data or []
+            linhas.extend(pagina)
+            if len(pagina) < TAMANHO_PAGINA:
+                return linhas
+            inicio += TAMANHO_PAGINA
+
+    def _buscar_alterados(self, tabela, coluna, marca):
+        def montar():
+            q = self.supabase.table(tabela).select("*")
+            if marca:
+                # gte e recuado: reaplicar a mesma linha é inofensivo, perder
+                # uma gravada no instante da marca (ou commitada depois) não é
+                q = q.gte(coluna, _recuar(marca, SOBREPOSICAO_MARCA))
+            return q.order(coluna, desc=False).order("id", desc=False)
+
+        return self._buscar_tudo(montar)
+
+    # ---------------- carga completa ----------------
+    def carregar(self):
+        inicio = time.perf_counter()
+        comerciantes = self._buscar_alterados("comerciantes", "atualizado_em", None)
+        produtos = self._buscar_alterados("produtos", "atualizado_em", None)
+        exclusoes = self._buscar_alterados("catalogo_exclusoes", "excluido_em", None)
+
+        with self.lock:
+            self.produtos = {}
+            self.comerciantes = {}
+            self.produtos_por_comerciante = {}
+            for indice in self.indices + self.indices_comerciantes:
+                indice.limpar()
+            self.aplicar_comerciantes(comerciantes)
+            self.aplicar_produtos(produtos)
+            self.marca_exclusoes = _maior_marca(exclusoes, "excluido_em", None)
+            self.carregado_em = time.time()
+            self.atualizado_em = self.carregado_em
+            self.ultima_duracao = time.perf_counter() - inicio
+            self.ultimo_erro = None
+            self.versao += 1
+
+    # ---------------- atualização incremental ----------------
+    def atualizar(self):
+        inicio = time.perf_counter()
+        comerciantes = self._buscar_alterados("comerciantes", "atualizado_em", self.marca_comerciantes)
+        produtos = self._buscar_alterados("produtos", "atualizado_em", self.marca_produtos)
+        exclusoes = self._buscar_alterados("catalogo_exclusoes", "excluido_em", self.marca_exclusoes)
+
+        with self.lock:
+            self.aplicar_comerciantes(comerciantes)
+            self.aplicar_produtos(produtos)
+            for e in exclusoes:
+                if e.get("tabela") == "produtos":
+                    self.remover_produtos([e.get("registro_id")])
+                elif e.get("tabela") == "comerciantes":
+                    self.remover_comerciantes([e.get("registro_id")])
+            self.marca_exclusoes = _maior_marca(exclusoes, "excluido_em", self.marca_exclusoes)
+            self.atualizado_em = time.time()
+            self.ultima_duracao = time.perf_counter() - inicio
+            self.ultimo_erro = None
+
+    def garantir_atualizado(self):
+        """
+        Atualiza o snapshot se ele passou do limite de idade: numa thread,
+        enquanto esta consulta (e as seguintes) usam a versão atual. Só a
+        primeira carga espera. Se outra thread já está atualizando, serve o
+        snapshot atual.
+        """
+        if self.atualizado_em is not None and time.time() - self.atualizado_em < self.max_idade:
+            return
+        if time.time() < self.proxima_tentativa:
+            # a última leitura falhou: espera antes de tentar de novo
+            return
+        with self.lock:
+            if self._atualizando:
+                return
+            self._atualizando = True
+        if self.carregado_em is None:
+            # partida a frio: ainda não há versão para servir
+            self._ler_do_banco()
+        else:
+            threading.Thread(target=self._ler_do_banco, name="catalogo-atualizacao", daemon=True).start()
+
+    def _ler_do_banco(self):
+        """Carga completa ou incremental; em erro, mantém o snapshot e espera para tentar de novo."""
+        try:
+            if self.carregado_em is None:
+                self.carregar()
+            else:
+                self.atualizar()
+            self.falhas_seguidas = 0
+            self.proxima_tentativa = 0.0
+        except Exception as e:
+            self.ultimo_erro = str(e)
+            self.falhas_seguidas += 1
+            espera = min(ESPERA_MIN_APOS_ERRO * 2 ** (self.falhas_seguidas - 1), ESPERA_MAX_APOS_ERRO)
+            self.proxima_tentativa = time.time() + espera
+            print(f"❌ ERRO AO ATUALIZAR CATÁLOGO (nova tentativa em {espera}s):", traceback.format_exc())
+        finally:
+            with self.lock:
+                self._atualizando = False
+
+    # ---------------- aplicação de alterações ----------------
+    def aplicar_produtos(self, linhas, avancar_marca=True):
+        """
+        Aplica linhas novas/alteradas de produtos. Alterações notificadas pelo
+        próprio worker usam avancar_marca=False: a marca d'água só pode andar
+        com o que veio do banco, senão gravações de outros workers se perdem.
+        """
+        with self.lock:
+            mudou = False
+            for p in linhas:
+                pid = str(p.get("id"))
+                anterior = self.produtos.get(pid)
+                if anterior == p:
+                    continue
+                if anterior is not None:
+                    self._desvincular(pid, anterior)
+                self.produtos[pid] = p
+                self.produtos_por_comerciante.setdefault(str(p.get("comerciante_id")), set()).add(pid)
+                for indice in self.indices:
+                    indice.adicionar(pid, p)
+                mudou = True
+            if avancar_marca:
+                self.marca_produtos = _maior_marca(linhas, "atualizado_em", self.marca_produtos)
+            if mudou:
+                self.versao += 1
+
+    def aplicar_comerciantes(self, linhas, avancar_marca=True):
+        with self.lock:
+            mudou = False
+            for c in linhas:
+                cid = str(c.get("id"))
+                if self.comerciantes.get(cid) == c:
+                    continue
+                self.comerciantes[cid] = c
+                for indice in self.indices_comerciantes:
+                    indice.adicionar(cid, c)
+                mudou = True
+            if avancar_marca:
+                self.marca_comerciantes = _maior_marca(linhas, "atualizado_em", self.marca_comerciantes)
+            if mudou:
+                self.versao += 1
+
+    def remover_produtos(self, ids):
+        with self.lock:
+            removidos = 0
+            for pid in ids:
+                anterior = self.produtos.pop(str(pid), None)
+                if anterior is not None:
+                    self._desvincular(str(pid), anterior)
+                    for indice in self.indices:
+                        indice.remover(str(pid), anterior)
+                    removidos += 1
+            if removidos:
+                self.versao += 1
+
+    def remover_comerciantes(self, ids):
+        with self.lock:
+            for cid in ids:
+                cid = str(cid)
+                self.remover_produtos(list(self.produtos_por_comerciante.get(cid, ())))
+                self.produtos_por_comerciante.pop(cid, None)
+                anterior = self.comerciantes.pop(cid, None)
+                if anterior is not None:
+                    for indice in self.indices_comerciantes:
+                        indice.remover(cid, anterior)
+                    self.versao += 1
+
+    def _desvincular(self, pid, produto):
+        ids = self.produtos_por_comerciante.get(str(produto.get("comerciante_id")))
+        if ids is not None:
+            ids.discard(pid)
+
+    def status(self):
+        agora = time.time()
+        with self.lock:
+            return {
+                "produtos": len(self.produtos),
+                "trigramas": len(self.indice_nomes.postings),
+                "vocabulario": len(self.indice_vocabulario),
+                "grupos": len(self.indice_grupos),
+                "comerciantes_geolocalizados": len(self.indice_espacial),
+                "comerciantes": len(self.comerciantes),
+                "colunas": self.colunas.status(),
+                "sugestoes": self.indice_sugestoes.status(),
+                "instancia": self.instancia,
+                "versao": self.versao,
+                "carregado_em": _iso(self.carregado_em),
+                "atualizado_em": _iso(self.atualizado_em),
+                "idade_segundos": round(agora - self.atualizado_em, 3) if self.atualizado_em else None,
+                "max_idade_segundos": self.max_idade,
+                "ultima_duracao_segundos": round(self.ultima_duracao, 3) if self.ultima_duracao is not None else None,
+                "marca_produtos": self.marca_produtos,
+                "marca_comerciantes": self.marca_comerciantes,
+                "marca_exclusoes": self.marca_exclusoes,
+                "ultimo_erro": self.ultimo_erro,
+                "falhas_seguidas": self.falhas_seguidas,
+                "proxima_tentativa": _iso(self.proxima_tentativa) if self.proxima_tentativa else None,
+            }
+
+
+def _maior_marca(linhas, coluna, atual):
+    marca = atual
+    for linha in linhas:
+        valor = linha.get(coluna)
+        if valor and (marca is None or valor > marca):
+            marca = valor
+    return marca
+
+
+def _recuar(marca, segundos):
+    """Marca d'água (ISO do PostgREST) alguns segundos antes; como veio se não for lida."""
+    try:
+        return (datetime.fromisoformat(marca) - timedelta(seconds=segundos)).isoformat()
+    except (TypeError, ValueError):
+        return marca
+
+
+def _iso(ts):
+    if ts is None:
+        return None
+    return datetime.fromtimestamp(ts, tz=timezone.utc).isoformat()
+
+
+_lock_criacao = threading.Lock()
+
+
+def obter_catalogo():
+    """
+    Retorna o snapshot do app atual (criando e carregando na primeira chamada),
+    ou None se ele estiver desligado ou não puder ser carregado.
+    """
+    app = current_app._get_current_object()
+    if not app.config.get("CATALOGO_EM_MEMORIA", True):
+        return None
+
+    catalogo = app.extensions.get("catalogo")
+    if catalogo is None:
+        with _lock_criacao:
+            catalogo = app.extensions.get("catalogo")
+            if catalogo is None:
+                catalogo = CatalogoSnapshot(
+                    app.config["supabase"],
+                    max_idade=app.config.get("CATALOGO_MAX_IDADE", MAX_IDADE_PADRAO),
+                )
+                app.extensions["catalogo"] = catalogo
+
+    catalogo.garantir_atualizado()
+    if catalogo.carregado_em is None:
+        return None
+    return catalogo
+
+
+# ---------------- notificações de escrita (mesmo worker) ----------------
+def _catalogo_carregado():
+    try:
+        catalogo = current_app.extensions.get("catalogo")
+    except RuntimeError:
+        return None
+    if catalogo is None or catalogo.carregado_em is None:
+        return None
+    return catalogo
+
+
+def _cache_detalhes():
+    # cache da página de detalhe (utils/detalhe_produto.py), se já criado
+    try:
+        return current_app.extensions.get("detalhes_produto")
+    except RuntimeError:
+        return None
+
+
+def _diretorio_comerciantes():
+    # nomes/cidades do admin (utils/diretorio_comerciantes.py), se já criado
+    try:
+        return current_app.extensions.get("diretorio_comerciantes")
+    except RuntimeError:
+        return None
+
+
+def notificar_produtos_alterados(linhas):
+    """Aplica no snapshot deste worker os produtos recém-gravados."""
+    catalogo = _catalogo_carregado()
+    if catalogo is not None and linhas:
+        catalogo.aplicar_produtos(linhas, avancar_marca=False)
+    cache = _cache_detalhes()
+    if cache is not None and linhas:
+        cache.invalidar_produtos([p.get("id") for p in linhas])
+    if linhas:
+        invalidar_estatisticas_painel()
+
+
+def notificar_produtos_removidos(ids):
+    """Remove do snapshot deste worker os produtos recém-excluídos."""
+    catalogo = _catalogo_carregado()
+    if catalogo is not None and ids:
+        catalogo.remover_produtos(ids)
+    cache = _cache_detalhes()
+    if cache is not None and ids:
+        cache.invalidar_produtos(ids)
+    if ids:
+        invalidar_estatisticas_painel()
+
+
+def notificar_comerciantes_alterados(linhas):
+    catalogo = _catalogo_carregado()
+    if catalogo is not None and linhas:
+        catalogo.aplicar_comerciantes(linhas, avancar_marca=False)
+    cache = _cache_detalhes()
+    if cache is not None and linhas:
+        cache.invalidar_comerciantes([c.get("id") for c in linhas])
+    diretorio = _diretorio_comerciantes()
+    if diretorio is not None and linhas:
+        diretorio.aplicar(linhas)
+    if linhas:
+        invalidar_estatisticas_painel()
+
+
+def notificar_comerciantes_removidos(ids):
+    catalogo = _catalogo_carregado()
+    if catalogo is not None and ids:
+        catalogo.remover_comerciantes(ids)
+    cache = _cache_detalhes()
+    if cache is not None and ids:
+        cache.invalidar_comerciantes(ids)
+    diretorio = _diretorio_comerciantes()
+    if diretorio is not None and ids:
+        diretorio.remover(ids)
+    if ids:
+        invalidar_estatisticas_painel()
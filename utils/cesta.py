@@ -0,0 +1,353 @@
+# utils/cesta.py
+# Lista de compras -> plano mais barato (preço dos itens + deslocamento),
+# numa loja só ou dividido em até N lojas (/consumidor/api/cesta).
+#
+# Cada item da lista é um termo de busca ou um produto_id; com produto_id
+# valem as ofertas do mesmo grupo (utils/agrupamento.py), senão os produtos
+# que casam com o termo (índice de trigramas e, sem nada exato, a busca
+# aproximada). Para cada loja fica a oferta mais barata de cada item.
+#
+# Escolher o conjunto de lojas é um problema de localização de facilidades:
+# custo(S) = soma dos itens (quantidade x menor preço entre as lojas de S)
+#          + soma do custo de deslocamento até cada loja de S.
+# O custo de deslocamento é o do perfil do consumidor (PerfilDeslocamento:
+# carro, a pé ou entrega), como na ordenação por custo, somado por loja
+# visitada.
+# Item que a loja não vende custa uma penalidade maior que qualquer plano:
+# se nenhum conjunto de até N lojas cobre a lista, o plano cobre o máximo
+# possível e o resto sai em "nao_encontrados".
+# Resolve por branch and bound: lojas em ordem crescente de deslocamento,
+# limite inferior = deslocamento já contratado + menor deslocamento que
+# ainda falta + cada item pelo menor preço possível entre as lojas que
+# ainda podem entrar. Começa da solução gulosa e para no prazo, devolvendo
+# a melhor encontrada (com "otimo": false).
+import math
+import time
+
+import numpy as np
+
+from utils.normalizacao import normaliza
+from utils.distancias import PERFIL_PADRAO, try_float
+from utils.busca_produtos import _comerciante_passa
+
+MAX_ITENS = 30
+MAX_LOJAS_POR_PLANO = 4
+LOJAS_PADRAO = 2
+MAX_LOJAS_CANDIDATAS = 400
+PRAZO_PADRAO_MS = 300
+MAX_RAIO_KM = 200
+
+
+class ListaInvalida(ValueError):
+    pass
+
+
+def itens_da_lista(dados):
+    """Valida {"itens": [{"busca" | "produto_id", "quantidade"}]}; ListaInvalida se não der."""
+    itens = (dados or {}).get("itens")
+    if not isinstance(itens, list) or not itens:
+        raise ListaInvalida("Informe os itens da lista")
+    if len(itens) > MAX_ITENS:
+        raise ListaInvalida(f"A lista aceita até {MAX_ITENS} itens")
+    validados = []
+    for item in itens:
+        if not isinstance(item, dict):
+            raise ListaInvalida("Item inválido")
+        busca = normaliza(item.get("busca") or "")
+        produto_id = item.get("produto_id")
+        if not busca and produto_id is None:
+            raise ListaInvalida("Cada item precisa de busca ou produto_id")
+        try:
+            quantidade = float(item.get("quantidade", 1))
+        except (TypeError, ValueError):
+            raise ListaInvalida("Quantidade inválida")
+        if not math.isfinite(quantidade) or quantidade <= 0:
+            raise ListaInvalida("Quantidade inválida")
+        validados.append({"busca": busca, "produto_id": produto_id, "quantidade": quantidade})
+    return validados
+
+
+def _numero(dados, campo, minimo, maximo):
+    """Número finito entre minimo e maximo, ou None se ausente; ListaInvalida se não for."""
+    valor = (dados or {}).get(campo)
+    if valor is None or valor == "":
+        return None
+    valor = try_float(valor)
+    if valor is None or not math.isfinite(valor) or not minimo <= valor <= maximo:
+        raise ListaInvalida(f"Valor inválido em {campo}")
+    return valor
+
+
+def texto_da_lista(dados, campo):
+    """Texto normalizado (estado, cidade), "" se ausente; ListaInvalida se não for texto."""
+    valor = (dados or {}).get(campo)
+    if valor is None:
+        return ""
+    if not isinstance(valor, str):
+        raise ListaInvalida(f"Valor inválido em {campo}")
+    return normaliza(valor)
+
+
+def posicao_da_lista(dados):
+    """
+    (lat, lon, raio_km) do corpo da lista. lat e lon vêm juntos ou nenhum;
+    raio até MAX_RAIO_KM (acima disso, MAX_RAIO_KM; zero = sem raio).
+    """
+    lat = _numero(dados, "lat", -90.0, 90.0)
+    lon = _numero(dados, "lon", -180.0, 180.0)
+    if (lat is None) != (lon is None):
+        raise ListaInvalida("Informe lat e lon juntos")
+    raio = _numero(dados, "raio", 0.0, math.inf)
+    if raio is not None:
+        raio = min(raio, MAX_RAIO_KM) if raio > 0 else None
+    return lat, lon, raio
+
+
+# ---------------- candidatos (com o lock do catálogo) ----------------
+def _produtos_do_item(catalogo, item):
+    if item["produto_id"] is not None:
+        chave = catalogo.indice_grupos.chave_do_produto(item["produto_id"])
+        if chave is not None:
+            return [pid for _, pid in catalogo.indice_grupos.grupos.get(chave, ())]
+        return [str(item["produto_id"])] if str(item["produto_id"]) in catalogo.produtos else []
+    ids = catalogo.indice_nomes.buscar(item["busca"])
+    if not ids:
+        ids = catalogo.indice_vocabulario.buscar(item["busca"]) or set()
+    return ids
+
+
+def _lojas_candidatas(catalogo, lat, lon, raio_km, aceitas):
+    """
+    {comerciante_id: distancia_km ou None} das lojas que vendem algum item
+    (`aceitas`: comerciante_id -> itens que vende): as mais próximas ou,
+    sem localização, as que vendem mais itens da lista.
+    """
+    if lat is None or lon is None:
+        maiores = sorted(aceitas, key=lambda cid: (-aceitas[cid], cid))[:MAX_LOJAS_CANDIDATAS]
+        return {cid: None for cid in maiores}
+    lojas = {}
+    for d, cid in catalogo.indice_espacial.por_proximidade(lat, lon, raio_km):
+        if cid in aceitas:
+            lojas[cid] = d
+            if len(lojas) >= MAX_LOJAS_CANDIDATAS:
+                break
+    return lojas
+
+
+def montar_ofertas(catalogo, itens, lat=None, lon=None, raio_km=None, estado="", cidade="", entrega=False):
+    """
+    Oferta mais barata de cada item em cada loja candidata.
+    Retorna (lojas [cid], distancias [km|None], ofertas {(i_loja, i_item): produto}).
+    """
+    melhores = {}  # (cid, i_item) -> produto
+    with catalogo.lock:
+        for i, item in enumerate(itens):
+            for pid in _produtos_do_item(catalogo, item):
+                p = catalogo.produtos.get(pid)
+                if p is None:
+                    continue
+                cid = str(p.get("comerciante_id"))
+                atual = melhores.get((cid, i))
+                if atual is None or float(p.get("preco") or 0) < float(atual.get("preco") or 0):
+                    melhores[(cid, i)] = p
+
+        aceitas = {}
+        for cid, _ in melhores:
+            if cid in aceitas or _comerciante_passa(catalogo.comerciantes.get(cid), estado, cidade, entrega):
+                aceitas[cid] = aceitas.get(cid, 0) + 1
+        candidatas = _lojas_candidatas(catalogo, lat, lon, raio_km, aceitas)
+
+    lojas = list(candidatas)
+    indice = {cid: k for k, cid in enumerate(lojas)}
+    ofertas = {(indice[cid], i): p for (cid, i), p in melhores.items() if cid in indice}
+    return lojas, [candidatas[cid] for cid in lojas], ofertas
+
+
+# ---------------- otimização ----------------
+class _Otimizador:
+    """
+    precos: (lojas, itens), já multiplicados pela quantidade; item que a loja
+    não vende custa `penalidade` (maior que qualquer plano real), então um
+    plano que deixa item de fora só ganha se nenhum conjunto de até
+    max_lojas lojas cobrir a lista inteira.
+    """
+
+    def __init__(self, precos, deslocamento, max_lojas, limite_tempo, penalidade):
+        # lojas em ordem crescente de deslocamento: permite cortar o laço
+        self.ordem = np.argsort(deslocamento, kind="stable")
+        self.precos = precos[self.ordem]
+        self.deslocamento = deslocamento[self.ordem]
+        self.max_lojas = max_lojas
+        self.limite_tempo = limite_tempo
+        self.vazio = np.full(precos.shape[1], penalidade)
+        self.melhor_custo = np.inf
+        self.melhor = ()
+        self.nos = 0
+        self.completo = True
+
+        # menor preço de cada item entre as lojas k.. (limite inferior)
+        n = len(self.deslocamento)
+        self.sufixo = np.empty((n + 1, precos.shape[1]))
+        self.sufixo[n] = self.vazio
+        for k in range(n - 1, -1, -1):
+            self.sufixo[k] = np.minimum(self.sufixo[k + 1], self.precos[k])
+
+    def _registrar(self, lojas, minimos, deslocamento):
+        custo = minimos.sum() + deslocamento
+        if custo < self.melhor_custo:
+            self.melhor_custo = custo
+            self.melhor = tuple(lojas)
+
+    def guloso(self):
+        """Solução inicial: melhor loja única e depois a loja que mais reduz o custo."""
+        lojas = []
+        minimos = self.vazio
+        deslocamento = 0.0
+        while len(lojas) < self.max_lojas:
+            custos = np.minimum(minimos, self.precos).sum(axis=1) + deslocamento + self.deslocamento
+            custos[lojas] = np.inf
+            k = int(np.argmin(custos))
+            if lojas and custos[k] >= self.melhor_custo:
+                break
+            lojas.append(k)
+            minimos = np.minimum(minimos, self.precos[k])
+            deslocamento += self.deslocamento[k]
+            self._registrar(lojas, minimos, deslocamento)
+
+    def _busca(self, inicio, lojas, minimos, deslocamento):
+        self.nos += 1
+        if self.nos % 64 == 0 and time.perf_counter() > self.limite_tempo:
+            self.completo = False
+            return
+        if lojas:
+            self._registrar(lojas, minimos, deslocamento)
+        if len(lojas) >= self.max_lojas or inicio >= len(self.deslocamento):
+            return
+        if len(lojas) == self.max_lojas - 1:
+            # última loja do plano: todas as candidatas de uma vez
+            custos = np.minimum(minimos, self.precos[inicio:]).sum(axis=1) + self.deslocamento[inicio:]
+            k = int(np.argmin(custos))
+            self._registrar(lojas + [inicio + k], np.minimum(minimos, self.precos[inicio + k]),
+                            deslocamento + self.deslocamento[inicio + k])
+            return
+        for k in range(inicio, len(self.deslocamento)):
+            # o limite só cresce com k (deslocamento sobe, sufixo sobe): pode parar o laço
+            limite = deslocamento + self.deslocamento[k] + np.minimum(minimos, self.sufixo[k]).sum()
+            if limite >= self.melhor_custo:
+                break
+            novos = np.minimum(minimos, self.precos[k])
+            if not (novos < minimos).any():
+                continue  # loja não barateia nenhum item: só somaria deslocamento
+            self._busca(k + 1, lojas + [k], novos, deslocamento + self.deslocamento[k])
+            if not self.completo:
+                return
+
+    def resolver(self):
+        self.guloso()
+        self._busca(0, [], self.vazio, 0.0)
+        return [int(self.ordem[k]) for k in self.melhor]
+
+
+def otimizar_cesta(
+    catalogo,
+    itens,
+    lat=None,
+    lon=None,
+    max_lojas=LOJAS_PADRAO,
+    raio_km=None,
+    estado="",
+    cidade="",
+    entrega=False,
+    perfil=PERFIL_PADRAO,
+    prazo_ms=PRAZO_PADRAO_MS,
+):
+    """
+    Plano mais barato para a lista `itens` (ver itens_da_lista). Itens que
+    nenhuma loja candidata vende saem em "nao_encontrados" e não impedem
+    o plano dos demais.
+    """
+    inicio = time.perf_counter()
+    max_lojas = min(max(int(max_lojas), 1), MAX_LOJAS_POR_PLANO)
+    entrega = entrega or perfil.so_entrega
+    lojas, distancias, ofertas = montar_ofertas(catalogo, itens, lat, lon, raio_km, estado, cidade, entrega)
+
+    precos = np.full((len(lojas), len(itens)), np.inf)
+    for (k, i), p in ofertas.items():
+        precos[k, i] = float(p.get("preco") or 0) * itens[i]["quantidade"]
+    deslocamento = perfil.custo_lote([np.nan if d is None else d for d in distancias])
+
+    vendidos = np.isfinite(precos)
+    penalidade = precos[vendidos].sum() + deslocamento.sum() + 1.0
+    precos[~vendidos] = penalidade
+
+    plano = {"lojas": [], "lojas_avaliadas": len(lojas), "otimo": True}
+    if not vendidos.any():
+        plano.update({
+            "total": None,
+            "nao_encontrados": [_rotulo(item) for item in itens],
+            "tempo_ms": _ms(inicio),
+        })
+        return plano
+
+    otimizador = _Otimizador(precos, deslocamento, max_lojas, inicio + prazo_ms / 1000, penalidade)
+    escolhidas = otimizador.resolver()
+
+    # cada item na loja escolhida onde sai mais barato
+    por_loja = {k: [] for k in escolhidas}
+    nao_encontrados = []
+    for i, item in enumerate(itens):
+        k = min(escolhidas, key=lambda loja: precos[loja, i])
+        if not vendidos[k, i]:
+            nao_encontrados.append(_rotulo(item))
+            continue
+        p = ofertas[(k, i)]
+        por_loja[k].append({
+            "item": _rotulo(item),
+            "quantidade": item["quantidade"],
+            "produto_id": p.get("id"),
+            "nome": p.get("nome"),
+            "marca": p.get("marca", ""),
+            "preco": float(p.get("preco") or 0),
+            "subtotal": float(precos[k, i]),
+        })
+
+    with catalogo.lock:
+        comerciantes = {k: catalogo.comerciantes.get(lojas[k]) or {} for k in escolhidas}
+    for k in escolhidas:
+        c = comerciantes[k]
+        plano["lojas"].append({
+            "comerciante": {
+                "id": c.get("id"),
+                "nome": c.get("nome"),
+                "cidade": c.get("cidade"),
+                "estado": c.get("estado"),
+                "faz_entrega": c.get("faz_entrega", False),
+                "latitude": c.get("latitude"),
+                "longitude": c.get("longitude"),
+            },
+            "distancia": distancias[k],
+            "custo_deslocamento": float(deslocamento[k]),
+            "subtotal": sum(item["subtotal"] for item in por_loja[k]),
+            "itens": por_loja[k],
+        })
+
+    custo_produtos = sum(loja["subtotal"] for loja in plano["lojas"])
+    custo_viagem = sum(loja["custo_deslocamento"] for loja in plano["lojas"])
+    plano.update({
+        "total": custo_produtos + custo_viagem,
+        "custo_produtos": custo_produtos,
+        "custo_deslocamento": custo_viagem,
+        "nao_encontrados": nao_encontrados,
+        "otimo": otimizador.completo,
+        "nos_avaliados": otimizador.nos,
+        "tempo_ms": _ms(inicio),
+    })
+    return plano
+
+
+def _rotulo(item):
+    return item["busca"] or item["produto_id"]
+
+
+def _ms(inicio):
+    return round((time.perf_counter() - inicio) * 1000, 1)
@@ -0,0 +1,401 @@
+# utils/colunas_catalogo.py
+# Colunas NumPy do snapshot do catálogo (utils/catalogo.py) para filtrar e
+# ordenar sem percorrer os dicts das linhas.
+#
+# Cada produto ganha um slot nos arrays preco / criado_em / comerciante;
+# cada comerciante, um slot nos arrays de latitude, longitude, status,
+# entrega e estado/cidade (como códigos de uma tabela de textos
+# internados). Os filtros viram máscaras booleanas, a chave (k1, preco, id)
+# é calculada de uma vez para todos os candidatos e só a janela pedida
+# volta como ids: os dicts são montados depois, para a página.
+#
+# Na ordem "custo" a distância de uma origem até todos os comerciantes fica
+# guardada, por célula de TAMANHO_CELULA_ORIGEM (a mesma do cache de
+# distancias_rota, utils/rotas.py) e medida do centro dela: a próxima página,
+# outro consumidor do mesmo bairro ou o mesmo ponto com outro perfil de
+# deslocamento só multiplicam pelo custo por km do perfil. Esse vetor só
+# pré-filtra: quem sobra (os que, com a folga do arredondamento, podem cair
+# na janela) é ordenado pela distância da posição exata, a mesma mostrada
+# em cada produto e usada pela busca via RPC.
+#
+# As mesmas colunas dão as contagens por faceta (estado, cidade, categoria,
+# entrega) de /consumidor/api/facetas: cada filtro é uma máscara booleana,
+# a interseção é um &, e a contagem por valor é um np.bincount.
+from collections import OrderedDict
+
+import numpy as np
+
+from utils.normalizacao import normaliza, campo_normalizado
+from utils.distancias import distancias_haversine_lote, PERFIL_PADRAO
+from utils.busca_produtos import instante, DISTANCIA_DESCONHECIDA, SEM_DATA
+from utils.indice_espacial import coordenadas_validas
+from utils.rotas import celula_origem
+
+CAPACIDADE_INICIAL = 1024
+MAX_ORIGENS = 256  # vetores de distância guardados (um por célula de origem, LRU)
+SEM_TEXTO = -1
+
+
+def _crescer(array, tamanho, vazio):
+    novo = np.full(max(tamanho, 2 * len(array)), vazio, dtype=array.dtype)
+    novo[:len(array)] = array
+    return novo
+
+
+class _ColunasComerciantes:
+    """Lado dos comerciantes, registrado em catalogo.indices_comerciantes."""
+
+    def __init__(self, colunas):
+        self.colunas = colunas
+
+    def adicionar(self, cid, comerciante):
+        self.colunas.adicionar_comerciante(cid, comerciante)
+
+    def remover(self, cid, comerciante=None):
+        self.colunas.remover_comerciante(cid)
+
+    def limpar(self):
+        self.colunas.limpar()
+
+
+class ColunasCatalogo:
+    """
+    Registrado em catalogo.indices (protocolo adicionar/remover/limpar com
+    (pid, produto)); `comerciantes` é o mesmo objeto visto pelo lado dos
+    comerciantes. Slots de produto removidos são reaproveitados; slots de
+    comerciante nunca são liberados (são poucos), só desativados.
+    """
+
+    def __init__(self):
+        self.comerciantes = _ColunasComerciantes(self)
+        self.limpar()
+
+    def __len__(self):
+        return len(self._slot_produto)
+
+    def limpar(self):
+        # produtos
+        self.preco = np.zeros(CAPACIDADE_INICIAL, dtype=np.float64)
+        self.criado_em = np.full(CAPACIDADE_INICIAL, np.nan, dtype=np.float64)
+        self.comerciante = np.full(CAPACIDADE_INICIAL, -1, dtype=np.int32)  # -1 = slot livre
+        self.categoria = np.full(CAPACIDADE_INICIAL, SEM_TEXTO, dtype=np.int32)
+        self.ids = []  # slot -> id como veio do banco (desempate da chave)
+        self._slot_produto = {}  # str(id) -> slot
+        self._slots_livres = []
+
+        # comerciantes
+        self.latitude = np.full(CAPACIDADE_INICIAL, np.nan, dtype=np.float64)
+        self.longitude = np.full(CAPACIDADE_INICIAL, np.nan, dtype=np.float64)
+        self.ativo = np.zeros(CAPACIDADE_INICIAL, dtype=bool)
+        self.faz_entrega = np.zeros(CAPACIDADE_INICIAL, dtype=bool)
+        self.estado = np.full(CAPACIDADE_INICIAL, SEM_TEXTO, dtype=np.int32)
+        self.cidade = np.full(CAPACIDADE_INICIAL, SEM_TEXTO, dtype=np.int32)
+        self.cids = []  # slot -> str(id)
+        self._slot_comerciante = {}  # str(id) -> slot
+
+        # textos internados (estado/cidade/categoria normalizados)
+        self._codigos = {}
+        self._exibicao = []  # código -> texto como cadastrado (primeiro visto)
+        self._facetas = {}  # filtros -> contagens; limpo a cada alteração
+        # célula da origem -> km por slot de comerciante, do menos para o mais
+        # recente; limpo quando os comerciantes mudam
+        self._distancias_origem = OrderedDict()
+
+    # ---------------- manutenção: textos ----------------
+    def _codigo(self, texto, exibicao=None):
+        if not texto:
+            return SEM_TEXTO
+        codigo = self._codigos.get(texto)
+        if codigo is None:
+            codigo = self._codigos[texto] = len(self._codigos)
+            self._exibicao.append(str(exibicao or texto).strip())
+        return codigo
+
+    # ---------------- manutenção: comerciantes ----------------
+    def _slot_do_comerciante(self, cid):
+        slot = self._slot_comerciante.get(cid)
+        if slot is None:
+            # produto pode chegar antes do comerciante: slot inativo até lá
+            slot = len(self.cids)
+            if slot >= len(self.ativo):
+                self.latitude = _crescer(self.latitude, slot + 1, np.nan)
+                self.longitude = _crescer(self.longitude, slot + 1, np.nan)
+                self.ativo = _crescer(self.ativo, slot + 1, False)
+                self.faz_entrega = _crescer(self.faz_entrega, slot + 1, False)
+                self.estado = _crescer(self.estado, slot + 1, SEM_TEXTO)
+                self.cidade = _crescer(self.cidade, slot + 1, SEM_TEXTO)
+            self.cids.append(cid)
+            self._slot_comerciante[cid] = slot
+            self._distancias_origem.clear()  # vetores guardados têm um slot a menos
+        return slot
+
+    def adicionar_comerciante(self, cid, comerciante):
+        self._facetas = {}
+        self._distancias_origem.clear()
+        slot = self._slot_do_comerciante(str(cid))
+        coords = coordenadas_validas(comerciante)
+        self.latitude[slot], self.longitude[slot] = coords if coords else (np.nan, np.nan)
+        self.ativo[slot] = comerciante.get("status") == "ativo"
+        self.faz_entrega[slot] = bool(comerciante.get("faz_entrega", False))
+        self.estado[slot] = self._codigo(campo_normalizado(comerciante, "estado"), comerciante.get("estado"))
+        self.cidade[slot] = self._codigo(campo_normalizado(comerciante, "cidade"), comerciante.get("cidade"))
+
+    def remover_comerciante(self, cid):
+        self._facetas = {}
+        self._distancias_origem.clear()
+        slot = self._slot_comerciante.get(str(cid))
+        if slot is not None:
+            self.ativo[slot] = False
+
+    # ---------------- manutenção: produtos ----------------
+    def adicionar(self, pid, produto):
+        pid = str(pid)
+        self._facetas = {}
+        slot = self._slot_produto.get(pid)
+        if slot is None:
+            if self._slots_livres:
+                slot = self._slots_livres.pop()
+            else:
+                slot = len(self.ids)
+                self.ids.append(None)
+                if slot >= len(self.preco):
+                    self.preco = _crescer(self.preco, slot + 1, 0.0)
+                    self.criado_em = _crescer(self.criado_em, slot + 1, np.nan)
+                    self.comerciante = _crescer(self.comerciante, slot + 1, -1)
+                    self.categoria = _crescer(self.categoria, slot + 1, SEM_TEXTO)
+            self._slot_produto[pid] = slot
+
+        criado = instante(produto.get("criado_em"))
+        self.ids[slot] = produto.get("id")
+        self.preco[slot] = float(produto.get("preco") or 0)
+        self.criado_em[slot] = np.nan if criado is None else criado
+        self.comerciante[slot] = self._slot_do_comerciante(str(produto.get("comerciante_id")))
+        self.categoria[slot] = self._codigo(normaliza(produto.get("categoria")), produto.get("categoria"))
+
+    def remover(self, pid, produto=None):
+        slot = self._slot_produto.pop(str(pid), None)
+        if slot is None:
+            return
+        self._facetas = {}
+        self.comerciante[slot] = -1
+        self.ids[slot] = None
+        self._slots_livres.append(slot)
+
+    # ---------------- consulta ----------------
+    def _mascara_comerciantes(self, estado, cidade, entrega, permitidos):
+        n = len(self.cids)
+        mascara = self.ativo[:n].copy()
+        if estado:
+            mascara &= self.estado[:n] == self._codigos.get(estado, -2)
+        if cidade:
+            mascara &= self.cidade[:n] == self._codigos.get(cidade, -2)
+        if entrega:
+            mascara &= self.faz_entrega[:n]
+        if permitidos is not None:
+            aceitos = np.zeros(n, dtype=bool)
+            slots = [self._slot_comerciante[cid] for cid in permitidos if cid in self._slot_comerciante]
+            aceitos[slots] = True
+            mascara &= aceitos
+        return mascara
+
+    def _distancias_da_origem(self, lat, lon):
+        """
+        km do centro da célula de (lat, lon) a cada slot de comerciante (NaN
+        sem coordenada), guardado por célula; a menos usada sai primeiro.
+        """
+        chave, (lat_c, lon_c) = celula_origem(lat, lon)
+        distancias = self._distancias_origem.get(chave)
+        if distancias is not None:
+            self._distancias_origem.move_to_end(chave)
+            return distancias
+        n = len(self.cids)
+        with np.errstate(invalid="ignore"):
+            distancias = distancias_haversine_lote(lat_c, lon_c, self.latitude[:n], self.longitude[:n])
+        self._distancias_origem[chave] = distancias
+        if len(self._distancias_origem) > MAX_ORIGENS:
+            self._distancias_origem.popitem(last=False)
+        return distancias
+
+    def _k1(self, ordem, slots, preco, d, perfil):
+        """k1 de chave_ordenacao para os slots; `d` é a distância de cada um (ou None)."""
+        if ordem == "novos":
+            return np.where(np.isnan(self.criado_em[slots]), SEM_DATA, -self.criado_em[slots])
+        if ordem == "distancia":
+            if d is None:
+                return np.full(len(slots), DISTANCIA_DESCONHECIDA)
+            return np.where(np.isnan(d), DISTANCIA_DESCONHECIDA, d)
+        if ordem == "custo" and d is not None:
+            return preco + perfil.custo_lote(d)
+        return preco
+
+    def _pre_filtro(self, ordem, slots, preco, k1, lat, lon, necessarios, apos, perfil):
+        """
+        Candidatos cujo k1 exato pode cair na janela, dado o k1 medido do
+        centro da célula. A distância exata difere da do centro em no máximo
+        a distância da origem ao centro (desigualdade triangular): com essa
+        folga em k1, os `necessarios` com certeza depois de `apos` limitam a
+        janela por cima, e só fica quem pode estar abaixo desse limite.
+        """
+        _, (lat_c, lon_c) = celula_origem(lat, lon)
+        erro = distancias_haversine_lote(lat, lon, np.array([lat_c]), np.array([lon_c]))[0]
+        erro = erro * (1 + 1e-9) + 1e-9  # arredondamento de ponto flutuante
+        folga = erro if ordem == "distancia" else erro * perfil.custo_por_km
+        # sem distância (NaN), k1 não depende da origem
+        sem_distancia = np.isnan(self.latitude[self.comerciante[slots]]) | np.isnan(
+            self.longitude[self.comerciante[slots]]
+        )
+        folga = np.where(sem_distancia, 0.0, folga)
+        minimo, maximo = k1 - folga, k1 + folga
+
+        certos = np.ones(len(slots), dtype=bool)
+        if apos is not None:
+            dentro = maximo >= apos[0]
+            slots, preco, minimo, maximo = slots[dentro], preco[dentro], minimo[dentro], maximo[dentro]
+            certos = minimo > apos[0]
+        if np.count_nonzero(certos) >= necessarios > 0:
+            limite = np.partition(maximo[certos], necessarios - 1)[necessarios - 1]
+            dentro = minimo <= limite
+            slots, preco = slots[dentro], preco[dentro]
+        return slots, preco
+
+    def janela(
+        self,
+        ordem,
+        necessarios,
+        ids=None,
+        estado="",
+        cidade="",
+        entrega=False,
+        permitidos=None,
+        lat=None,
+        lon=None,
+        distancias=None,
+        apos=None,
+        perfil=PERFIL_PADRAO,
+    ):
+        """
+        Os `necessarios` menores (chave, pid) pela chave (k1, preco, id) de
+        chave_ordenacao (utils/busca_produtos.py), em ordem. Filtros iguais
+        aos de _comerciante_passa; `ids` vem do índice de trigramas e
+        `distancias` ({cid: km}) do índice espacial (raio / k mais próximos).
+        Na ordem "custo", o deslocamento é o do `perfil` do consumidor.
+        """
+        if ids is None:
+            slots = np.flatnonzero(self.comerciante[:len(self.ids)] >= 0)
+        else:
+            slots = np.fromiter(
+                (self._slot_produto[pid] for pid in ids if pid in self._slot_produto), dtype=np.int64
+            )
+
+        mascara = self._mascara_comerciantes(estado, cidade, entrega, permitidos)
+        distancia_com = None
+        if distancias is not None:
+            distancia_com = np.full(len(self.cids), np.nan)
+            for cid, d in distancias.items():
+                slot = self._slot_comerciante.get(cid)
+                if slot is not None:
+                    distancia_com[slot] = d
+            mascara &= ~np.isnan(distancia_com)
+        elif lat is not None and lon is not None and ordem in ("distancia", "custo"):
+            distancia_com = self._distancias_da_origem(lat, lon)
+
+        slots = slots[mascara[self.comerciante[slots]]]
+        preco = self.preco[slots]
+        d = distancia_com[self.comerciante[slots]] if distancia_com is not None else None
+        k1 = self._k1(ordem, slots, preco, d, perfil)
+
+        if distancias is None and d is not None:
+            # k1 veio do centro da célula: fica só com quem pode entrar na
+            # janela com a distância exata e refaz k1 com ela
+            slots, preco = self._pre_filtro(ordem, slots, preco, k1, lat, lon, necessarios, apos, perfil)
+            d = distancias_haversine_lote(
+                lat, lon, self.latitude[self.comerciante[slots]], self.longitude[self.comerciante[slots]]
+            )
+            k1 = self._k1(ordem, slots, preco, d, perfil)
+
+        if apos is not None:
+            a0, a1, a2 = apos
+            depois = (k1 > a0) | ((k1 == a0) & (preco > a1))
+            # empate em (k1, preco): decide pelo id, como na tupla
+            for i in np.flatnonzero((k1 == a0) & (preco == a1)):
+                depois[i] = self.ids[slots[i]] > a2
+            slots, k1, preco = slots[depois], k1[depois], preco[depois]
+
+        if len(slots) > necessarios:
+            # só os candidatos até o k1 da posição `necessarios` (com empates)
+            corte = np.partition(k1, necessarios - 1)[necessarios - 1]
+            dentro = k1 <= corte
+            slots, k1, preco = slots[dentro], k1[dentro], preco[dentro]
+
+        posicoes = np.lexsort((preco, k1))
+        if len(posicoes) > necessarios:
+            # estende a janela com os empates em (k1, preco) do último lugar
+            ultimo = posicoes[necessarios - 1]
+            fim = necessarios
+            while fim < len(posicoes) and k1[posicoes[fim]] == k1[ultimo] and preco[posicoes[fim]] == preco[ultimo]:
+                fim += 1
+            posicoes = posicoes[:fim]
+
+        itens = [((float(k1[i]), float(preco[i]), self.ids[slots[i]]), int(slots[i])) for i in posicoes]
+        itens.sort(key=lambda item: item[0])
+        return [(chave, str(self.ids[slot])) for chave, slot in itens[:necessarios]]
+
+    def _contagens(self, codigos, selecionados):
+        contagem = np.bincount(codigos[selecionados & (codigos >= 0)])
+        valores = [
+            {"valor": self._exibicao[codigo], "total": int(contagem[codigo])}
+            for codigo in np.flatnonzero(contagem)
+        ]
+        valores.sort(key=lambda v: (-v["total"], v["valor"]))
+        return valores
+
+    def facetas(self, estado="", cidade="", categoria="", entrega=False):
+        """
+        Produtos de comerciantes ativos por estado, cidade, categoria e
+        faz_entrega. Cada faceta é contada com os outros filtros aplicados,
+        mas não com o dela (o seletor mostra as alternativas). Filtros já
+        normalizados; o resultado fica guardado até a próxima alteração.
+        """
+        chave = (estado, cidade, categoria, bool(entrega))
+        if chave in self._facetas:
+            return self._facetas[chave]
+
+        n = len(self.ids)
+        vivos = np.flatnonzero(self.comerciante[:n] >= 0)
+        com = self.comerciante[vivos]
+        ativos = self.ativo[com]
+        estados = self.estado[com]
+        cidades = self.cidade[com]
+        categorias = self.categoria[vivos]
+        faz_entrega = self.faz_entrega[com]
+
+        todos = np.ones(len(vivos), dtype=bool)
+        m_estado = estados == self._codigos.get(estado, -2) if estado else todos
+        m_cidade = cidades == self._codigos.get(cidade, -2) if cidade else todos
+        m_categoria = categorias == self._codigos.get(categoria, -2) if categoria else todos
+        m_entrega = faz_entrega if entrega else todos
+
+        resultado = {
+            "total": int(np.count_nonzero(ativos & m_estado & m_cidade & m_categoria & m_entrega)),
+            "estado": self._contagens(estados, ativos & m_cidade & m_categoria & m_entrega),
+            "cidade": self._contagens(cidades, ativos & m_estado & m_categoria & m_entrega),
+            "categoria": self._contagens(categorias, ativos & m_estado & m_cidade & m_entrega),
+            "entrega": {
+                "sim": int(np.count_nonzero(ativos & m_estado & m_cidade & m_categoria & faz_entrega)),
+                "nao": int(np.count_nonzero(ativos & m_estado & m_cidade & m_categoria & ~faz_entrega)),
+            },
+        }
+        self._facetas[chave] = resultado
+        return resultado
+
+    def status(self):
+        return {
+            "produtos": len(self._slot_produto),
+            "comerciantes": len(self.cids),
+            "origens_em_cache": len(self._distancias_origem),
+            "bytes": int(
+                self.preco.nbytes + self.criado_em.nbytes + self.comerciante.nbytes + self.categoria.nbytes
+                + self.latitude.nbytes + self.longitude.nbytes + self.ativo.nbytes
+                + self.faz_entrega.nbytes + self.estado.nbytes + self.cidade.nbytes
+            ),
+        }
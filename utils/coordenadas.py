@@ -0,0 +1,117 @@
+# utils/coordenadas.py
+# Reparo das coordenadas dos comerciantes, feito uma vez (reparar_coordenadas.py
+# e editar_comerciante) em vez de adivinhado a cada busca.
+#
+# A interpretação escolhida (original, trocada, sinais invertidos) é a mais
+# próxima do próprio município do comerciante, ou da capital da UF quando o
+# município não está na tabela de centroides.
+import numpy as np
+
+from utils.normalizacao import campo_normalizado
+from utils.localidades import sigla_uf, CAPITAIS_UF
+from utils.distancias import coordenadas_em_array, melhor_distancia_lote, try_float
+
+# distância máxima aceitável até a referência, por tipo de referência
+LIMITE_MUNICIPIO_KM = 150
+LIMITE_UF_KM = 1500
+
+# códigos de motivo gravados em coordenadas_motivo
+MOTIVO_OK = "orig"
+MOTIVO_SEM_REFERENCIA = "sem_referencia"
+
+
+def referencia_do_comerciante(comerciante, municipios):
+    """(lat, lon, fonte, limite_km) do ponto de referência, ou None."""
+    uf = sigla_uf(comerciante.get("estado"))
+    if uf is None:
+        return None
+    cidade = campo_normalizado(comerciante, "cidade")
+    if (uf, cidade) in municipios:
+        lat, lon = municipios[(uf, cidade)]
+        return lat, lon, "municipio", LIMITE_MUNICIPIO_KM
+    lat, lon = CAPITAIS_UF[uf]
+    return lat, lon, "uf", LIMITE_UF_KM
+
+
+def reparar_coordenadas(comerciantes, municipios):
+    """
+    Avalia todos os comerciantes de uma vez. Retorna uma lista, na mesma
+    ordem, de dicts com latitude, longitude (None se inválidas), motivo,
+    referencia e distancia_referencia_km.
+    """
+    if not comerciantes:
+        return []
+
+    refs = [referencia_do_comerciante(c, municipios) for c in comerciantes]
+    lats = coordenadas_em_array(c.get("latitude") for c in comerciantes)
+    lons = coordenadas_em_array(c.get("longitude") for c in comerciantes)
+    ref_lats = np.array([r[0] if r else np.nan for r in refs])
+    ref_lons = np.array([r[1] if r else np.nan for r in refs])
+    limites = np.array([r[3] if r else np.inf for r in refs])
+
+    # melhor_distancia_lote aceita um ponto de referência por comerciante
+    r = melhor_distancia_lote(ref_lats, ref_lons, lats, lons, limite_km=limites)
+
+    resultado = []
+    for i, c in enumerate(comerciantes):
+        ref = refs[i]
+        if ref is None:
+            # sem estado reconhecido não há como escolher: mantém a original se válida
+            if np.isnan(lats[i]) or np.isnan(lons[i]):
+                motivo = "missing"
+            elif abs(lats[i]) > 90 or abs(lons[i]) > 180:
+                motivo = "invalid_range"
+            else:
+                motivo = MOTIVO_SEM_REFERENCIA
+            valida = motivo == MOTIVO_SEM_REFERENCIA
+            resultado.append({
+                "latitude": float(lats[i]) if valida else None,
+                "longitude": float(lons[i]) if valida else None,
+                "motivo": motivo,
+                "referencia": None,
+                "distancia_referencia_km": None,
+            })
+            continue
+
+        ok = not np.isnan(r["distancia"][i])
+        resultado.append({
+            "latitude": float(r["lat"][i]) if ok else None,
+            "longitude": float(r["lon"][i]) if ok else None,
+            "motivo": r["motivo"][i],
+            "referencia": ref[2],
+            "distancia_referencia_km": round(float(r["distancia"][i]), 3) if ok else None,
+        })
+    return resultado
+
+
+def reparar_coordenada(comerciante, municipios):
+    """Versão de um comerciante só, usada na gravação do perfil."""
+    return reparar_coordenadas([comerciante], municipios)[0]
+
+
+def acao_do_reparo(comerciante, reparo):
+    """manter, corrigir (outra interpretação) ou limpar (nenhuma serve)."""
+    lat, lon = try_float(comerciante.get("latitude")), try_float(comerciante.get("longitude"))
+    if reparo["motivo"] in (MOTIVO_OK, MOTIVO_SEM_REFERENCIA):
+        return "manter"
+    if reparo["latitude"] is None:
+        return "limpar" if lat is not None or lon is not None else "manter"
+    return "corrigir"
+
+
+def campos_do_reparo(comerciante, reparo, agora):
+    """
+    Colunas a gravar em comerciantes. Só quando a coordenada foi corrigida
+    ou limpa: as novas, as originais recebidas, o motivo e a data. Mantida,
+    não grava nada, para não apagar o motivo de um reparo anterior.
+    """
+    if acao_do_reparo(comerciante, reparo) == "manter":
+        return {}
+    return {
+        "latitude": reparo["latitude"],
+        "longitude": reparo["longitude"],
+        "latitude_original": try_float(comerciante.get("latitude")),
+        "longitude_original": try_float(comerciante.get("longitude")),
+        "coordenadas_motivo": reparo["motivo"],
+        "coordenadas_reparadas_em": agora,
+    }
@@ -0,0 +1,113 @@
+# utils/detalhe_produto.py
+# Leitura do produto + comerciante da página de detalhe, sem ir ao banco
+# quando possível:
+#   1. snapshot do catálogo (utils/catalogo.py), se carregado;
+#   2. cache local por id de produto, limpo pelas notificações de escrita
+#      (notificar_* em utils/catalogo.py) e com idade máxima, porque
+#      alterações feitas em outros workers não passam por aqui;
+#   3. uma consulta ao Supabase, que preenche o cache.
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+from utils.catalogo import obter_catalogo
+
+MAX_ITENS = 5000
+MAX_IDADE_PADRAO = 60  # segundos
+
+
+class CacheDetalhes:
+    def __init__(self, max_itens=MAX_ITENS, max_idade=MAX_IDADE_PADRAO):
+        self.max_itens = max_itens
+        self.max_idade = max_idade
+        self.lock = threading.Lock()
+        self.itens = OrderedDict()  # produto_id -> (instante, produto com "comerciante")
+        self.por_comerciante = {}  # comerciante_id -> {produto_ids}
+        self.acertos = 0
+        self.faltas = 0
+
+    def obter(self, pid):
+        pid = str(pid)
+        with self.lock:
+            entrada = self.itens.get(pid)
+            if entrada is None or time.time() - entrada[0] > self.max_idade:
+                self.faltas += 1
+                return None
+            self.itens.move_to_end(pid)
+            self.acertos += 1
+            return entrada[1]
+
+    def guardar(self, pid, produto):
+        pid = str(pid)
+        cid = str(produto.get("comerciante_id"))
+        with self.lock:
+            self._remover(pid)
+            self.itens[pid] = (time.time(), produto)
+            self.por_comerciante.setdefault(cid, set()).add(pid)
+            while len(self.itens) > self.max_itens:
+                antigo, _ = next(iter(self.itens.items()))
+                self._remover(antigo)
+
+    def _remover(self, pid):
+        entrada = self.itens.pop(pid, None)
+        if entrada is not None:
+            ids = self.por_comerciante.get(str(entrada[1].get("comerciante_id")))
+            if ids is not None:
+                ids.discard(pid)
+
+    def invalidar_produtos(self, ids):
+        with self.lock:
+            for pid in ids:
+                self._remover(str(pid))
+
+    def invalidar_comerciantes(self, ids):
+        with self.lock:
+            for cid in ids:
+                for pid in list(self.por_comerciante.pop(str(cid), ())):
+                    self._remover(pid)
+
+    def status(self):
+        with self.lock:
+            return {"itens": len(self.itens), "acertos": self.acertos, "faltas": self.faltas}
+
+
+def obter_cache_detalhes():
+    app = current_app._get_current_object()
+    cache = app.extensions.get("detalhes_produto")
+    if cache is None:
+        cache = app.extensions.setdefault(
+            "detalhes_produto",
+            CacheDetalhes(max_idade=app.config.get("CATALOGO_MAX_IDADE", MAX_IDADE_PADRAO)),
+        )
+    return cache
+
+
+def _copia(produto, comerciante):
+    # a rota altera o comerciante (data_cadastro); nunca entrega a linha guardada
+    item = dict(produto)
+    item["comerciante"] = dict(comerciante) if comerciante else None
+    return item
+
+
+def buscar_detalhe_produto(supabase, pid):
+    """Produto com o comerciante embutido em "comerciante", ou None."""
+    catalogo = obter_catalogo()
+    if catalogo is not None:
+        with catalogo.lock:
+            p = catalogo.produtos.get(str(pid))
+            if p is not None:
+                return _copia(p, catalogo.comerciantes.get(str(p.get("comerciante_id"))))
+
+    cache = obter_cache_detalhes()
+    item = cache.obter(pid)
+    if item is not None:
+        return _copia(item, item.get("comerciante"))
+
+    resp = supabase.table("produtos").select("*, comerciante:comerciante_id(*)").eq("id", pid).execute()
+    if not resp.data:
+        return None
+    item = resp.data[0]
+    cache.guardar(pid, item)
+    return _copia(item, item.get("comerciante"))
@@ -0,0 +1,112 @@
+# utils/diretorio_comerciantes.py
+# id -> nome, cidade, estado e status de todos os comerciantes, para as
+# listagens do admin (acessos, produtos) mostrarem o comerciante de cada
+# linha sem uma consulta por linha.
+#
+# Carregado inteiro em lotes de TAMANHO_PAGINA na primeira leitura; as
+# escritas deste worker (notificar_comerciantes_* em utils/catalogo.py)
+# atualizam as entradas na hora e a idade máxima cobre as dos outros workers.
+import threading
+import time
+
+from flask import current_app
+
+MAX_IDADE_PADRAO = 300  # segundos
+TAMANHO_PAGINA = 1000
+CAMPOS = ("nome", "cidade", "estado", "status")
+
+
+def _entrada(linha, anterior=None):
+    anterior = anterior or {}
+    return {campo: linha.get(campo, anterior.get(campo)) for campo in CAMPOS}
+
+
+class DiretorioComerciantes:
+    def __init__(self, max_idade=MAX_IDADE_PADRAO):
+        self.max_idade = max_idade
+        self.lock = threading.Lock()
+        self.entradas = {}  # str(id) -> {nome, cidade, estado, status}
+        self.carregado_em = None
+        self.cargas = 0
+
+    def _carregar(self, supabase):
+        entradas = {}
+        inicio = 0
+        while True:
+            pagina = (
+                supabase.table("comerciantes")
+                .select("id, " + ", ".join(CAMPOS))
+                .order("id")
+                .range(inicio, inicio + TAMANHO_PAGINA - 1)
+                .execute()
+                .data
+                or []
+            )
+            for linha in pagina:
+                entradas[str(linha.get("id"))] = _entrada(linha)
+            if len(pagina) < TAMANHO_PAGINA:
+                return entradas
+            inicio += TAMANHO_PAGINA
+
+    def todos(self, supabase):
+        """{str(id): {nome, cidade, estado, status}}; recarrega se passou da idade."""
+        with self.lock:
+            if self.carregado_em is not None and time.time() - self.carregado_em <= self.max_idade:
+                return self.entradas
+        entradas = self._carregar(supabase)
+        with self.lock:
+            self.entradas = entradas
+            self.carregado_em = time.time()
+            self.cargas += 1
+            return self.entradas
+
+    def obter(self, supabase, cid):
+        return self.todos(supabase).get(str(cid))
+
+    # ---------------- notificações de escrita ----------------
+    def aplicar(self, linhas):
+        with self.lock:
+            if self.carregado_em is None:
+                return
+            # cópia: quem já recebeu `entradas` continua lendo a versão anterior
+            entradas = dict(self.entradas)
+            for linha in linhas:
+                cid = str(linha.get("id"))
+                entradas[cid] = _entrada(linha, entradas.get(cid))
+            self.entradas = entradas
+
+    def remover(self, ids):
+        with self.lock:
+            if self.carregado_em is None:
+                return
+            entradas = dict(self.entradas)
+            for cid in ids:
+                entradas.pop(str(cid), None)
+            self.entradas = entradas
+
+    def invalidar(self):
+        with self.lock:
+            self.carregado_em = None
+
+    def status(self):
+        with self.lock:
+            return {
+                "comerciantes": len(self.entradas),
+                "idade": None if self.carregado_em is None else round(time.time() - self.carregado_em, 1),
+                "cargas": self.cargas,
+            }
+
+
+_lock_criacao = threading.Lock()
+
+
+def obter_diretorio_comerciantes():
+    app = current_app._get_current_object()
+    diretorio = app.extensions.get("diretorio_comerciantes")
+    if diretorio is None:
+        with _lock_criacao:
+            diretorio = app.extensions.setdefault(
+                "diretorio_comerciantes",
+                DiretorioComerciantes(max_idade=app.config.get("ADMIN_DIRETORIO_MAX_IDADE", MAX_IDADE_PADRAO)),
+            )
+    return diretorio
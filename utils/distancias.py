@@ -0,0 +1,226 @@
+# utils/distancias.py
+# Funções de distância e custo de deslocamento usadas na busca do consumidor.
+import math
+
+import numpy as np
+
+R_TERRA_KM = 6372.795477598
+LIMITE_ABSURDO_KM = 2000
+
+
+# ---------------- Tratamento seguro de latitude/longitude ----------------
+def try_float(v):
+    if v is None:
+        return None
+    if isinstance(v, (float, int)):
+        return float(v)
+    s = str(v).strip().replace(",", ".")
+    try:
+        return float(s)
+    except:
+        return None
+
+# ---------------- Haversine (linha reta precisa, km) ----------------
+def distancia_haversine(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    return R_TERRA_KM * c
+
+# ---------------- Estimativa de custo de deslocamento ----------------
+CONSUMO_PADRAO_KM_L = 10
+PRECO_LITRO_PADRAO = 6.0
+MODOS_DESLOCAMENTO = ("carro", "a_pe", "entrega")
+
+
+def custo_deslocamento(distancia_km, consumo_km_l=CONSUMO_PADRAO_KM_L, preco_litro=PRECO_LITRO_PADRAO):
+    if distancia_km is None:
+        return 0.0
+    litros_necessarios = distancia_km / consumo_km_l
+    return litros_necessarios * preco_litro
+
+
+class PerfilDeslocamento:
+    """
+    Como o consumidor chega à loja: de carro (km/l, preço do litro, só ida
+    ou ida e volta), a pé ou recebendo em casa (só lojas que entregam).
+    O custo é linear na distância (custo_por_km), então o mesmo número vale
+    no escalar, no lote NumPy e na RPC (p_custo_km).
+    """
+
+    __slots__ = ("modo", "consumo_km_l", "preco_litro", "ida_e_volta", "custo_por_km")
+
+    def __init__(self, modo="carro", consumo_km_l=CONSUMO_PADRAO_KM_L, preco_litro=PRECO_LITRO_PADRAO, ida_e_volta=False):
+        self.modo = modo
+        self.consumo_km_l = consumo_km_l
+        self.preco_litro = preco_litro
+        self.ida_e_volta = ida_e_volta
+        if modo == "carro":
+            self.custo_por_km = preco_litro / consumo_km_l * (2 if ida_e_volta else 1)
+        else:
+            self.custo_por_km = 0.0
+
+    def chave(self):
+        return (self.modo, self.consumo_km_l, self.preco_litro, self.ida_e_volta)
+
+    def __eq__(self, outro):
+        return isinstance(outro, PerfilDeslocamento) and self.chave() == outro.chave()
+
+    def __hash__(self):
+        return hash(self.chave())
+
+    @property
+    def so_entrega(self):
+        return self.modo == "entrega"
+
+    def custo(self, distancia_km):
+        if distancia_km is None:
+            return 0.0
+        return distancia_km * self.custo_por_km
+
+    def custo_lote(self, distancias_km):
+        """custo vetorizado: distância NaN custa 0, como None no escalar."""
+        custo = np.asarray(distancias_km, dtype=np.float64) * self.custo_por_km
+        return np.where(np.isnan(custo), 0.0, custo)
+
+    def como_dict(self):
+        return {
+            "modo": self.modo,
+            "consumo_km_l": self.consumo_km_l,
+            "preco_litro": self.preco_litro,
+            "ida_e_volta": self.ida_e_volta,
+            "custo_por_km": self.custo_por_km,
+        }
+
+
+PERFIL_PADRAO = PerfilDeslocamento()
+
+
+def _limitado(valor, padrao, minimo, maximo):
+    valor = try_float(valor)
+    if valor is None or valor != valor:  # NaN
+        return padrao
+    return min(max(valor, minimo), maximo)
+
+
+def perfil_da_request(args):
+    """
+    Lê modo, consumo (km/l), preco_litro e ida_volta da querystring (ou do
+    corpo JSON, que também tem .get). Valores ausentes ou inválidos ficam
+    no padrão: carro a 10 km/l, R$ 6,00 o litro, só ida.
+    """
+    modo = args.get("modo")
+    modo = modo.strip().lower() if isinstance(modo, str) else "carro"
+    if modo not in MODOS_DESLOCAMENTO:
+        modo = "carro"
+    ida_volta = args.get("ida_volta")
+    return PerfilDeslocamento(
+        modo=modo,
+        consumo_km_l=_limitado(args.get("consumo"), CONSUMO_PADRAO_KM_L, 1.0, 100.0),
+        preco_litro=_limitado(args.get("preco_litro"), PRECO_LITRO_PADRAO, 0.0, 50.0),
+        ida_e_volta=ida_volta is True or str(ida_volta).lower() == "true",
+    )
+
+# =====================================================================
+# Versões em lote (NumPy): um usuário contra todos os comerciantes
+# =====================================================================
+
+# (lat, lon) de cada interpretação, na mesma ordem de prioridade do escalar
+COMBINACOES = ("orig", "swap", "neg_lat", "neg_lon", "neg_both")
+
+
+def coordenadas_em_array(valores):
+    """Converte latitudes/longitudes cruas (str, None, número) em float64 com NaN."""
+    return np.array([np.nan if (v := try_float(x)) is None else v for x in valores], dtype=np.float64)
+
+
+def distancias_haversine_lote(lat, lon, lats, lons):
+    """Distância (km) de (lat, lon) a cada par de lats/lons; NaN onde faltar coordenada."""
+    lat1 = np.radians(lat)
+    lon1 = np.radians(lon)
+    lat2 = np.radians(lats)
+    lon2 = np.radians(lons)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return R_TERRA_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def custo_deslocamento_lote(distancias_km, consumo_km_l=CONSUMO_PADRAO_KM_L, preco_litro=PRECO_LITRO_PADRAO):
+    """custo_deslocamento vetorizado: distância NaN custa 0, como None no escalar."""
+    custo = np.asarray(distancias_km, dtype=np.float64) / consumo_km_l * preco_litro
+    return np.where(np.isnan(custo), 0.0, custo)
+
+
+def melhor_distancia_lote(lat_user, lon_user, lats, lons, limite_km=LIMITE_ABSURDO_KM):
+    """
+    Escolhe, entre as interpretações (orig, swap, sinais invertidos), a mais
+    plausível (mais próxima do usuário) para arrays de coordenadas (float64, NaN = ausente). Avalia as cinco interpretações
+    de uma vez e devolve um dict de arrays:
+    lat, lon, distancia (NaN se inválida) e motivo (str).
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+
+    cand_lat = np.stack([lats, lons, -lats, lats, -lats])
+    cand_lon = np.stack([lons, lats, lons, -lons, -lons])
+
+    validos = (
+        ~np.isnan(cand_lat) & ~np.isnan(cand_lon)
+        & (np.abs(cand_lat) <= 90) & (np.abs(cand_lon) <= 180)
+    )
+    with np.errstate(invalid="ignore"):
+        dist = distancias_haversine_lote(lat_user, lon_user, cand_lat, cand_lon)
+    dist = np.where(validos, dist, np.inf)
+
+    # argmin devolve o primeiro empate: mesma prioridade do laço escalar
+    melhor = np.argmin(dist, axis=0)
+    colunas = np.arange(lats.shape[0])
+    menor = dist[melhor, colunas]
+
+    ok = np.isfinite(menor) & (menor <= limite_km)
+    motivo = np.array(COMBINACOES, dtype=object)[melhor]
+    motivo[~np.isfinite(menor)] = "invalid_range"
+    motivo[np.isfinite(menor) & (menor > limite_km)] = "absurdo"
+    motivo[np.isnan(lats) & np.isnan(lons)] = "missing"
+
+    return {
+        "lat": np.where(ok, cand_lat[melhor, colunas], np.nan),
+        "lon": np.where(ok, cand_lon[melhor, colunas], np.nan),
+        "distancia": np.where(ok, menor, np.nan),
+        "motivo": motivo,
+    }
+
+
+def distancias_por_comerciante(lat_user, lon_user, comerciantes, perfil=PERFIL_PADRAO):
+    """
+    Calcula de uma vez distância e custo_viagem (no `perfil` de
+    deslocamento) de cada comerciante (dict id -> linha).
+    Retorna {id: {"distancia", "custo_viagem", "motivo"}}.
+    Sem localização do usuário, todos ficam com distância None e custo 0.
+
+    As coordenadas gravadas já foram reparadas (utils/coordenadas.py), então
+    aqui só vale a interpretação original, se estiver dentro da faixa.
+    """
+    ids = list(comerciantes)
+    if lat_user is None or lon_user is None or not ids:
+        return {cid: {"distancia": None, "custo_viagem": 0.0, "motivo": None} for cid in ids}
+
+    lats = coordenadas_em_array(comerciantes[cid].get("latitude") for cid in ids)
+    lons = coordenadas_em_array(comerciantes[cid].get("longitude") for cid in ids)
+    faltando = np.isnan(lats) | np.isnan(lons)
+    with np.errstate(invalid="ignore"):
+        fora = ~faltando & ((np.abs(lats) > 90) | (np.abs(lons) > 180))
+        dist = distancias_haversine_lote(lat_user, lon_user, lats, lons)
+    dist = np.where(faltando | fora, np.nan, dist)
+    custos = perfil.custo_lote(dist)
+
+    resultado = {}
+    for i, cid in enumerate(ids):
+        d = dist[i]
+        resultado[cid] = {
+            "distancia": None if np.isnan(d) else float(d),
+            "custo_viagem": float(custos[i]),
+            "motivo": "missing" if faltando[i] else "invalid_range" if fora[i] else "orig",
+        }
+    return resultado
@@ -0,0 +1,128 @@
+# utils/estatisticas_painel.py
+# Contadores do painel do admin (/admin/dashboard) sem baixar as tabelas:
+#   1. RPC estatisticas_painel (sql/estatisticas_painel.sql): todos os
+#      contadores num count(*) só do lado do banco, uma ida e volta;
+#   2. sem a RPC, uma consulta count="exact" por contador (só o total volta,
+#      com limit(1)), disparadas em paralelo.
+# O resultado fica guardado por alguns segundos; escritas deste worker que
+# mudam os contadores (notificar_* em utils/catalogo.py, aprovação e
+# cadastro de comerciante) limpam antes do prazo.
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+MAX_IDADE_PADRAO = 30  # segundos
+
+# contador -> (tabela, filtro de igualdade ou None)
+CONTADORES = {
+    "total_comerciantes": ("comerciantes", None),
+    "aprovados": ("comerciantes", ("status", "ativo")),
+    "bloqueados": ("comerciantes", ("status", "bloqueado")),
+    "pendentes": ("comerciantes_pendentes", None),
+    "total_produtos": ("produtos", None),
+    "total_pesquisas": ("pesquisas", None),
+    "total_acessos": ("historico_comerciantes", None),
+}
+
+
+def _contar(supabase, tabela, filtro):
+    consulta = supabase.table(tabela).select("id", count="exact")
+    if filtro is not None:
+        consulta = consulta.eq(*filtro)
+    return consulta.limit(1).execute().count or 0
+
+
+def contadores_do_banco(supabase):
+    """Todos os contadores: pela RPC ou, se ela não existir, em paralelo."""
+    try:
+        resp = supabase.rpc("estatisticas_painel", {}).execute()
+        if isinstance(resp.data, dict):
+            return {nome: int(resp.data.get(nome) or 0) for nome in CONTADORES}
+    except Exception as e:
+        print("❌ ERRO NA RPC estatisticas_painel (usando contagens separadas):", e)
+
+    with ThreadPoolExecutor(max_workers=len(CONTADORES)) as executor:
+        futuros = {
+            nome: executor.submit(_contar, supabase, tabela, filtro)
+            for nome, (tabela, filtro) in CONTADORES.items()
+        }
+        return {nome: futuro.result() for nome, futuro in futuros.items()}
+
+
+class EstatisticasPainel:
+    def __init__(self, max_idade=MAX_IDADE_PADRAO):
+        self.max_idade = max_idade
+        self.lock = threading.Lock()
+        self.contadores = None
+        self.lido_em = None
+        self.geracao = 0  # muda a cada invalidar: leitura em andamento não sobrescreve
+        self.leituras = 0
+        self.acertos = 0
+        self.ultimo_erro = None
+
+    def valido(self):
+        return self.lido_em is not None and time.time() - self.lido_em <= self.max_idade
+
+    def obter(self, supabase):
+        """Contadores guardados, ou lidos agora se passaram do prazo."""
+        with self.lock:
+            if self.valido():
+                self.acertos += 1
+                return dict(self.contadores)
+            geracao = self.geracao
+
+        try:
+            contadores = contadores_do_banco(supabase)
+        except Exception:
+            self.ultimo_erro = traceback.format_exc(limit=1)
+            raise
+
+        with self.lock:
+            self.leituras += 1
+            self.ultimo_erro = None
+            if geracao == self.geracao:
+                self.contadores = contadores
+                self.lido_em = time.time()
+        return dict(contadores)
+
+    def invalidar(self):
+        with self.lock:
+            self.geracao += 1
+            self.lido_em = None
+
+    def status(self):
+        with self.lock:
+            return {
+                "idade": None if self.lido_em is None else round(time.time() - self.lido_em, 1),
+                "leituras": self.leituras,
+                "acertos": self.acertos,
+                "ultimo_erro": self.ultimo_erro,
+            }
+
+
+_lock_criacao = threading.Lock()
+
+
+def obter_estatisticas_painel():
+    app = current_app._get_current_object()
+    estatisticas = app.extensions.get("estatisticas_painel")
+    if estatisticas is None:
+        with _lock_criacao:
+            estatisticas = app.extensions.setdefault(
+                "estatisticas_painel",
+                EstatisticasPainel(max_idade=app.config.get("ADMIN_ESTATISTICAS_MAX_IDADE", MAX_IDADE_PADRAO)),
+            )
+    return estatisticas
+
+
+def invalidar_estatisticas_painel():
+    """Chamado depois de escritas que mudam os contadores (se o cache já existir)."""
+    try:
+        estatisticas = current_app.extensions.get("estatisticas_painel")
+    except RuntimeError:
+        return
+    if estatisticas is not None:
+        estatisticas.invalidar()
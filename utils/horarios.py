@@ -0,0 +1,170 @@
+# utils/horarios.py
+# Horário de funcionamento compilado em intervalos de "minuto da semana"
+# (0 = segunda 00:00, 10079 = domingo 23:59), no fuso local da loja.
+#
+# O dict horario_funcionamento ({"Segunda": {"inicio", "fim", "fechado"}, ...})
+# é convertido uma vez (na gravação do perfil, ou ao entrar no snapshot) e
+# o status aberto/fechado vira uma busca binária em até 14 intervalos, sem
+# strptime por produto a cada request.
+import bisect
+import json
+from datetime import datetime, timezone
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+
+from utils.localidades import fuso_do_estado
+
+DIAS_SEMANA = ['Segunda', 'Terça', 'Quarta', 'Quinta', 'Sexta', 'Sábado', 'Domingo']
+MINUTOS_DIA = 24 * 60
+MINUTOS_SEMANA = 7 * MINUTOS_DIA
+FECHA_EM_BREVE_MIN = 90  # mesmo limite do alerta da página do produto
+
+
+def _minutos(texto):
+    horas, minutos = str(texto).strip().split(":")[:2]
+    h, m = int(horas), int(minutos)
+    if not (0 <= h <= 23 and 0 <= m <= 59):
+        raise ValueError(texto)
+    return h * 60 + m
+
+
+def compilar_horario(horario_funcionamento):
+    """
+    Retorna {"intervalos": [[inicio, fim], ...], "sem_horario": [dias]}.
+    Intervalos em minutos da semana, meio-abertos, ordenados e já unidos;
+    um turno que passa da meia-noite continua no dia seguinte (e domingo
+    continua na segunda). Dias sem informação (ou inválida) vão para
+    sem_horario, como no cálculo antigo.
+    """
+    horario = horario_funcionamento or {}
+    intervalos = []
+    sem_horario = []
+    for dia, nome in enumerate(DIAS_SEMANA):
+        info = horario.get(nome) or {}
+        if info.get("fechado"):
+            continue
+        try:
+            inicio = _minutos(info.get("inicio") or "")
+            fim = _minutos(info.get("fim") or "")
+        except (ValueError, TypeError):
+            sem_horario.append(dia)
+            continue
+
+        base = dia * MINUTOS_DIA
+        a = base + inicio
+        b = base + fim if fim > inicio else base + MINUTOS_DIA + fim
+        if b > MINUTOS_SEMANA:
+            intervalos.append([a, MINUTOS_SEMANA])
+            intervalos.append([0, b - MINUTOS_SEMANA])
+        elif b > a:
+            intervalos.append([a, b])
+
+    intervalos.sort()
+    unidos = []
+    for a, b in intervalos:
+        if unidos and a <= unidos[-1][1]:
+            unidos[-1][1] = max(unidos[-1][1], b)
+        else:
+            unidos.append([a, b])
+    return {"intervalos": unidos, "sem_horario": sem_horario}
+
+
+class HorarioLoja:
+    """Horário compilado + fuso; consultas em O(log n) com n <= 14."""
+
+    __slots__ = ("inicios", "intervalos", "sem_horario", "fuso")
+
+    def __init__(self, compilado, fuso):
+        self.intervalos = [tuple(i) for i in compilado.get("intervalos") or []]
+        self.inicios = [a for a, _ in self.intervalos]
+        self.sem_horario = frozenset(compilado.get("sem_horario") or ())
+        self.fuso = fuso
+
+    def minuto_local(self, agora_utc):
+        local = agora_utc.astimezone(_zona(self.fuso))
+        return local.weekday() * MINUTOS_DIA + local.hour * 60 + local.minute
+
+    def situacao(self, agora_utc):
+        """(status, minutos_para_fechar): aberto / fechado / sem_horario."""
+        m = self.minuto_local(agora_utc)
+        i = bisect.bisect_right(self.inicios, m) - 1
+        if i >= 0 and m < self.intervalos[i][1]:
+            restante = self.intervalos[i][1] - m
+            # aberto até o fim da semana e de novo desde segunda 00:00
+            if self.intervalos[i][1] == MINUTOS_SEMANA and self.inicios and self.inicios[0] == 0:
+                restante += self.intervalos[0][1]
+            return "aberto", restante
+        if m // MINUTOS_DIA in self.sem_horario:
+            return "sem_horario", None
+        return "fechado", None
+
+
+@lru_cache(maxsize=64)
+def _zona(nome):
+    return ZoneInfo(nome)
+
+
+@lru_cache(maxsize=20000)
+def _horario_de_texto(texto, fuso):
+    return HorarioLoja(compilar_horario(json.loads(texto)), fuso)
+
+
+def horario_do_comerciante(comerciante):
+    """
+    HorarioLoja do comerciante: usa horario_compilado/fuso_horario gravados
+    pelo perfil (sql/horarios_compilados.sql) e, para linhas antigas sem
+    eles, compila uma vez por conteúdo (cache em memória).
+    """
+    fuso = comerciante.get("fuso_horario") or fuso_do_estado(comerciante.get("estado"))
+    compilado = comerciante.get("horario_compilado")
+    if compilado is not None:
+        return HorarioLoja(compilado, fuso)
+    texto = json.dumps(comerciante.get("horario_funcionamento") or {}, sort_keys=True)
+    return _horario_de_texto(texto, fuso)
+
+
+def situacao_do_comerciante(comerciante, agora_utc=None):
+    """Atalho: (status, minutos_para_fechar) agora, no fuso da loja."""
+    return horario_do_comerciante(comerciante).situacao(agora_utc or datetime.now(timezone.utc))
+
+
+def campos_horario_comerciante(dados):
+    """Colunas gravadas junto com horario_funcionamento no perfil."""
+    return {
+        "horario_compilado": compilar_horario(dados.get("horario_funcionamento")),
+        "fuso_horario": fuso_do_estado(dados.get("estado")),
+    }
+
+
+class IndiceHorarios:
+    """Horários compilados dos comerciantes do snapshot (utils/catalogo.py)."""
+
+    def __init__(self):
+        self.horarios = {}  # comerciante_id -> HorarioLoja
+
+    def __len__(self):
+        return len(self.horarios)
+
+    def adicionar(self, cid, comerciante):
+        self.horarios[str(cid)] = horario_do_comerciante(comerciante)
+
+    def remover(self, cid, comerciante=None):
+        self.horarios.pop(str(cid), None)
+
+    def limpar(self):
+        self.horarios = {}
+
+    def situacao(self, cid, agora_utc):
+        horario = self.horarios.get(str(cid))
+        if horario is None:
+            return "sem_horario", None
+        return horario.situacao(agora_utc)
+
+    def abertos(self, agora_utc, fecha_em_ate=None):
+        """Ids abertos agora (e, com fecha_em_ate, que fecham em até N minutos)."""
+        ids = set()
+        for cid, horario in self.horarios.items():
+            status, restante = horario.situacao(agora_utc)
+            if status == "aberto" and (fecha_em_ate is None or restante <= fecha_em_ate):
+                ids.add(cid)
+        return ids
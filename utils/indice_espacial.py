@@ -0,0 +1,151 @@
+# utils/indice_espacial.py
+# Grade de células lat/lon com os comerciantes ativos, para as consultas de
+# "próximos": todos dentro de um raio e os k mais próximos.
+#
+# Cada célula tem TAMANHO_CELULA graus de lado (~11 km no equador). As buscas
+# visitam só as células que podem conter resultados, em anéis a partir da
+# célula do usuário, e calculam haversine apenas para quem está nelas.
+import heapq
+import math
+
+from utils.distancias import try_float, distancia_haversine
+
+TAMANHO_CELULA = 0.1  # graus
+KM_POR_GRAU = 111.19
+
+
+def coordenadas_validas(comerciante):
+    lat = try_float(comerciante.get("latitude"))
+    lon = try_float(comerciante.get("longitude"))
+    if lat is None or lon is None:
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return lat, lon
+
+
+class IndiceEspacial:
+    def __init__(self, tamanho_celula=TAMANHO_CELULA):
+        self.tamanho_celula = tamanho_celula
+        self.celulas = {}  # (i, j) -> {comerciante_id: (lat, lon)}
+        self.posicoes = {}  # comerciante_id -> (i, j)
+
+    def __len__(self):
+        return len(self.posicoes)
+
+    def _celula(self, lat, lon):
+        return (math.floor(lat / self.tamanho_celula), math.floor(lon / self.tamanho_celula))
+
+    # ---------------- manutenção ----------------
+    def adicionar(self, cid, comerciante):
+        cid = str(cid)
+        self.remover(cid)
+        if comerciante.get("status") != "ativo":
+            return
+        coords = coordenadas_validas(comerciante)
+        if coords is None:
+            return
+        celula = self._celula(*coords)
+        self.celulas.setdefault(celula, {})[cid] = coords
+        self.posicoes[cid] = celula
+
+    def remover(self, cid, comerciante=None):
+        celula = self.posicoes.pop(str(cid), None)
+        if celula is None:
+            return
+        membros = self.celulas.get(celula)
+        if membros is not None:
+            membros.pop(str(cid), None)
+            if not membros:
+                del self.celulas[celula]
+
+    def limpar(self):
+        self.__init__(self.tamanho_celula)
+
+    # ---------------- consultas ----------------
+    def _anel(self, centro, r):
+        ci, cj = centro
+        if r == 0:
+            yield centro
+            return
+        for j in range(cj - r, cj + r + 1):
+            yield (ci - r, j)
+            yield (ci + r, j)
+        for i in range(ci - r + 1, ci + r):
+            yield (i, cj - r)
+            yield (i, cj + r)
+
+    def _raio_coberto(self, lat, r):
+        # depois dos anéis 0..r, nada não visto está a menos de r células;
+        # usa a largura da célula mais estreita (mais longe do equador) do anel
+        cos_lat = max(math.cos(math.radians(min(abs(lat) + (r + 1) * self.tamanho_celula, 90))), 0.01)
+        return r * self.tamanho_celula * KM_POR_GRAU * cos_lat
+
+    def dentro_do_raio(self, lat, lon, raio_km):
+        """Dict {comerciante_id: distancia_km} de quem está a até raio_km."""
+        if not self.posicoes:
+            return {}
+        dlat = raio_km / KM_POR_GRAU
+        dlon = raio_km / (KM_POR_GRAU * max(math.cos(math.radians(min(abs(lat) + dlat, 90))), 0.01))
+        i0, j0 = self._celula(lat - dlat, lon - dlon)
+        i1, j1 = self._celula(lat + dlat, lon + dlon)
+
+        resultado = {}
+        if (i1 - i0 + 1) * (j1 - j0 + 1) > len(self.celulas):
+            # raio enorme: mais barato olhar só as células ocupadas
+            celulas = (m for (i, j), m in self.celulas.items() if i0 <= i <= i1 and j0 <= j <= j1)
+        else:
+            celulas = (
+                self.celulas[(i, j)]
+                for i in range(i0, i1 + 1)
+                for j in range(j0, j1 + 1)
+                if (i, j) in self.celulas
+            )
+        for membros in celulas:
+            for cid, (clat, clon) in membros.items():
+                d = distancia_haversine(lat, lon, clat, clon)
+                if d <= raio_km:
+                    resultado[cid] = d
+        return resultado
+
+    def por_proximidade(self, lat, lon, raio_max_km=None):
+        """
+        Gera (distancia_km, comerciante_id) do mais próximo para o mais distante,
+        abrindo anéis de células só quando necessário.
+        """
+        if not self.posicoes:
+            return
+        centro = self._celula(lat, lon)
+        max_anel = max(
+            max(abs(i - centro[0]), abs(j - centro[1])) for i, j in self.celulas
+        )
+
+        heap = []
+        r = 0
+        while r <= max_anel or heap:
+            if r <= max_anel:
+                for celula in self._anel(centro, r):
+                    for cid, (clat, clon) in self.celulas.get(celula, {}).items():
+                        heapq.heappush(heap, (distancia_haversine(lat, lon, clat, clon), cid))
+                coberto = self._raio_coberto(lat, r)
+                r += 1
+            else:
+                coberto = float("inf")
+
+            while heap and heap[0][0] <= coberto:
+                d, cid = heapq.heappop(heap)
+                if raio_max_km is not None and d > raio_max_km:
+                    return
+                yield d, cid
+
+            if raio_max_km is not None and coberto > raio_max_km and not heap:
+                return
+
+    def mais_proximos(self, lat, lon, k, raio_max_km=None):
+        """Dict {comerciante_id: distancia_km} dos k comerciantes mais próximos."""
+        resultado = {}
+        for d, cid in self.por_proximidade(lat, lon, raio_max_km):
+            resultado[cid] = d
+            if len(resultado) >= k:
+                break
+        return resultado
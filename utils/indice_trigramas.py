@@ -0,0 +1,98 @@
+# utils/indice_trigramas.py
+# Índice invertido de trigramas para busca por substring em nomes de produtos.
+#
+# Cada produto ganha um "slot" inteiro; cada trigrama do texto normalizado
+# aponta para o conjunto de slots que o contém. Uma busca intersecta os
+# conjuntos dos trigramas da consulta (do menor para o maior) e confirma
+# o substring só nos candidatos que sobraram.
+from utils.normalizacao import normaliza, campo_normalizado
+
+SEPARADOR_CAMPOS = "\n"  # nunca aparece numa consulta normalizada
+
+
+def trigramas(texto):
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+class IndiceTrigramas:
+    def __init__(self, campos=("nome",)):
+        self.campos = tuple(campos)
+        self.postings = {}  # trigrama -> {slots}
+        self.textos = {}  # slot -> texto normalizado
+        self._slot_por_id = {}
+        self._id_por_slot = {}
+        self._slots_livres = []
+        self._proximo_slot = 0
+
+    def __len__(self):
+        return len(self.textos)
+
+    def texto_do_produto(self, produto):
+        return SEPARADOR_CAMPOS.join(campo_normalizado(produto, campo) for campo in self.campos)
+
+    # ---------------- manutenção ----------------
+    def adicionar(self, pid, produto):
+        pid = str(pid)
+        if pid in self._slot_por_id:
+            self.remover(pid)
+
+        if self._slots_livres:
+            slot = self._slots_livres.pop()
+        else:
+            slot = self._proximo_slot
+            self._proximo_slot += 1
+
+        texto = self.texto_do_produto(produto)
+        self._slot_por_id[pid] = slot
+        self._id_por_slot[slot] = pid
+        self.textos[slot] = texto
+        for tri in trigramas(texto):
+            self.postings.setdefault(tri, set()).add(slot)
+
+    def remover(self, pid, produto=None):
+        slot = self._slot_por_id.pop(str(pid), None)
+        if slot is None:
+            return
+        texto = self.textos.pop(slot)
+        self._id_por_slot.pop(slot, None)
+        for tri in trigramas(texto):
+            slots = self.postings.get(tri)
+            if slots is not None:
+                slots.discard(slot)
+                if not slots:
+                    del self.postings[tri]
+        self._slots_livres.append(slot)
+
+    def limpar(self):
+        self.__init__(self.campos)
+
+    # ---------------- consulta ----------------
+    def buscar(self, consulta):
+        """
+        Retorna o conjunto de ids cujo texto contém `consulta` (já normalizada
+        ou não). Consultas com menos de 3 caracteres caem numa varredura
+        dos textos pré-normalizados.
+        """
+        consulta = normaliza(consulta)
+        if not consulta:
+            return set(self._slot_por_id)
+
+        if len(consulta) < 3:
+            return {self._id_por_slot[s] for s, texto in self.textos.items() if consulta in texto}
+
+        listas = []
+        for tri in trigramas(consulta):
+            slots = self.postings.get(tri)
+            if not slots:
+                return set()
+            listas.append(slots)
+        listas.sort(key=len)
+
+        candidatos = set(listas[0])
+        for slots in listas[1:]:
+            candidatos &= slots
+            if not candidatos:
+                return set()
+
+        # trigramas em comum não garantem a ordem: confirma o substring
+        return {self._id_por_slot[s] for s in candidatos if consulta in self.textos[s]}
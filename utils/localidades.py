@@ -0,0 +1,143 @@
+# utils/localidades.py
+# Tabelas de UF e centroides de municípios usadas como ponto de referência
+# (reparo de coordenadas, fuso horário por estado).
+import csv
+import os
+
+from utils.normalizacao import normaliza
+
+NOMES_UF = {
+    "AC": "Acre",
+    "AL": "Alagoas",
+    "AP": "Amapá",
+    "AM": "Amazonas",
+    "BA": "Bahia",
+    "CE": "Ceará",
+    "DF": "Distrito Federal",
+    "ES": "Espírito Santo",
+    "GO": "Goiás",
+    "MA": "Maranhão",
+    "MT": "Mato Grosso",
+    "MS": "Mato Grosso do Sul",
+    "MG": "Minas Gerais",
+    "PA": "Pará",
+    "PB": "Paraíba",
+    "PR": "Paraná",
+    "PE": "Pernambuco",
+    "PI": "Piauí",
+    "RJ": "Rio de Janeiro",
+    "RN": "Rio Grande do Norte",
+    "RS": "Rio Grande do Sul",
+    "RO": "Rondônia",
+    "RR": "Roraima",
+    "SC": "Santa Catarina",
+    "SP": "São Paulo",
+    "SE": "Sergipe",
+    "TO": "Tocantins",
+}
+
+# coordenadas das capitais: referência quando o município não está na tabela
+CAPITAIS_UF = {
+    "AC": (-9.9750, -67.8243),
+    "AL": (-9.6660, -35.7350),
+    "AP": (0.0349, -51.0694),
+    "AM": (-3.1187, -60.0212),
+    "BA": (-12.9718, -38.5011),
+    "CE": (-3.7166, -38.5423),
+    "DF": (-15.7795, -47.9297),
+    "ES": (-20.3155, -40.3128),
+    "GO": (-16.6864, -49.2643),
+    "MA": (-2.5387, -44.2825),
+    "MT": (-15.6010, -56.0974),
+    "MS": (-20.4486, -54.6295),
+    "MG": (-19.9102, -43.9266),
+    "PA": (-1.4550, -48.5024),
+    "PB": (-7.1151, -34.8641),
+    "PR": (-25.4195, -49.2646),
+    "PE": (-8.0467, -34.8771),
+    "PI": (-5.0919, -42.8034),
+    "RJ": (-22.9129, -43.2003),
+    "RN": (-5.7936, -35.1986),
+    "RS": (-30.0318, -51.2065),
+    "RO": (-8.7608, -63.8999),
+    "RR": (2.8238, -60.6753),
+    "SC": (-27.5945, -48.5477),
+    "SP": (-23.5329, -46.6395),
+    "SE": (-10.9091, -37.0677),
+    "TO": (-10.2400, -48.3558),
+}
+
+# fuso horário local de cada UF (horário de funcionamento das lojas)
+FUSO_PADRAO = "America/Sao_Paulo"
+FUSOS_UF = {
+    "AC": "America/Rio_Branco",
+    "AM": "America/Manaus",
+    "RR": "America/Boa_Vista",
+    "RO": "America/Porto_Velho",
+    "MT": "America/Cuiaba",
+    "MS": "America/Campo_Grande",
+    "PA": "America/Belem",
+    "AP": "America/Belem",
+    "TO": "America/Araguaina",
+    "MA": "America/Fortaleza",
+    "PI": "America/Fortaleza",
+    "CE": "America/Fortaleza",
+    "RN": "America/Fortaleza",
+    "PB": "America/Fortaleza",
+    "PE": "America/Recife",
+    "AL": "America/Maceio",
+    "SE": "America/Maceio",
+    "BA": "America/Bahia",
+}
+
+_UF_POR_NOME = {normaliza(nome): uf for uf, nome in NOMES_UF.items()}
+
+# CSV com colunas nome, uf, latitude, longitude (ex.: tabela de municípios do IBGE)
+CAMINHO_MUNICIPIOS = os.getenv(
+    "MUNICIPIOS_CSV",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "municipios.csv"),
+)
+
+
+def sigla_uf(estado):
+    """Aceita "SP", "sp", "São Paulo" ou "sao paulo" e devolve "SP" (ou None)."""
+    valor = normaliza(estado)
+    if not valor:
+        return None
+    if valor.upper() in NOMES_UF:
+        return valor.upper()
+    return _UF_POR_NOME.get(valor)
+
+
+def fuso_do_estado(estado):
+    """Nome IANA do fuso da UF; horário de Brasília se o estado não for reconhecido."""
+    return FUSOS_UF.get(sigla_uf(estado), FUSO_PADRAO)
+
+
+def carregar_municipios(caminho=CAMINHO_MUNICIPIOS):
+    """{(UF, cidade normalizada): (lat, lon)}; vazio se o arquivo não existir."""
+    if not caminho or not os.path.exists(caminho):
+        return {}
+    municipios = {}
+    with open(caminho, encoding="utf-8") as f:
+        for linha in csv.DictReader(f):
+            uf = sigla_uf(linha.get("uf"))
+            try:
+                lat = float(str(linha.get("latitude")).replace(",", "."))
+                lon = float(str(linha.get("longitude")).replace(",", "."))
+            except (TypeError, ValueError):
+                continue
+            if uf:
+                municipios[(uf, normaliza(linha.get("nome")))] = (lat, lon)
+    return municipios
+
+
+_municipios = None
+
+
+def obter_municipios():
+    """Tabela de municípios carregada uma vez por processo."""
+    global _municipios
+    if _municipios is None:
+        _municipios = carregar_municipios()
+    return _municipios
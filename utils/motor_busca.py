@@ -0,0 +1,329 @@
+# utils/motor_busca.py
+# Motor único da busca do consumidor, usado pela página (consumidor_home) e
+# pela API JSON (api_produtos), com tempo medido por etapa:
+#
+#   consulta     querystring -> filtros normalizados, ordem, cursor e perfil
+#                de deslocamento (carro/a pé/entrega, km/l, preço do litro)
+#   candidatos   snapshot em memória ou RPC (utils/busca_produtos.py); sem
+#                nada exato, busca tolerante a erros (utils/busca_aproximada.py)
+#   agrupamento  opcional: mesmo item em várias lojas, N ofertas mais baratas
+#   horarios     aberto/fechado de cada loja da página (utils/horarios.py)
+#   distancias   linha reta em lote ou, nas ordens por distância/custo, por
+#                estrada com cache (utils/rotas.py)
+#   ordenacao    reordena pela distância por estrada quando a página é o
+#                resultado inteiro (sem cursor)
+#
+# As rotas só adaptam a entrada (request.args) e a saída (HTML ou JSON).
+import time
+from datetime import datetime, timezone
+
+from utils.normalizacao import normaliza
+from utils.distancias import distancias_por_comerciante, perfil_da_request, PERFIL_PADRAO
+from utils.busca_produtos import (
+    buscar_produtos,
+    ofertas_agrupadas,
+    ordem_da_busca,
+    codificar_cursor,
+    decodificar_cursor,
+    cursor_aproximado,
+    paginacao_da_request,
+    proximidade_da_request,
+)
+from utils.agrupamento import agrupar_pagina, ofertas_da_request
+from utils.rotas import obter_servico_rotas, distancias_rota_por_comerciante, FONTE_ROTA, FONTE_LINHA_RETA
+from utils.horarios import horario_do_comerciante, FECHA_EM_BREVE_MIN
+
+# só as ordens que dependem da distância pagam a chamada ao roteador
+ORDENS_POR_ROTA = ("distancia", "custo")
+
+
+class Cronometro:
+    """Acumula milissegundos por etapa: with cronometro.etapa("nome"): ..."""
+
+    def __init__(self):
+        self.tempos = {}
+        self._nome = None
+        self._inicio = None
+
+    def etapa(self, nome):
+        self._nome = nome
+        return self
+
+    def __enter__(self):
+        self._inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        decorrido = (time.perf_counter() - self._inicio) * 1000
+        self.tempos[self._nome] = self.tempos.get(self._nome, 0.0) + decorrido
+        return False
+
+    def server_timing(self):
+        """Valor do header Server-Timing (aparece no DevTools do navegador)."""
+        return ", ".join(f"{nome};dur={ms:.1f}" for nome, ms in self.tempos.items())
+
+
+# ---------------- etapa: consulta ----------------
+def _flag(args, nome):
+    return args.get(nome, '').lower() == 'true'
+
+
+def consulta_da_request(args, com_cursor=True):
+    """
+    Filtros da busca a partir da querystring (mesmos nomes nas duas rotas).
+    ValueError se o cursor for inválido.
+    """
+    lat = args.get('lat', type=float)
+    lon = args.get('lon', type=float)
+    offset, limite = paginacao_da_request(args)
+    raio_km, k_comerciantes = proximidade_da_request(args)
+    perfil = perfil_da_request(args)
+
+    consulta = {
+        "busca": normaliza(args.get('busca', '')),
+        "estado": normaliza(args.get('estado', '')),
+        "cidade": normaliza(args.get('cidade', '')),
+        # quem quer receber em casa só vê lojas que entregam
+        "entrega": _flag(args, 'entrega') or perfil.so_entrega,
+        "proximos": _flag(args, 'proximos'),
+        "custo": _flag(args, 'custo'),
+        "novos": _flag(args, 'novos'),
+        "aberta": _flag(args, 'aberta'),
+        "fechando": _flag(args, 'fechando'),
+        "agrupar": _flag(args, 'agrupar'),
+        "ofertas": ofertas_da_request(args),
+        "lat": lat,
+        "lon": lon,
+        "offset": offset,
+        "limite": limite,
+        "raio_km": raio_km,
+        "k_comerciantes": k_comerciantes,
+        "perfil": perfil,
+    }
+    consulta["ordem"] = ordem_da_busca(
+        consulta["novos"], consulta["custo"], consulta["proximos"], lat is not None and lon is not None
+    )
+    consulta["apos"] = decodificar_cursor(args.get('cursor'), consulta["ordem"]) if com_cursor else None
+    consulta["aproximada"] = cursor_aproximado(args.get('cursor')) if com_cursor else False
+    return consulta
+
+
+# ---------------- etapa: distâncias ----------------
+def _comerciantes_da_pagina(produtos):
+    comerciantes = {}
+    for p in produtos:
+        c = p.get("comerciante") or {}
+        comerciantes.setdefault(c.get("id"), c)
+    return comerciantes
+
+
+def calcular_distancias(lat_user, lon_user, produtos, perfil=PERFIL_PADRAO):
+    """
+    Distância e custo_viagem (no perfil de deslocamento) de cada comerciante
+    presente em `produtos`, calculados em lote (utils/distancias.py) sobre
+    as coordenadas já reparadas por reparar_coordenadas.py.
+    """
+    return distancias_por_comerciante(lat_user, lon_user, _comerciantes_da_pagina(produtos), perfil)
+
+
+def calcular_distancias_rota(lat_user, lon_user, produtos, perfil=PERFIL_PADRAO):
+    """
+    Igual a calcular_distancias, mas com a distância por estrada do serviço
+    de rotas (utils/rotas.py), que usa o cache de distancias_rota.
+    """
+    return distancias_rota_por_comerciante(
+        obter_servico_rotas(), lat_user, lon_user, _comerciantes_da_pagina(produtos), perfil
+    )
+
+
+def usa_rota(consulta):
+    """A busca pede distância por estrada? (ordem por distância ou custo, com localização)"""
+    return consulta["ordem"] in ORDENS_POR_ROTA
+
+
+def fonte_distancia_da_busca(consulta, por_rota=True):
+    """
+    Fonte das distâncias que a busca deve usar: FONTE_ROTA, FONTE_LINHA_RETA
+    (ordem sem rota ou roteador pausado) ou None sem localização.
+    """
+    if consulta["lat"] is None or consulta["lon"] is None:
+        return None
+    if por_rota and usa_rota(consulta) and obter_servico_rotas().roteador_disponivel():
+        return FONTE_ROTA
+    return FONTE_LINHA_RETA
+
+
+def fonte_distancia_da_pagina(produtos, esperada):
+    """A esperada, ou FONTE_LINHA_RETA se parte da página caiu na linha reta."""
+    if esperada == FONTE_ROTA and any(p.get("distancia_fonte") == FONTE_LINHA_RETA for p in produtos):
+        return FONTE_LINHA_RETA
+    return esperada
+
+
+def id_comerciante(p):
+    return (p.get("comerciante") or {}).get("id")
+
+
+# ---------------- etapa: candidatos ----------------
+def _sem_resultado_exato(supabase, catalogo, filtros):
+    """A página exata veio vazia porque não há nenhum resultado (e não porque acabou)?"""
+    if filtros["apos"] is None and filtros["offset"] == 0:
+        return True
+    primeiro = dict(filtros, apos=None, offset=0, limite=1)
+    return not buscar_produtos(supabase, catalogo, **primeiro)
+
+
+# ---------------- entrada única ----------------
+def executar_busca(supabase, catalogo, consulta, por_rota=False, agora=None, cronometro=None):
+    """
+    Roda as etapas candidatos -> horarios -> distancias -> ordenacao.
+    Com por_rota, as ordens de ORDENS_POR_ROTA usam a distância por estrada
+    (utils/rotas.py); as outras ficam na linha reta, sem chamar o roteador.
+
+    Retorna um dict com:
+      produtos        página já filtrada e ordenada, cada item com distancia,
+                      distancia_fonte, custo_total e o comerciante embutido
+      situacoes       {comerciante_id: (loja_status, minutos_para_fechar)}
+      proximo_cursor  cursor da página seguinte, ou None (sempre None com
+                      fechando, que ordena só a página pelo horário)
+      aproximada      True se a busca exata não achou nada e valeu a tolerante
+                      a erros de digitação (o cursor guarda isso)
+      grupos          com agrupar: [{"chave", "ofertas", "total_ofertas"}] na
+                      ordem da busca (produtos passa a ser as ofertas); senão None
+      tempos          ms por etapa
+    """
+    agora = agora or datetime.now(timezone.utc)
+    cronometro = cronometro or Cronometro()
+    tem_localizacao = consulta["lat"] is not None and consulta["lon"] is not None
+
+    with cronometro.etapa("candidatos"):
+        permitidos = None
+        if catalogo is not None and (consulta["aberta"] or consulta["fechando"]):
+            with catalogo.lock:
+                permitidos = catalogo.indice_horarios.abertos(
+                    agora, FECHA_EM_BREVE_MIN if consulta["fechando"] else None
+                )
+
+        filtros = dict(
+            busca=consulta["busca"],
+            estado=consulta["estado"],
+            cidade=consulta["cidade"],
+            entrega=consulta["entrega"],
+            ordem=consulta["ordem"],
+            lat=consulta["lat"],
+            lon=consulta["lon"],
+            limite=consulta["limite"],
+            offset=consulta["offset"],
+            raio_km=consulta["raio_km"],
+            k_comerciantes=consulta["k_comerciantes"],
+            apos=consulta["apos"],
+            permitidos=permitidos,
+            perfil=consulta["perfil"],
+        )
+        aproximada = consulta["aproximada"]
+        produtos = buscar_produtos(supabase, catalogo, aproximada=aproximada, **filtros)
+
+        if not produtos and not aproximada and consulta["busca"] and catalogo is not None:
+            # nada com o texto exato: tenta tolerando erros de digitação
+            if _sem_resultado_exato(supabase, catalogo, filtros):
+                aproximada = True
+                produtos = buscar_produtos(supabase, catalogo, aproximada=True, **filtros)
+
+        # página cheia: pode haver mais; o cursor é a chave do último item da busca
+        proximo_cursor = None
+        if len(produtos) >= consulta["limite"]:
+            proximo_cursor = codificar_cursor(consulta["ordem"], produtos[-1]["chave_ordem"], aproximada)
+
+    situacoes = {}
+
+    def situacao(p):
+        # status da loja do produto, uma vez por comerciante
+        cid = id_comerciante(p)
+        if cid not in situacoes:
+            situacoes[cid] = horario_do_comerciante(p.get("comerciante") or {}).situacao(agora)
+        return situacoes[cid]
+
+    def aberta(p):
+        status, minutos = situacao(p)
+        return status == "aberto" and (not consulta["fechando"] or minutos <= FECHA_EM_BREVE_MIN)
+
+    filtra_horario = consulta["aberta"] or consulta["fechando"]
+
+    grupos = None
+    if consulta["agrupar"]:
+        with cronometro.etapa("agrupamento"):
+            if catalogo is not None:
+                grupos = ofertas_agrupadas(
+                    catalogo,
+                    produtos,
+                    consulta["ofertas"],
+                    estado=consulta["estado"],
+                    cidade=consulta["cidade"],
+                    entrega=consulta["entrega"],
+                    permitidos=permitidos,
+                )
+            else:
+                # sem snapshot a RPC não filtra por horário: as ofertas e o
+                # total já saem só com as lojas abertas
+                grupos = agrupar_pagina(produtos, consulta["ofertas"], aberta if filtra_horario else None)
+            # as etapas seguintes anotam as ofertas (mesmos dicts dos grupos)
+            produtos = [oferta for g in grupos for oferta in g["ofertas"]]
+
+    with cronometro.etapa("horarios"):
+        # status de cada loja da página, uma vez por comerciante
+        for p in produtos:
+            situacao(p)
+
+        if filtra_horario:
+            # sem snapshot a RPC não filtra por horário: filtra a página aqui
+            produtos = [p for p in produtos if aberta(p)]
+            if grupos is not None:
+                abertas = {id(p) for p in produtos}
+                for g in grupos:
+                    ofertas = [o for o in g["ofertas"] if id(o) in abertas]
+                    # o total conta só as ofertas que passam em todos os filtros
+                    g["total_ofertas"] -= len(g["ofertas"]) - len(ofertas)
+                    g["ofertas"] = ofertas
+                grupos = [g for g in grupos if g["ofertas"]]
+
+    with cronometro.etapa("distancias"):
+        por_rota = por_rota and usa_rota(consulta)
+        if por_rota:
+            distancias = calcular_distancias_rota(consulta["lat"], consulta["lon"], produtos, consulta["perfil"])
+        else:
+            distancias = calcular_distancias(consulta["lat"], consulta["lon"], produtos, consulta["perfil"])
+
+        for p in produtos:
+            info_com = distancias[id_comerciante(p)]
+            p["preco"] = float(p.get("preco") or 0)
+            p["distancia"] = info_com["distancia"]
+            p["distancia_fonte"] = info_com.get("fonte", "linha_reta" if info_com["distancia"] is not None else None)
+            # custo_total do produto = preco produto + custo_viagem do comerciante (único)
+            p["custo_total"] = p["preco"] + (info_com["custo_viagem"] or 0.0)
+
+    with cronometro.etapa("ordenacao"):
+        # a busca já devolve a página na ordem pedida com distâncias em linha
+        # reta; a distância por estrada só reordena quando a página é o
+        # resultado inteiro. Com mais páginas fica a ordem que o cursor segue
+        # (a linha reta) e a distância por estrada só é mostrada
+        resultado_inteiro = consulta["apos"] is None and consulta["offset"] == 0 and proximo_cursor is None
+        if por_rota and tem_localizacao and resultado_inteiro:
+            if consulta["ordem"] == "custo":
+                produtos.sort(key=lambda x: x["custo_total"])
+            elif consulta["ordem"] == "distancia":
+                produtos.sort(key=lambda x: 9999 if x["distancia"] is None else x["distancia"])
+        if consulta["fechando"]:
+            # quem fecha primeiro aparece primeiro; a chave do cursor não tem o
+            # horário, então essa ordem só vale dentro da página e a busca
+            # termina nela (sem cursor)
+            produtos.sort(key=lambda x: situacoes[id_comerciante(x)][1])
+            proximo_cursor = None
+
+    return {
+        "produtos": produtos,
+        "situacoes": situacoes,
+        "proximo_cursor": proximo_cursor,
+        "aproximada": aproximada,
+        "grupos": grupos,
+        "tempos": cronometro.tempos,
+    }
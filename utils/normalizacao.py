@@ -0,0 +1,35 @@
+# utils/normalizacao.py
+import unicodedata
+
+
+# ---------------- Normalização de strings ----------------
+def normaliza(texto):
+    return unicodedata.normalize('NFKD', texto or '').encode('ASCII', 'ignore').decode('utf-8').lower().strip()
+
+
+# ---------------- Campos *_norm gravados junto com as linhas ----------------
+# Calculados uma vez na escrita (ver sql/campos_normalizados.sql), para que a
+# busca compare strings prontas em vez de normalizar cada linha a cada request.
+CAMPOS_NORM_PRODUTO = ("nome", "marca")
+CAMPOS_NORM_COMERCIANTE = ("cidade", "estado")
+
+
+def campos_normalizados(dados, campos):
+    """Retorna {"<campo>_norm": ...} para os campos presentes em `dados`."""
+    return {f"{campo}_norm": normaliza(dados.get(campo)) for campo in campos if campo in dados}
+
+
+def campos_normalizados_produto(dados):
+    return campos_normalizados(dados, CAMPOS_NORM_PRODUTO)
+
+
+def campos_normalizados_comerciante(dados):
+    return campos_normalizados(dados, CAMPOS_NORM_COMERCIANTE)
+
+
+def campo_normalizado(linha, campo):
+    """Lê <campo>_norm da linha; linhas ainda sem backfill são normalizadas na hora."""
+    valor = linha.get(f"{campo}_norm")
+    if valor is None:
+        return normaliza(linha.get(campo))
+    return valor
@@ -0,0 +1,329 @@
+# utils/rotas.py
+# Distância por estrada entre o consumidor e os comerciantes, calculada no
+# servidor (antes era o navegador chamando o OSRM público em lotes de 20).
+#
+# O backend é plugável: OSRM (qualquer servidor compatível com /table, como
+# um OSRM local) ou linha reta (haversine). Os resultados ficam na tabela
+# distancias_rota (sql/distancias_rota.sql), chaveados pela célula arredondada
+# da origem + comerciante: quem busca do mesmo bairro não gera chamada nova.
+#
+# Cada busca tem um prazo total para o roteador (PRAZO_PADRAO); o que não
+# couber nele sai em linha reta. Depois de FALHAS_PARA_PAUSAR falhas
+# seguidas o roteador fica PAUSA_PADRAO segundos sem ser chamado (só os
+# caches e a linha reta), para um OSRM fora do ar não custar o timeout em
+# toda busca.
+import math
+import threading
+import time
+import traceback
+from datetime import datetime, timezone
+
+import requests
+from flask import current_app
+
+from utils.distancias import distancia_haversine, PERFIL_PADRAO
+from utils.indice_espacial import coordenadas_validas
+
+TAMANHO_CELULA_ORIGEM = 0.01  # graus (~1,1 km)
+OSRM_URL_PADRAO = "https://router.project-osrm.org"
+OSRM_MAX_DESTINOS = 99  # o servidor público aceita até 100 coordenadas por /table
+TIMEOUT_PADRAO = 5  # segundos, por chamada ao /table
+PRAZO_PADRAO = 2  # segundos, total do roteador numa busca
+FALHAS_PARA_PAUSAR = 3
+PAUSA_PADRAO = 60  # segundos sem chamar o roteador depois das falhas
+MAX_CACHE_MEMORIA = 50000
+
+FONTE_ROTA = "rota"
+FONTE_LINHA_RETA = "linha_reta"
+
+
+# ---------------- backends ----------------
+class BackendHaversine:
+    """Linha reta. Também é o fallback quando o roteador falha."""
+
+    fonte = FONTE_LINHA_RETA
+
+    def distancias(self, origem, destinos, prazo=None):
+        lat, lon = origem
+        return [distancia_haversine(lat, lon, d_lat, d_lon) for d_lat, d_lon in destinos]
+
+
+class BackendOSRM:
+    """Serviço /table de um servidor OSRM (ou compatível). Devolve km ou None."""
+
+    fonte = FONTE_ROTA
+
+    def __init__(self, url_base=OSRM_URL_PADRAO, perfil="driving", timeout=TIMEOUT_PADRAO, max_destinos=OSRM_MAX_DESTINOS):
+        self.url_base = url_base.rstrip("/")
+        self.perfil = perfil
+        self.timeout = timeout
+        self.max_destinos = max_destinos
+        self.http = requests.Session()
+
+    def distancias(self, origem, destinos, prazo=None):
+        """
+        `prazo` é o instante (time.monotonic) até quando pode esperar: cada
+        lote usa o que sobrou dele como timeout e os lotes que não couberem
+        voltam como None.
+        """
+        resultado = []
+        for i in range(0, len(destinos), self.max_destinos):
+            lote = destinos[i:i + self.max_destinos]
+            timeout = self.timeout
+            if prazo is not None:
+                timeout = min(timeout, prazo - time.monotonic())
+                if timeout <= 0:
+                    resultado.extend([None] * len(lote))
+                    continue
+            resultado.extend(self._tabela(origem, lote, timeout))
+        return resultado
+
+    def _tabela(self, origem, destinos, timeout):
+        # OSRM usa lon,lat
+        coords = ";".join(f"{lon:.6f},{lat:.6f}" for lat, lon in [origem, *destinos])
+        url = f"{self.url_base}/table/v1/{self.perfil}/{coords}"
+        resp = self.http.get(url, params={"sources": "0", "annotations": "distance"}, timeout=timeout)
+        resp.raise_for_status()
+        data = resp.json()
+        if data.get("code") != "Ok" or not data.get("distances"):
+            raise ValueError(f"OSRM retorno inválido: {data.get('code')}")
+        linha = data["distances"][0][1:]
+        return [None if m is None else m / 1000 for m in linha]
+
+
+def criar_backend(nome, url=None, timeout=TIMEOUT_PADRAO):
+    if nome == "osrm":
+        return BackendOSRM(url or OSRM_URL_PADRAO, timeout=timeout)
+    return BackendHaversine()
+
+
+# ---------------- serviço com cache ----------------
+def celula_origem(lat, lon, tamanho=TAMANHO_CELULA_ORIGEM):
+    """Célula (i, j) da origem e o centro dela, usado como origem da rota."""
+    i = math.floor(lat / tamanho)
+    j = math.floor(lon / tamanho)
+    return (i, j), ((i + 0.5) * tamanho, (j + 0.5) * tamanho)
+
+
+class ServicoRotas:
+    def __init__(
+        self,
+        supabase,
+        backend,
+        tamanho_celula=TAMANHO_CELULA_ORIGEM,
+        prazo=PRAZO_PADRAO,
+        falhas_para_pausar=FALHAS_PARA_PAUSAR,
+        pausa=PAUSA_PADRAO,
+    ):
+        self.supabase = supabase
+        self.backend = backend
+        self.tamanho_celula = tamanho_celula
+        self.prazo = prazo
+        self.falhas_para_pausar = falhas_para_pausar
+        self.pausa = pausa
+        self.lock = threading.Lock()
+        self.memoria = {}  # (i, j, comerciante_id) -> (km, lat_c, lon_c)
+        self.chamadas_backend = 0
+        self.acertos_memoria = 0
+        self.acertos_banco = 0
+        self.falhas_seguidas = 0
+        self.pausado_ate = 0.0  # time.monotonic()
+        self.pausas = 0
+        self.ultimo_erro = None
+
+    # ---------------- pausa depois de falhas ----------------
+    def roteador_disponivel(self):
+        """False enquanto o roteador está pausado (ou o backend é linha reta)."""
+        if self.backend.fonte != FONTE_ROTA:
+            return False
+        with self.lock:
+            return time.monotonic() >= self.pausado_ate
+
+    def _registrar_sucesso(self):
+        with self.lock:
+            self.falhas_seguidas = 0
+
+    def _registrar_falha(self):
+        with self.lock:
+            self.falhas_seguidas += 1
+            if self.falhas_seguidas >= self.falhas_para_pausar:
+                self.falhas_seguidas = 0
+                self.pausado_ate = time.monotonic() + self.pausa
+                self.pausas += 1
+                print(f"❌ ROTEADOR PAUSADO POR {self.pausa}s depois de {self.falhas_para_pausar} falhas seguidas")
+
+    # ---------------- cache em memória ----------------
+    def _da_memoria(self, celula, cid, coords):
+        with self.lock:
+            item = self.memoria.get((celula[0], celula[1], cid))
+        if item is None or (item[1], item[2]) != coords:
+            return None
+        return item[0]
+
+    def _guardar_memoria(self, celula, cid, km, coords):
+        with self.lock:
+            if len(self.memoria) >= MAX_CACHE_MEMORIA:
+                self.memoria.clear()
+            self.memoria[(celula[0], celula[1], cid)] = (km, coords[0], coords[1])
+
+    # ---------------- cache persistente ----------------
+    def _do_banco(self, celula, pendentes):
+        """{cid: km} das linhas de distancias_rota ainda válidas para a célula."""
+        resp = (
+            self.supabase.table("distancias_rota")
+            .select("comerciante_id, distancia_km, comerciante_lat, comerciante_lon")
+            .eq("celula_lat", celula[0])
+            .eq("celula_lon", celula[1])
+            .in_("comerciante_id", list(pendentes))
+            .execute()
+        )
+        encontrados = {}
+        for linha in resp.data or []:
+            cid = str(linha.get("comerciante_id"))
+            coords = pendentes.get(cid)
+            # comerciante mudou de endereço: a linha não vale mais
+            if coords is None or (linha.get("comerciante_lat"), linha.get("comerciante_lon")) != coords:
+                continue
+            encontrados[cid] = linha.get("distancia_km")
+        return encontrados
+
+    def _gravar_banco(self, celula, calculados, pendentes):
+        agora = datetime.now(timezone.utc).isoformat()
+        linhas = [
+            {
+                "celula_lat": celula[0],
+                "celula_lon": celula[1],
+                "comerciante_id": cid,
+                "distancia_km": km,
+                "comerciante_lat": pendentes[cid][0],
+                "comerciante_lon": pendentes[cid][1],
+                "calculado_em": agora,
+            }
+            for cid, km in calculados.items()
+        ]
+        if linhas:
+            self.supabase.table("distancias_rota").upsert(
+                linhas, on_conflict="celula_lat,celula_lon,comerciante_id"
+            ).execute()
+
+    # ---------------- consulta ----------------
+    def distancias(self, lat, lon, comerciantes):
+        """
+        Recebe {comerciante_id: linha} e devolve {comerciante_id: (km, fonte)}.
+        Comerciantes sem coordenada válida ficam com (None, None); os que o
+        roteador não respondeu a tempo (ou com ele pausado), linha reta.
+        """
+        prazo = time.monotonic() + self.prazo
+        celula, origem = celula_origem(lat, lon, self.tamanho_celula)
+        resultado = {}
+        chaves = {}  # str(id) -> id como veio
+        pendentes = {}  # str(id) -> (lat, lon) do comerciante
+
+        for cid, c in comerciantes.items():
+            coords = coordenadas_validas(c or {})
+            if coords is None:
+                resultado[cid] = (None, None)
+                continue
+            km = self._da_memoria(celula, str(cid), coords)
+            if km is not None:
+                self.acertos_memoria += 1
+                resultado[cid] = (km, self.backend.fonte)
+            else:
+                chaves[str(cid)] = cid
+                pendentes[str(cid)] = coords
+
+        if pendentes and self.backend.fonte == FONTE_ROTA:
+            try:
+                for chave, km in self._do_banco(celula, pendentes).items():
+                    self.acertos_banco += 1
+                    self._guardar_memoria(celula, chave, km, pendentes.pop(chave))
+                    resultado[chaves[chave]] = (km, FONTE_ROTA)
+            except Exception as e:
+                self.ultimo_erro = str(e)
+                print("❌ ERRO AO LER distancias_rota:", e)
+
+        if not pendentes:
+            return resultado
+
+        ids = list(pendentes)
+        kms = [None] * len(ids)
+        if self.backend.fonte != FONTE_ROTA or self.roteador_disponivel():
+            try:
+                self.chamadas_backend += 1
+                kms = self.backend.distancias(origem, [pendentes[chave] for chave in ids], prazo=prazo)
+                self._registrar_sucesso()
+            except Exception:
+                self.ultimo_erro = traceback.format_exc(limit=1)
+                print("❌ ERRO NO ROTEADOR, usando linha reta:", self.ultimo_erro)
+                self._registrar_falha()
+
+        calculados = {}
+        for chave, km in zip(ids, kms):
+            if km is not None:
+                calculados[chave] = km
+                self._guardar_memoria(celula, chave, km, pendentes[chave])
+                resultado[chaves[chave]] = (km, self.backend.fonte)
+            else:
+                # sem rota: linha reta a partir da posição real do usuário, sem cache
+                d_lat, d_lon = pendentes[chave]
+                resultado[chaves[chave]] = (distancia_haversine(lat, lon, d_lat, d_lon), FONTE_LINHA_RETA)
+
+        if calculados and self.backend.fonte == FONTE_ROTA:
+            try:
+                self._gravar_banco(celula, calculados, pendentes)
+            except Exception as e:
+                self.ultimo_erro = str(e)
+                print("❌ ERRO AO GRAVAR distancias_rota:", e)
+
+        return resultado
+
+    def status(self):
+        return {
+            "backend": type(self.backend).__name__,
+            "cache_memoria": len(self.memoria),
+            "acertos_memoria": self.acertos_memoria,
+            "acertos_banco": self.acertos_banco,
+            "chamadas_backend": self.chamadas_backend,
+            "pausado_por": max(round(self.pausado_ate - time.monotonic(), 1), 0),
+            "pausas": self.pausas,
+            "ultimo_erro": self.ultimo_erro,
+        }
+
+
+def distancias_rota_por_comerciante(servico, lat_user, lon_user, comerciantes, perfil=PERFIL_PADRAO):
+    """
+    Mesmo formato de distancias_por_comerciante (utils/distancias.py), com
+    a distância por estrada: {id: {"distancia", "custo_viagem", "fonte"}}.
+    """
+    if lat_user is None or lon_user is None:
+        return {cid: {"distancia": None, "custo_viagem": 0.0, "fonte": None} for cid in comerciantes}
+    resultado = {}
+    for cid, (km, fonte) in servico.distancias(lat_user, lon_user, comerciantes).items():
+        resultado[cid] = {"distancia": km, "custo_viagem": perfil.custo(km), "fonte": fonte}
+    return resultado
+
+
+_lock_criacao = threading.Lock()
+
+
+def obter_servico_rotas():
+    """Serviço de rotas do app atual, criado na primeira chamada."""
+    app = current_app._get_current_object()
+    servico = app.extensions.get("rotas")
+    if servico is None:
+        with _lock_criacao:
+            servico = app.extensions.get("rotas")
+            if servico is None:
+                backend = criar_backend(
+                    app.config.get("ROTAS_BACKEND", "osrm"),
+                    url=app.config.get("ROTAS_OSRM_URL"),
+                    timeout=app.config.get("ROTAS_TIMEOUT", TIMEOUT_PADRAO),
+                )
+                servico = ServicoRotas(
+                    app.config["supabase"],
+                    backend,
+                    prazo=app.config.get("ROTAS_PRAZO", PRAZO_PADRAO),
+                    pausa=app.config.get("ROTAS_PAUSA", PAUSA_PADRAO),
+                )
+                app.extensions["rotas"] = servico
+    return servico
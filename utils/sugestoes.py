@@ -0,0 +1,282 @@
+# utils/sugestoes.py
+# Sugestões para a caixa de busca do consumidor (/consumidor/api/sugestoes).
+#
+# Lista ordenada dos nomes normalizados dos produtos do snapshot: um prefixo
+# vira um intervalo achado com bisect, sem varrer o catálogo. Cada nome sabe
+# em quais comerciantes aparece, para restringir ao estado/cidade escolhidos.
+# A popularidade vem de pesquisas.qtd_pesquisas (somada por termo e região)
+# e os termos mais pesquisados também entram como sugestão.
+#
+# O índice acompanha o snapshot (utils/catalogo.py) pelo mesmo protocolo
+# adicionar/remover/limpar dos outros índices derivados.
+import bisect
+import heapq
+import threading
+import time
+import traceback
+
+from utils.normalizacao import normaliza, campo_normalizado
+
+MIN_PREFIXO = 2
+LIMITE_PADRAO = 8
+LIMITE_MAXIMO = 20
+MAX_VARRIDOS = 2000  # nomes examinados por consulta, no pior caso
+MAX_CACHE = 4096  # respostas guardadas (prefixos curtos se repetem entre usuários)
+MAX_PENDENTES_INSORT = 1000  # acima disso (ex.: carga completa) reordena tudo de uma vez
+POPULARIDADE_MAX_IDADE = 600  # segundos
+POPULARIDADE_MAX_LINHAS = 20000
+TAMANHO_PAGINA = 1000
+
+
+class _SugestoesComerciantes:
+    """Lado dos comerciantes, registrado em catalogo.indices_comerciantes."""
+
+    def __init__(self, indice):
+        self.indice = indice
+
+    def adicionar(self, cid, comerciante):
+        self.indice.respostas = {}
+        self.indice.regioes[str(cid)] = (
+            campo_normalizado(comerciante, "estado"),
+            campo_normalizado(comerciante, "cidade"),
+            comerciante.get("status") == "ativo",
+        )
+
+    def remover(self, cid, comerciante=None):
+        self.indice.respostas = {}
+        self.indice.regioes.pop(str(cid), None)
+
+    def limpar(self):
+        self.indice.respostas = {}
+        self.indice.regioes = {}
+
+
+class IndiceSugestoes:
+    def __init__(self):
+        self.comerciantes = _SugestoesComerciantes(self)
+        self.regioes = {}  # comerciante_id -> (estado, cidade, ativo)
+        self.limpar()
+
+        self.popularidade = {}  # termo -> {(estado, cidade): qtd_pesquisas}
+        self.popularidade_total = {}  # termo -> qtd_pesquisas somada
+        self.termos_populares = []  # termos de popularidade, ordenados
+        self.popularidade_em = None
+        self.ultimo_erro = None
+        self._lock_popularidade = threading.Lock()
+
+    def __len__(self):
+        return len(self.por_nome)
+
+    # ---------------- manutenção (produtos) ----------------
+    def limpar(self):
+        self.nomes = []  # nomes normalizados, ordenados (pode ter removidos; ver _ordenar)
+        self.por_nome = {}  # nome -> {comerciante_id: qtd de produtos}
+        self.exibicao = {}  # nome -> nome como cadastrado (para mostrar)
+        self._do_produto = {}  # produto_id -> (nome, comerciante_id)
+        self._novos = []  # nomes ainda fora de self.nomes
+        self._removidos = 0  # nomes em self.nomes que não existem mais
+        self.respostas = {}  # (prefixo, estado, cidade, limite) -> sugestões; limpo a cada alteração
+
+    def adicionar(self, pid, produto):
+        pid = str(pid)
+        self.respostas = {}
+        if pid in self._do_produto:
+            self.remover(pid)
+        nome = campo_normalizado(produto, "nome")
+        if not nome:
+            return
+        cid = str(produto.get("comerciante_id"))
+        contagem = self.por_nome.get(nome)
+        if contagem is None:
+            contagem = self.por_nome[nome] = {}
+            self._novos.append(nome)
+            self.exibicao[nome] = (produto.get("nome") or nome).strip()
+        contagem[cid] = contagem.get(cid, 0) + 1
+        self._do_produto[pid] = (nome, cid)
+
+    def remover(self, pid, produto=None):
+        anterior = self._do_produto.pop(str(pid), None)
+        if anterior is None:
+            return
+        self.respostas = {}
+        nome, cid = anterior
+        contagem = self.por_nome[nome]
+        contagem[cid] -= 1
+        if contagem[cid] <= 0:
+            del contagem[cid]
+        if not contagem:
+            # sai da lista ordenada só no próximo _ordenar
+            del self.por_nome[nome]
+            del self.exibicao[nome]
+            self._removidos += 1
+
+    def _ordenar(self):
+        """Põe os nomes novos na lista ordenada: insort se forem poucos, sort se muitos."""
+        if len(self._novos) > MAX_PENDENTES_INSORT or self._removidos > MAX_PENDENTES_INSORT:
+            self.nomes = sorted(self.por_nome)
+            self._removidos = 0
+        else:
+            for nome in self._novos:
+                i = bisect.bisect_left(self.nomes, nome)
+                if (i == len(self.nomes) or self.nomes[i] != nome) and nome in self.por_nome:
+                    self.nomes.insert(i, nome)
+        self._novos = []
+
+    # ---------------- popularidade (tabela pesquisas) ----------------
+    def garantir_popularidade(self, supabase):
+        """
+        Relê pesquisas numa thread se passou do limite de idade; a consulta
+        que disparou (e as seguintes) usam a popularidade anterior.
+        """
+        if self.popularidade_em is not None and time.time() - self.popularidade_em < POPULARIDADE_MAX_IDADE:
+            return
+        if not self._lock_popularidade.acquire(blocking=False):
+            return  # outra thread já está relendo
+        self.popularidade_em = time.time()
+        threading.Thread(
+            target=self._carregar_popularidade, args=(supabase,), name="sugestoes-popularidade", daemon=True
+        ).start()
+
+    def _carregar_popularidade(self, supabase):
+        """Em erro, mantém a popularidade anterior."""
+        try:
+            popularidade = {}
+            inicio = 0
+            while inicio < POPULARIDADE_MAX_LINHAS:
+                resp = (
+                    supabase.table("pesquisas")
+                    .select("termo, estado, cidade, qtd_pesquisas")
+                    .order("qtd_pesquisas", desc=True)
+                    .range(inicio, inicio + TAMANHO_PAGINA - 1)
+                    .execute()
+                )
+                linhas = resp.data or []
+                for linha in linhas:
+                    termo = normaliza(linha.get("termo"))
+                    if len(termo) < MIN_PREFIXO:
+                        continue
+                    regiao = (normaliza(linha.get("estado")), normaliza(linha.get("cidade")))
+                    por_regiao = popularidade.setdefault(termo, {})
+                    por_regiao[regiao] = por_regiao.get(regiao, 0) + (linha.get("qtd_pesquisas") or 0)
+                if len(linhas) < TAMANHO_PAGINA:
+                    break
+                inicio += TAMANHO_PAGINA
+
+            self.popularidade = popularidade
+            self.popularidade_total = {t: sum(r.values()) for t, r in popularidade.items()}
+            self.termos_populares = sorted(popularidade)
+            self.respostas = {}
+            self.ultimo_erro = None
+        except Exception:
+            self.ultimo_erro = traceback.format_exc(limit=1)
+            print("❌ ERRO AO CARREGAR POPULARIDADE DAS PESQUISAS:", self.ultimo_erro)
+        finally:
+            self._lock_popularidade.release()
+
+    def _pesquisas(self, termo, estado, cidade):
+        if not estado and not cidade:
+            return self.popularidade_total.get(termo, 0)
+        total = 0
+        for (e, c), qtd in self.popularidade.get(termo, {}).items():
+            if (not estado or e == estado) and (not cidade or c == cidade):
+                total += qtd
+        return total
+
+    # ---------------- consulta ----------------
+    def _produtos_na_regiao(self, nome, estado, cidade):
+        total = 0
+        for cid, qtd in self.por_nome[nome].items():
+            regiao = self.regioes.get(cid)
+            if regiao is None or not regiao[2]:
+                continue
+            if (estado and regiao[0] != estado) or (cidade and regiao[1] != cidade):
+                continue
+            total += qtd
+        return total
+
+    def sugerir(self, prefixo, estado="", cidade="", limite=LIMITE_PADRAO):
+        """
+        Até `limite` sugestões que começam com `prefixo`, as mais pesquisadas
+        primeiro (depois as com mais produtos na região). Nomes de produto só
+        entram se houver produto ativo na região; termos pesquisados, se
+        foram pesquisados nela. Chamar com o lock do catálogo.
+        """
+        prefixo = normaliza(prefixo)
+        if len(prefixo) < MIN_PREFIXO:
+            return []
+        chave = (prefixo, estado, cidade, limite)
+        if chave in self.respostas:
+            return self.respostas[chave]
+        fim_prefixo = prefixo + "\uffff"
+        if self._novos or self._removidos > MAX_PENDENTES_INSORT:
+            self._ordenar()
+
+        candidatos = {}  # termo -> [pesquisas, produtos]
+        i = bisect.bisect_left(self.nomes, prefixo)
+        j = min(bisect.bisect_left(self.nomes, fim_prefixo, i), i + MAX_VARRIDOS)
+        for nome in self.nomes[i:j]:
+            if nome not in self.por_nome:
+                continue
+            produtos = self._produtos_na_regiao(nome, estado, cidade)
+            if produtos:
+                candidatos[nome] = [self._pesquisas(nome, estado, cidade), produtos]
+
+        i = bisect.bisect_left(self.termos_populares, prefixo)
+        j = min(bisect.bisect_left(self.termos_populares, fim_prefixo, i), i + MAX_VARRIDOS)
+        for termo in self.termos_populares[i:j]:
+            if termo in candidatos:
+                continue
+            pesquisas = self._pesquisas(termo, estado, cidade)
+            if pesquisas:
+                candidatos[termo] = [pesquisas, 0]
+
+        melhores = heapq.nsmallest(
+            limite, candidatos.items(), key=lambda item: (-item[1][0], -item[1][1], item[0])
+        )
+        if len(self.respostas) >= MAX_CACHE:
+            self.respostas = {}
+        self.respostas[chave] = [
+            {
+                "texto": self.exibicao.get(termo, termo),
+                "termo": termo,
+                "pesquisas": pesquisas,
+                "produtos": produtos,
+            }
+            for termo, (pesquisas, produtos) in melhores
+        ]
+        return self.respostas[chave]
+
+    def status(self):
+        return {
+            "nomes": len(self.por_nome),
+            "termos_populares": len(self.termos_populares),
+            "respostas_em_cache": len(self.respostas),
+            "popularidade_em": self.popularidade_em,
+            "ultimo_erro": self.ultimo_erro,
+        }
+
+
+def sugestoes_do_banco(supabase, prefixo, estado="", cidade="", limite=LIMITE_PADRAO):
+    """
+    Sem snapshot: nomes que começam com o prefixo direto de produtos.nome_norm
+    (sem popularidade nem filtro de região, que exigiriam um join por tecla).
+    """
+    prefixo = normaliza(prefixo)
+    if len(prefixo) < MIN_PREFIXO:
+        return []
+    resp = (
+        supabase.table("produtos")
+        .select("nome, nome_norm")
+        .like("nome_norm", prefixo.replace("%", "").replace("_", "") + "%")
+        .order("nome_norm")
+        .limit(limite * 5)
+        .execute()
+    )
+    vistos = {}
+    for linha in resp.data or []:
+        termo = linha.get("nome_norm")
+        if termo and termo not in vistos:
+            vistos[termo] = {"texto": linha.get("nome") or termo, "termo": termo, "pesquisas": 0, "produtos": 1}
+        elif termo:
+            vistos[termo]["produtos"] += 1
+    return list(vistos.values())[:limite]
@@ -0,0 +1,175 @@
+# utils/telemetria.py
+# Contadores de pesquisas e cliques (tabela pesquisas) acumulados em memória
+# e gravados em lote, fora da request.
+#
+# Cada evento soma +1 no par (termo, produto_id). Repetições da mesma sessão
+# dentro de JANELA_SESSAO segundos contam uma vez só (recarregar a página,
+# voltar do detalhe). A cada INTERVALO_FLUSH segundos uma thread envia tudo
+# numa única chamada à RPC registrar_pesquisas (sql/pesquisas_agregadas.sql),
+# que faz o upsert somando os contadores no próprio banco.
+import atexit
+import threading
+import time
+import traceback
+
+from flask import current_app
+
+INTERVALO_FLUSH = 5  # segundos
+JANELA_SESSAO = 30  # segundos
+MAX_PENDENTES = 20000  # pares (termo, produto_id) guardados se o banco falhar
+
+
+class TelemetriaPesquisas:
+    def __init__(self, supabase, intervalo=INTERVALO_FLUSH, janela_sessao=JANELA_SESSAO):
+        self.supabase = supabase
+        self.intervalo = intervalo
+        self.janela_sessao = janela_sessao
+        self.lock = threading.Lock()
+
+        self.pendentes = {}  # (termo, produto_id) -> linha de pesquisas com os incrementos
+        self._vistos = {}  # (sessao, tipo, termo, produto_id) -> instante do último evento
+        self._thread = None
+        self._parar = threading.Event()
+
+        self.eventos_recebidos = 0
+        self.eventos_repetidos = 0
+        self.flushes = 0
+        self.ultimo_flush = None
+        self.ultimo_erro = None
+
+    # ---------------- registro ----------------
+    def _repetido(self, sessao, tipo, termo, produto_id, agora):
+        if sessao is None:
+            return False
+        chave = (sessao, tipo, termo, produto_id)
+        anterior = self._vistos.get(chave)
+        self._vistos[chave] = agora
+        return anterior is not None and agora - anterior < self.janela_sessao
+
+    def _somar(self, termo, produto, comerciante, tipo, campo, sessao, agora):
+        produto_id = produto.get("id")
+        self.eventos_recebidos += 1
+        if self._repetido(sessao, tipo, termo, produto_id, agora):
+            self.eventos_repetidos += 1
+            return
+
+        linha = self.pendentes.get((termo, produto_id))
+        if linha is None:
+            if len(self.pendentes) >= MAX_PENDENTES:
+                return
+            comerciante = comerciante or {}
+            linha = {
+                "termo": termo,
+                "produto_id": produto_id,
+                "produto_nome": produto.get("nome"),
+                "comerciante_id": produto.get("comerciante_id"),
+                "comerciante_nome": comerciante.get("nome", "Desconhecido"),
+                "cidade": comerciante.get("cidade"),
+                "estado": comerciante.get("estado"),
+                "tipo": tipo,
+                "qtd_pesquisas": 0,
+                "qtd_cliques": 0,
+            }
+            self.pendentes[(termo, produto_id)] = linha
+        linha[campo] += 1
+
+    def registrar_pesquisa(self, termo, produtos, sessao=None):
+        """+1 em qtd_pesquisas de cada produto encontrado para `termo`."""
+        if not termo or not produtos:
+            return
+        agora = time.time()
+        with self.lock:
+            for p in produtos:
+                self._somar(termo, p, p.get("comerciante"), "pesquisa", "qtd_pesquisas", sessao, agora)
+        self._garantir_thread()
+
+    def registrar_clique(self, produto, comerciante=None, sessao=None, termo=None):
+        """+1 em qtd_cliques; sem termo, usa o nome do produto (como antes)."""
+        agora = time.time()
+        with self.lock:
+            self._somar(termo or produto.get("nome"), produto, comerciante, "clique", "qtd_cliques", sessao, agora)
+        self._garantir_thread()
+
+    # ---------------- gravação ----------------
+    def flush(self):
+        with self.lock:
+            eventos = list(self.pendentes.values())
+            self.pendentes = {}
+            limite = time.time() - self.janela_sessao
+            self._vistos = {k: t for k, t in self._vistos.items() if t >= limite}
+        if not eventos:
+            return 0
+
+        try:
+            self.supabase.rpc("registrar_pesquisas", {"p_eventos": eventos}).execute()
+        except Exception:
+            self.ultimo_erro = traceback.format_exc(limit=1)
+            print("❌ ERRO AO GRAVAR TELEMETRIA DE PESQUISAS:", self.ultimo_erro)
+            self._devolver(eventos)
+            return 0
+
+        self.flushes += 1
+        self.ultimo_flush = time.time()
+        return len(eventos)
+
+    def _devolver(self, eventos):
+        """Recoloca na fila o que não foi gravado, somando com o que chegou nesse meio tempo."""
+        with self.lock:
+            for e in eventos:
+                chave = (e["termo"], e["produto_id"])
+                atual = self.pendentes.get(chave)
+                if atual is None:
+                    if len(self.pendentes) < MAX_PENDENTES:
+                        self.pendentes[chave] = e
+                else:
+                    atual["qtd_pesquisas"] += e["qtd_pesquisas"]
+                    atual["qtd_cliques"] += e["qtd_cliques"]
+
+    def _garantir_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self.lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._loop, name="telemetria-pesquisas", daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        while not self._parar.wait(self.intervalo):
+            self.flush()
+
+    def encerrar(self):
+        self._parar.set()
+        self.flush()
+
+    def status(self):
+        with self.lock:
+            return {
+                "pendentes": len(self.pendentes),
+                "eventos_recebidos": self.eventos_recebidos,
+                "eventos_repetidos": self.eventos_repetidos,
+                "flushes": self.flushes,
+                "ultimo_flush": self.ultimo_flush,
+                "ultimo_erro": self.ultimo_erro,
+            }
+
+
+_lock_criacao = threading.Lock()
+
+
+def obter_telemetria():
+    """Agregador do app atual, criado na primeira chamada (um por worker)."""
+    app = current_app._get_current_object()
+    telemetria = app.extensions.get("telemetria")
+    if telemetria is None:
+        with _lock_criacao:
+            telemetria = app.extensions.get("telemetria")
+            if telemetria is None:
+                telemetria = TelemetriaPesquisas(
+                    app.config["supabase"],
+                    intervalo=app.config.get("TELEMETRIA_INTERVALO", INTERVALO_FLUSH),
+                )
+                app.extensions["telemetria"] = telemetria
+                # não perde o que estiver na fila quando o worker terminar
+                atexit.register(telemetria.encerrar)
+    return telemetria